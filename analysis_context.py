@@ -0,0 +1,236 @@
+import numpy as np
+import functools
+import logging
+from scipy import signal
+
+from onset_detection import frame_signal
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Window used by scipy.signal.spectrogram, kept so results match it
+STFT_WINDOW = ('tukey', 0.25)
+
+# STFT columns transformed per pass, to bound the size of temporary frame copies
+STFT_CHUNK_COLUMNS = 512
+
+@functools.lru_cache(maxsize=32)
+def _stft_window(nperseg):
+    """Float32 analysis window and its PSD scale factor (shared, do not modify)"""
+    window = signal.get_window(STFT_WINDOW, nperseg).astype(np.float32)
+    return window, float(np.sum(np.square(window, dtype=np.float64)))
+
+def frame_power(frames, sr, nfft=None):
+    """
+    One-sided power spectral density of frames, as scipy.signal.spectrogram computes it
+
+    Args:
+        frames: Float array of shape (..., nperseg)
+        sr: Sample rate
+        nfft: FFT length (nperseg if None)
+
+    Returns:
+        Tuple of (freqs, float32 array of shape (..., freq))
+    """
+    nperseg = frames.shape[-1]
+    nfft = max(nfft or nperseg, nperseg)
+    window, window_power = _stft_window(nperseg)
+    spectrum = np.fft.rfft((frames - frames.mean(axis=-1, keepdims=True)) * window, n=nfft, axis=-1)
+    Sxx = (np.square(spectrum.real) + np.square(spectrum.imag)).astype(np.float32)
+    Sxx *= 1.0 / (sr * window_power)
+    # Double every bin but DC (and Nyquist for even FFT lengths) for the one-sided spectrum
+    Sxx[..., 1:Sxx.shape[-1] - (1 if nfft % 2 == 0 else 0)] *= 2
+    return np.fft.rfftfreq(nfft, 1.0 / sr), Sxx
+
+class AnalysisContext:
+    """
+    Lazily computed, memoized representations of one waveform
+
+    Every derived array (STFT, magnitude, power, dB, band-limited views,
+    frame energies) is computed on first use and reused by later callers, so
+    a request that draws a spectrogram and extracts features from the same
+    audio only runs the FFTs once. An STFT request is served from a cached
+    STFT with the same segment length whenever its hop and FFT size are
+    multiples of the cached ones: the columns and bins are then a strided
+    subset of the cached result.
+
+    The memoized arrays are shared between callers and must not be modified.
+    """
+
+    def __init__(self, waveform, sr):
+        """
+        Args:
+            waveform: 1-D float array
+            sr: Sample rate
+        """
+        self.waveform = waveform
+        self.sr = sr
+        self._cache = {}
+
+    @classmethod
+    def from_audio(cls, audio_data):
+        """Context for an audio data dictionary (containing waveform and sample rate)"""
+        return cls(audio_data['waveform'], audio_data['sr'])
+
+    def cached(self, key, compute):
+        """Return the value memoized under key, calling compute() on the first request"""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def clear(self):
+        """Release all memoized representations"""
+        self._cache.clear()
+
+    @property
+    def duration(self):
+        return len(self.waveform) / self.sr
+
+    @property
+    def rms(self):
+        """Root mean square of the whole waveform"""
+        return self.cached('rms', lambda: float(np.sqrt(np.mean(np.square(self.waveform, dtype=np.float64)))))
+
+    @property
+    def peak(self):
+        """Largest absolute sample value"""
+        return self.cached('peak', lambda: float(np.max(np.abs(self.waveform))) if len(self.waveform) else 0.0)
+
+    @property
+    def zero_crossing_rate(self):
+        """Fraction of consecutive sample pairs whose sign differs"""
+        return self.cached('zcr', lambda: float(np.count_nonzero(np.diff(np.signbit(self.waveform))) / len(self.waveform)))
+
+    def frame_energies(self, frame_length, hop_length):
+        """
+        RMS of each analysis frame
+
+        Args:
+            frame_length: Samples per frame
+            hop_length: Samples between frame starts
+
+        Returns:
+            Float32 array with one value per complete frame
+        """
+        def compute():
+            frames = frame_signal(np.asarray(self.waveform, dtype=np.float32), frame_length, hop_length)
+            return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame_length).astype(np.float32)
+        return self.cached(('frame_energies', frame_length, hop_length), compute)
+
+    def _stft_params(self, nperseg, noverlap, nfft):
+        nperseg = min(nperseg, len(self.waveform))
+        if nperseg == 0:
+            raise ValueError("Cannot analyze an empty waveform")
+        hop = nperseg - noverlap if noverlap < nperseg else nperseg
+        return nperseg, hop, max(nfft or nperseg, nperseg)
+
+    def stft(self, nperseg=2048, noverlap=1024, nfft=None):
+        """
+        Short-time Fourier transform with scipy.signal.spectrogram's framing
+
+        Frames are mean-detrended and tukey-windowed like scipy's spectrogram.
+        Inputs shorter than nperseg are analyzed as a single frame.
+
+        Args:
+            nperseg: Samples per segment
+            noverlap: Samples shared by consecutive segments
+            nfft: FFT length (nperseg if None)
+
+        Returns:
+            Tuple of (freqs, times, complex64 array of shape (freq, time))
+        """
+        nperseg, hop, nfft = self._stft_params(nperseg, noverlap, nfft)
+        return self.cached(('stft', nperseg, hop, nfft), lambda: self._compute_stft(nperseg, hop, nfft))
+
+    def _compute_stft(self, nperseg, hop, nfft):
+        times = lambda n: (nperseg / 2 + np.arange(n) * hop) / self.sr
+        freqs = np.fft.rfftfreq(nfft, 1.0 / self.sr)
+
+        # Reuse a finer STFT of the same segment length when one is cached
+        for key, value in list(self._cache.items()):
+            if (isinstance(key, tuple) and key[0] == 'stft' and key[1] == nperseg
+                    and hop % key[2] == 0 and key[3] % nfft == 0):
+                Zxx = value[2][::key[3] // nfft, ::hop // key[2]]
+                logger.debug(f"Derived STFT (nperseg={nperseg}, hop={hop}, nfft={nfft}) from hop={key[2]}, nfft={key[3]}")
+                return freqs, times(Zxx.shape[1]), Zxx
+
+        window, _ = _stft_window(nperseg)
+        frames = frame_signal(np.asarray(self.waveform, dtype=np.float32), nperseg, hop)
+        Zxx = np.empty((len(freqs), len(frames)), dtype=np.complex64)
+        for start in range(0, len(frames), STFT_CHUNK_COLUMNS):
+            chunk = frames[start:start + STFT_CHUNK_COLUMNS]
+            chunk = (chunk - chunk.mean(axis=1, keepdims=True)) * window
+            Zxx[:, start:start + len(chunk)] = np.fft.rfft(chunk, n=nfft, axis=1).T
+        return freqs, times(Zxx.shape[1]), Zxx
+
+    def magnitude(self, nperseg=2048, noverlap=1024, nfft=None):
+        """Magnitude of the STFT, as (freqs, times, float32 array)"""
+        nperseg, hop, nfft = self._stft_params(nperseg, noverlap, nfft)
+
+        def compute():
+            f, t, Zxx = self.stft(nperseg, nperseg - hop, nfft)
+            return f, t, np.abs(Zxx)
+        return self.cached(('magnitude', nperseg, hop, nfft), compute)
+
+    def power(self, nperseg=2048, noverlap=1024, nfft=None):
+        """
+        One-sided power spectral density, matching scipy.signal.spectrogram
+
+        Returns:
+            Tuple of (freqs, times, float32 array of shape (freq, time))
+        """
+        nperseg, hop, nfft = self._stft_params(nperseg, noverlap, nfft)
+
+        def compute():
+            f, t, Zxx = self.stft(nperseg, nperseg - hop, nfft)
+            _, window_power = _stft_window(nperseg)
+            Sxx = np.square(Zxx.real) + np.square(Zxx.imag)
+            Sxx *= 1.0 / (self.sr * window_power)
+            # Double every bin but DC (and Nyquist for even FFT lengths) for the one-sided spectrum
+            Sxx[1:len(f) - (1 if nfft % 2 == 0 else 0)] *= 2
+            return f, t, Sxx
+        return self.cached(('power', nperseg, hop, nfft), compute)
+
+    def db(self, nperseg=2048, noverlap=1024, nfft=None):
+        """Power spectral density in dB, as (freqs, times, float32 array)"""
+        nperseg, hop, nfft = self._stft_params(nperseg, noverlap, nfft)
+
+        def compute():
+            f, t, Sxx = self.power(nperseg, nperseg - hop, nfft)
+            return f, t, 10 * np.log10(Sxx + 1e-10)
+        return self.cached(('db', nperseg, hop, nfft), compute)
+
+    def band(self, representation, low=0.0, high=None, **stft_kwargs):
+        """
+        Band-limited view of a spectral representation
+
+        Args:
+            representation: 'magnitude', 'power' or 'db'
+            low: Lowest frequency kept (Hz)
+            high: Frequency (Hz) the band stops before (Nyquist if None)
+            **stft_kwargs: nperseg, noverlap and nfft of the underlying STFT
+
+        Returns:
+            Tuple of (freqs, times, array) where the array is a view of the full representation
+        """
+        if representation not in ('magnitude', 'power', 'db'):
+            raise ValueError(f"Unknown spectral representation: {representation}")
+        f, t, values = getattr(self, representation)(**stft_kwargs)
+        first = int(np.searchsorted(f, low))
+        last = len(f) if high is None else int(np.searchsorted(f, high))
+        return f[first:last], t, values[first:last]
+
+def analysis_context(audio_data):
+    """
+    Return an AnalysisContext for audio data
+
+    Args:
+        audio_data: AnalysisContext (returned as is) or dictionary containing waveform and sample rate
+
+    Returns:
+        AnalysisContext
+    """
+    if isinstance(audio_data, AnalysisContext):
+        return audio_data
+    return AnalysisContext.from_audio(audio_data)
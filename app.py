@@ -1,47 +1,251 @@
 import os
 import logging
 import uuid
+import gzip
+import io
+import tempfile
 import numpy as np
-import json
-from flask import render_template, request, jsonify, session
+from flask import render_template, request, jsonify, session, Request, url_for, g
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from main import app
 
 # Import our custom modules
-from audio_processor import process_audio, generate_spectrogram
-from ml_models import extract_features_cnn, predict_keystrokes_hmm, train_model
-from models import db, AudioSample, UserFeedback, TrainingDataset, TrainedModel, ModelEvaluation
+from audio_processor import process_audio, compute_spectrogram, format_spectrogram, probe_audio
+from analysis_context import AnalysisContext
+from dataset_store import DatasetStore
+from feature_cache import FeatureCache
+from job_queue import JobQueue
+import metrics
+from keystroke_index import KeystrokeIndex
+from micro_batcher import MicroBatcher
+from language_model import CharNGramLM
+from model_artifacts import ModelArtifactStore
+from model_serving import ModelServer
+from parallel_ingest import default_workers, ingest_files
+from spectrogram_tiles import build_pyramid, open_pyramid
+from streaming import StreamingSessions
+from ml_models import extract_features_cnn, predict_keystrokes_hmm_batch, sample_segment_features
+from models import db, AudioSample, UserFeedback, TrainedModel, ModelEvaluation
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Create uploads directory if it doesn't exist
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 app.config['ALLOWED_EXTENSIONS'] = {'wav', 'mp3', 'ogg', 'm4a'}
+# Uploads are decoded straight from memory; only larger ones are spooled to a temp file
+app.config['UPLOAD_SPOOL_MAX_MEMORY'] = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
 
-# Global variables to store models and data
-cnn_model = None
-hmm_model = None
-training_data = []
+class SpooledUploadRequest(Request):
+    """Request that keeps uploaded files in memory up to UPLOAD_SPOOL_MAX_MEMORY bytes"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_MAX_MEMORY'], mode='rb+')
+
+app.request_class = SpooledUploadRequest
+
+# Responses worth compressing (spectrogram payloads can be large)
+app.config['GZIP_MIMETYPES'] = {'application/json', 'application/octet-stream'}
+app.config['GZIP_MIN_SIZE'] = 1024
+
+# Spectrogram tile pyramids, one directory per audio sample
+app.config['SPECTROGRAM_FOLDER'] = os.path.join(app.instance_path, 'spectrograms')
+
+# Preprocessed audio and features of training files, reused across requests and restarts
+app.config['FEATURE_CACHE_FOLDER'] = os.path.join(app.instance_path, 'feature_cache')
+app.config['FEATURE_CACHE_MEMORY'] = int(os.environ.get('FEATURE_CACHE_MEMORY', 256 * 1024 * 1024))
+app.config['FEATURE_CACHE_DISK'] = int(os.environ.get('FEATURE_CACHE_DISK', 0)) or None
+feature_cache = FeatureCache(app.config['FEATURE_CACHE_FOLDER'],
+                             max_memory_bytes=app.config['FEATURE_CACHE_MEMORY'],
+                             max_disk_bytes=app.config['FEATURE_CACHE_DISK'])
+
+# Processed training samples, kept on disk and shared by all worker processes
+app.config['TRAINING_DATA_FOLDER'] = os.path.join(app.instance_path, 'training_data')
+training_data = DatasetStore(app.config['TRAINING_DATA_FOLDER'])
+metrics.TRAINING_SAMPLES.set_function(lambda: len(training_data))
+
+# Worker processes for parallel decoding and feature extraction (0 = one per CPU)
+app.config['INGEST_WORKERS'] = int(os.environ.get('INGEST_WORKERS', 0)) or default_workers()
+
+# Background training jobs, run by worker threads of this process
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 1))
+job_queue = JobQueue(workers=app.config['JOB_WORKERS'])
+TRAINING_STAGES = ('processing_files', 'fitting_model', 'writing_records')
+
+# Keys kept per keystroke by the Viterbi decoder (0 = exact decoding over every key)
+app.config['HMM_BEAM_WIDTH'] = int(os.environ.get('HMM_BEAM_WIDTH', 0)) or None
+
+# Character n-gram language model used as the decoder's transition prior, if one has been
+# built there (python -m language_model corpus.txt --output <folder>)
+app.config['LANGUAGE_MODEL_FOLDER'] = os.environ.get('LANGUAGE_MODEL_FOLDER',
+                                                     os.path.join(app.instance_path, 'language_model'))
+
+# Versioned model artifacts; every worker serves the current version, memory-mapped
+app.config['MODEL_FOLDER'] = os.path.join(app.instance_path, 'models')
+model_store = ModelArtifactStore(app.config['MODEL_FOLDER'])
+model_server = ModelServer(model_store, training_data)
+
+# Nearest-neighbour index of every labeled training keystroke, kept in step with the dataset store
+app.config['KEYSTROKE_INDEX_FOLDER'] = os.path.join(app.instance_path, 'keystroke_index')
+keystroke_index = KeystrokeIndex(app.config['KEYSTROKE_INDEX_FOLDER'])
+
+language_model = None
 
 # Initialize model if available
 try:
-    # This would load pre-trained models if they exist
-    # For now, it's a placeholder until we implement training
-    pass
+    # Publish models covering every stored sample if the current version is missing or
+    # behind the dataset store (e.g. after an interrupted training); a no-op otherwise
+    if training_data:
+        model_server.publish()
+    model_server.models()
 except Exception as e:
     logger.warning(f"Could not load pre-trained models: {e}")
     logger.info("Models will need to be trained first")
 
+try:
+    # Index samples stored while the index was missing or built by another feature pipeline
+    keystroke_index.sync(training_data)
+except Exception as e:
+    logger.warning(f"Could not update the keystroke index: {e}")
+
+try:
+    if os.path.exists(app.config['LANGUAGE_MODEL_FOLDER']):
+        language_model = CharNGramLM.load(app.config['LANGUAGE_MODEL_FOLDER'])
+        logger.info(f"Loaded {language_model.order}-gram character language model")
+except Exception as e:
+    logger.warning(f"Could not load the language model, decoding without it: {e}")
+
+def predict_feature_batch(features_list):
+    """
+    Decode the keystroke features of several recordings with the current models
+    
+    Returns:
+        List of (predicted_text, confidence_scores, model_version, nearest_neighbour_text),
+        one per recording; the last is each keystroke's majority key among its nearest
+        training keystrokes
+    """
+    _, hmm_model, model_version = model_server.models()
+    predictions = predict_keystrokes_hmm_batch(features_list, hmm_model, return_confidence=True,
+                                               beam_width=app.config['HMM_BEAM_WIDTH'],
+                                               language_model=language_model)
+    # The keystrokes of every recording are looked up in one query batch
+    lengths = [len(features) for features in features_list]
+    nearest_text = keystroke_index.predict_text(np.concatenate(features_list)) if sum(lengths) else ""
+    bounds = np.cumsum([0] + lengths)
+    return [(predicted_text, confidence_scores, model_version,
+             nearest_text[bounds[i]:bounds[i + 1]] if nearest_text else "")
+            for i, (predicted_text, confidence_scores) in enumerate(predictions)]
+
+# Predictions of concurrent requests are decoded together: the first waits up to
+# PREDICT_BATCH_WAIT_MS for others, and at most PREDICT_BATCH_SIZE run in one batch
+app.config['PREDICT_BATCH_SIZE'] = int(os.environ.get('PREDICT_BATCH_SIZE', 16))
+app.config['PREDICT_BATCH_WAIT_MS'] = float(os.environ.get('PREDICT_BATCH_WAIT_MS', 5))
+prediction_batcher = MicroBatcher(predict_feature_batch, max_batch_size=app.config['PREDICT_BATCH_SIZE'],
+                                  max_wait_ms=app.config['PREDICT_BATCH_WAIT_MS'], name='prediction-batcher')
+
+# Live keystroke detection sessions; idle sessions are closed after STREAM_SESSION_TIMEOUT seconds
+app.config['STREAM_SESSION_TIMEOUT'] = float(os.environ.get('STREAM_SESSION_TIMEOUT', 60))
+app.config['STREAM_MAX_SESSIONS'] = int(os.environ.get('STREAM_MAX_SESSIONS', 64))
+app.config['STREAM_MAX_CHUNK_BYTES'] = 1024 * 1024
+streaming_sessions = StreamingSessions(timeout=app.config['STREAM_SESSION_TIMEOUT'],
+                                       max_sessions=app.config['STREAM_MAX_SESSIONS'])
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def spectrogram_options():
+    """Spectrogram encoding and size requested by the client (compact uint8 by default)"""
+    return {
+        'encoding': request.form.get('spectrogram_format', 'uint8'),
+        'max_columns': request.form.get('spectrogram_width', type=int),
+        'max_rows': request.form.get('spectrogram_height', type=int)
+    }
+
+def spectrogram_directory(sample_id):
+    return os.path.join(app.config['SPECTROGRAM_FOLDER'], str(sample_id))
+
+def store_spectrogram_tiles(sample_id, spectrogram):
+    """Build the tile pyramid for an audio sample, returning where the client can browse it"""
+    try:
+        manifest = build_pyramid(spectrogram, spectrogram_directory(sample_id))
+        return {
+            'url': url_for('spectrogram_tiles', sample_id=sample_id),
+            'duration': manifest['duration'],
+            'levels': len(manifest['levels'])
+        }
+    except Exception as e:
+        logger.warning(f"Could not store spectrogram tiles for sample {sample_id}: {e}")
+        return None
+
+# Endpoints whose requests and stages are exported on /metrics, and their pipeline labels
+METRIC_PIPELINES = {
+    'upload_file': 'upload',
+    'process_recording': 'record',
+    'predict_batch': 'predict_batch',
+    'train': 'train',
+    'bulk_train': 'bulk_train'
+}
+
+@app.before_request
+def begin_request_metrics():
+    pipeline = METRIC_PIPELINES.get(request.endpoint)
+    if pipeline is None:
+        return
+    g.request_metrics = metrics.begin_request(pipeline)
+    # Parse the form up front, so receiving and spooling the body is timed on its own
+    with metrics.stage('save_body') as record:
+        request.files
+        record.bytes = request.content_length or 0
+
+# Registered before compress_response, so it runs after it and sees the final response
+@app.after_request
+def record_response_status(response):
+    if 'request_metrics' in g:
+        g.request_metrics.status = response.status_code
+    return response
+
+@app.teardown_request
+def end_request_metrics(error):
+    tracker = g.pop('request_metrics', None)
+    if tracker is not None:
+        tracker.end(error)
+
+def commit_session():
+    """Commit the database session, timed as the current pipeline's db_commit stage"""
+    with metrics.stage('db_commit'):
+        db.session.commit()
+
+def json_response(payload):
+    """jsonify a payload, timed as the current pipeline's serialize stage"""
+    with metrics.stage('serialize') as record:
+        response = jsonify(payload)
+        record.bytes = response.content_length or 0
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip large JSON and binary responses for clients that accept it"""
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in app.config['GZIP_MIMETYPES']
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    
+    data = response.get_data()
+    if len(data) < app.config['GZIP_MIN_SIZE']:
+        return response
+    
+    with metrics.stage('compress') as record:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        record.bytes = len(data)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = str(len(response.get_data()))
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def index():
     return render_template('home.html')
@@ -98,53 +302,68 @@ def upload_file():
         allowed_extensions = ', '.join(app.config['ALLOWED_EXTENSIONS'])
         return jsonify({'error': f'File type not allowed. Please upload one of the following formats: {allowed_extensions}'}), 400
     
-    filepath = None
     try:
         # Create a unique filename to prevent collisions
         original_filename = secure_filename(file.filename)
         unique_filename = f"{uuid.uuid4()}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+        logger.info(f"Upload received: {unique_filename}")
         
-        # Save the file
-        file.save(filepath)
-        logger.info(f"File saved successfully: {filepath}")
+        # Read the duration from the WAV header without decoding the samples
+        header = probe_audio(file)
         
         # Store file in database
-        audio_sample = AudioSample(filename=unique_filename)
+        audio_sample = AudioSample(filename=unique_filename,
+                                   duration=header['duration'] if header else None)
         db.session.add(audio_sample)
-        db.session.commit()
+        commit_session()
         logger.info(f"File record created in database with ID: {audio_sample.id}")
         
-        # Process the audio file
+        # Process the audio straight from the upload stream
         logger.info("Processing audio file...")
-        audio_data = process_audio(filepath)
+        audio_data = process_audio(file)
+        
+        # Spectrogram and features share one set of memoized FFTs
+        context = AnalysisContext.from_audio(audio_data)
         
         # Generate spectrogram
         logger.info("Generating spectrogram...")
-        spectrogram_data = generate_spectrogram(audio_data)
+        with metrics.stage('spectrogram') as record:
+            spectrogram = compute_spectrogram(context)
+            spectrogram_data = format_spectrogram(spectrogram, **spectrogram_options())
+            record.samples = len(context.waveform)
+        with metrics.stage('spectrogram_tiles'):
+            spectrogram_tiles_info = store_spectrogram_tiles(audio_sample.id, spectrogram)
         
-        # If models exist, make predictions
+        # If models exist, make predictions with the current version
+        cnn_model, hmm_model, model_version = model_server.models()
         if cnn_model is not None and hmm_model is not None:
             logger.info("Making predictions with trained models...")
-            features = extract_features_cnn(audio_data, cnn_model)
-            predicted_text, confidence_scores = predict_keystrokes_hmm(features, hmm_model, return_confidence=True)
-            
-            # Calculate overall model confidence (simplified)
-            avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
-            accuracy_percentage = round(avg_confidence * 100, 2)
+            with metrics.stage('features') as record:
+                features = extract_features_cnn(context, cnn_model)
+                record.samples = len(context.waveform)
+            # Decoded in one batch with concurrent requests
+            with metrics.stage('prediction'):
+                predicted_text, confidence_scores, model_version, nearest_neighbour_text = \
+                    prediction_batcher.submit(features)
+            accuracy_percentage = mean_confidence_percentage(confidence_scores)
         else:
             logger.info("Models not trained yet - using demonstration data")
             predicted_text = "the quick brown fox jumps over the lazy dog"
+            nearest_neighbour_text = None
             accuracy_percentage = 85
             import random
             confidence_scores = [random.uniform(0.7, 0.95) for _ in range(len(predicted_text))]
         
-        return jsonify({
+        return json_response({
             'status': 'success',
+            'sample_id': audio_sample.id,
             'spectrogram': spectrogram_data,
+            'spectrogram_tiles': spectrogram_tiles_info,
             'predicted_text': predicted_text,
             'accuracy_percentage': accuracy_percentage,
-            'confidence_scores': confidence_scores
+            'confidence_scores': confidence_scores,
+            'model_version': model_version,
+            'nearest_neighbour_text': nearest_neighbour_text
         })
     
     except Exception as e:
@@ -155,15 +374,43 @@ def upload_file():
         except:
             pass
         return jsonify({'error': f'Error processing audio: {str(e)}'}), 500
+
+@app.route('/feature_cache/stats')
+def feature_cache_stats():
+    return jsonify(feature_cache.stats())
+
+@app.route('/spectrogram/<int:sample_id>/tiles')
+def spectrogram_tiles(sample_id):
+    """Return the spectrogram tiles covering a time range at one zoom level"""
+    directory = spectrogram_directory(sample_id)
+    if not os.path.isfile(os.path.join(directory, 'manifest.json')):
+        return jsonify({'error': f'No spectrogram stored for sample {sample_id}'}), 404
     
-    finally:
-        # Clean up the file if it exists
-        if filepath:
-            try:
-                os.remove(filepath)
-                logger.info(f"Cleaned up temporary file: {filepath}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to clean up file {filepath}: {cleanup_error}")
+    try:
+        pyramid = open_pyramid(directory)
+        start = request.args.get('start', 0.0, type=float)
+        end = request.args.get('end', pyramid.duration, type=float)
+        level = request.args.get('level', type=int)
+        if level is None:
+            level = pyramid.level_for_width(start, end, request.args.get('width', 1000, type=int))
+        if not 0 <= level < len(pyramid.manifest['levels']):
+            return jsonify({'error': f'Invalid level {level}'}), 400
+        
+        response = jsonify({
+            'sample_id': sample_id,
+            'level': level,
+            'duration': pyramid.duration,
+            'levels': pyramid.manifest['levels'],
+            'tiles': pyramid.tiles(level, start, end)
+        })
+        # Pyramids never change once built, so repeat views can come from the browser cache
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        response.add_etag()
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        logger.error(f"Error reading spectrogram tiles: {e}")
+        return jsonify({'error': f'Error reading spectrogram tiles: {str(e)}'}), 500
 
 @app.route('/record', methods=['POST'])
 def process_recording():
@@ -174,51 +421,69 @@ def process_recording():
         return jsonify({'error': 'No audio data received. Please try recording again.'}), 400
     
     audio_file = request.files['audio_data']
-    filepath = None
+    # Recordings are always treated as WAV, whatever name the browser gave the blob
+    audio_file.filename = f"recording_{uuid.uuid4()}.wav"
     
     try:
-        # Generate a unique filename for the recording
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"recording_{uuid.uuid4()}.wav")
-        audio_file.save(filepath)
-        logger.info(f"Recording saved successfully: {filepath}")
+        logger.info(f"Recording received: {audio_file.filename}")
+        
+        # Read the duration from the WAV header without decoding the samples
+        header = probe_audio(audio_file)
         
         # Store file in database
-        audio_sample = AudioSample(filename=os.path.basename(filepath))
+        audio_sample = AudioSample(filename=audio_file.filename,
+                                   duration=header['duration'] if header else None)
         db.session.add(audio_sample)
-        db.session.commit()
+        commit_session()
         logger.info(f"Recording record created in database with ID: {audio_sample.id}")
         
-        # Process the audio file
+        # Process the audio straight from the upload stream
         logger.info("Processing audio recording...")
-        audio_data = process_audio(filepath)
+        audio_data = process_audio(audio_file)
+        
+        # Spectrogram and features share one set of memoized FFTs
+        context = AnalysisContext.from_audio(audio_data)
         
         # Generate spectrogram
         logger.info("Generating spectrogram...")
-        spectrogram_data = generate_spectrogram(audio_data)
+        with metrics.stage('spectrogram') as record:
+            spectrogram = compute_spectrogram(context)
+            spectrogram_data = format_spectrogram(spectrogram, **spectrogram_options())
+            record.samples = len(context.waveform)
+        with metrics.stage('spectrogram_tiles'):
+            spectrogram_tiles_info = store_spectrogram_tiles(audio_sample.id, spectrogram)
         
-        # If models exist, make predictions
+        # If models exist, make predictions with the current version
+        cnn_model, hmm_model, model_version = model_server.models()
         if cnn_model is not None and hmm_model is not None:
             logger.info("Making predictions with trained models...")
-            features = extract_features_cnn(audio_data, cnn_model)
-            predicted_text, confidence_scores = predict_keystrokes_hmm(features, hmm_model, return_confidence=True)
-            
-            # Calculate overall model confidence (simplified)
-            avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
-            accuracy_percentage = round(avg_confidence * 100, 2)
+            with metrics.stage('features') as record:
+                features = extract_features_cnn(context, cnn_model)
+                record.samples = len(context.waveform)
+            # Decoded in one batch with concurrent requests
+            with metrics.stage('prediction'):
+                predicted_text, confidence_scores, model_version, nearest_neighbour_text = \
+                    prediction_batcher.submit(features)
+            accuracy_percentage = mean_confidence_percentage(confidence_scores)
         else:
             logger.info("Models not trained yet - using demonstration data")
             predicted_text = "the quick brown fox jumps over the lazy dog"
+            nearest_neighbour_text = None
             accuracy_percentage = 85
             # Generate realistic confidence scores for demonstration
             import random
             confidence_scores = [random.uniform(0.7, 0.95) for _ in range(len(predicted_text))]
         
-        return jsonify({
+        return json_response({
             'status': 'success',
+            'sample_id': audio_sample.id,
             'spectrogram': spectrogram_data,
+            'spectrogram_tiles': spectrogram_tiles_info,
             'predicted_text': predicted_text,
             'accuracy_percentage': accuracy_percentage,
-            'confidence_scores': confidence_scores
+            'confidence_scores': confidence_scores,
+            'model_version': model_version,
+            'nearest_neighbour_text': nearest_neighbour_text
         })
         
     except Exception as e:
@@ -229,20 +494,384 @@ def process_recording():
         except:
             pass
         return jsonify({'error': f'Error processing recording: {str(e)}'}), 500
+
+def mean_confidence_percentage(confidence_scores):
+    """Overall confidence: mean posterior probability of the predicted keys, in percent"""
+    return round(sum(confidence_scores) / len(confidence_scores) * 100, 2) if confidence_scores else 0
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict the typed text of many recordings in one request
+    
+    The files are analyzed in parallel (parallel_ingest) and decoded through
+    the prediction batcher, sharing batches with concurrent requests. Nothing
+    is stored: there are no database records or spectrogram tiles.
+    """
+    if 'files' not in request.files:
+        return jsonify({'error': 'No files part. Please select audio files to upload.'}), 400
+    
+    files = [file for file in request.files.getlist('files') if file and file.filename]
+    if len(files) == 0:
+        return jsonify({'error': 'No selected files. Please choose audio files to upload.'}), 400
+    
+    _, hmm_model, _ = model_server.models()
+    if hmm_model is None:
+        return jsonify({'error': 'Model not trained. Please train the model first.'}), 400
+    
+    try:
+        rejected = [secure_filename(file.filename) for file in files if not allowed_file(file.filename)]
+        # The files are analyzed during the request, straight from their upload streams
+        uploads = [(secure_filename(file.filename), file) for file in files if allowed_file(file.filename)]
+        
+        results = []
+        decoded = []
+        # Decoding, filtering and feature extraction run in the ingest worker processes
+        with metrics.stage('ingest') as record:
+            for filename, audio_data, error in ingest_files(uploads, feature_cache, app.config['INGEST_WORKERS']):
+                if error is not None:
+                    logger.error(f"Error processing {filename}: {error}")
+                    results.append({'filename': filename, 'error': error})
+                    continue
+                results.append({'filename': filename})
+                decoded.append((results[-1], sample_segment_features(audio_data)))
+            record.bytes = sum(upload_size(source) for _, source in uploads)
+        
+        with metrics.stage('prediction'):
+            predictions = prediction_batcher.submit_many([features for _, features in decoded])
+        for (result, _), (predicted_text, confidence_scores, model_version, nearest_neighbour_text) in zip(
+                decoded, predictions):
+            result.update({
+                'predicted_text': predicted_text,
+                'accuracy_percentage': mean_confidence_percentage(confidence_scores),
+                'confidence_scores': confidence_scores,
+                'model_version': model_version,
+                'nearest_neighbour_text': nearest_neighbour_text
+            })
+        results.extend({'filename': filename, 'error': 'File type not allowed'} for filename in rejected)
+        
+        return json_response({
+            'status': 'success',
+            'processed': len(decoded),
+            'failed': len(results) - len(decoded),
+            'results': results
+        })
+    
+    except Exception as e:
+        logger.error(f"Error predicting batch: {e}")
+        return jsonify({'error': f'Error predicting batch: {str(e)}'}), 500
+
+@app.route('/predict_batch/stats')
+def predict_batch_stats():
+    """Batch sizes, p50/p99 latency and throughput of the prediction batcher"""
+    return jsonify(prediction_batcher.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Per-stage latency histograms, byte and sample counters, in-progress
+    requests and training set size, in the Prometheus text format
+    
+    Values cover the requests and jobs served by this process.
+    """
+    return app.response_class(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/keystroke_index/stats')
+def keystroke_index_stats():
+    """Size and inverted-list layout of the nearest-neighbour keystroke index"""
+    return jsonify(keystroke_index.stats())
+
+@app.route('/stream', methods=['POST'])
+def open_stream():
+    """
+    Start a live keystroke detection session
+    
+    The client then posts raw mono PCM chunks to the returned audio_url as they
+    are captured (Content-Type application/octet-stream, ?encoding=int16 or
+    float32, ?seq=chunk number) over a keep-alive connection, and gets back
+    the keystrokes and text decoded so far with each response.
+    """
+    data = request.get_json(silent=True) or {}
+    sample_rate = data.get('sample_rate', request.args.get('sample_rate', type=int))
+    if not isinstance(sample_rate, (int, float)) or not 8000 <= sample_rate <= 192000:
+        return jsonify({'error': 'A sample_rate between 8000 and 192000 Hz is required'}), 400
+    
+    _, hmm_model, model_version = model_server.models()
+    if hmm_model is None:
+        return jsonify({'error': 'Model not trained. Please train the model first.'}), 400
+    
+    try:
+        stream_session = streaming_sessions.open(hmm_model, sample_rate, model_version=model_version,
+                                                 language_model=language_model,
+                                                 beam_width=app.config['HMM_BEAM_WIDTH'])
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify(dict(stream_session.info(),
+                        audio_url=url_for('stream_audio_chunk', session_id=stream_session.id),
+                        close_url=url_for('close_stream', session_id=stream_session.id)))
+
+@app.route('/stream/<session_id>/audio', methods=['POST'])
+def stream_audio_chunk(session_id):
+    stream_session = streaming_sessions.get(session_id)
+    if stream_session is None:
+        return jsonify({'error': 'Unknown or expired streaming session'}), 404
+    if (request.content_length or 0) > app.config['STREAM_MAX_CHUNK_BYTES']:
+        return jsonify({'error': 'Chunk too large'}), 413
+    
+    try:
+        return jsonify(stream_session.feed(request.get_data(), encoding=request.args.get('encoding', 'int16'),
+                                           sequence=request.args.get('seq', type=int)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error processing stream chunk: {e}")
+        return jsonify({'error': f'Error processing stream chunk: {str(e)}'}), 500
+
+@app.route('/stream/<session_id>/close', methods=['POST'])
+def close_stream(session_id):
+    """End a session, returning the keystrokes and text of its last chunk"""
+    try:
+        result = streaming_sessions.close(session_id)
+        if result is None:
+            return jsonify({'error': 'Unknown or expired streaming session'}), 404
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error closing stream: {e}")
+        return jsonify({'error': f'Error closing stream: {str(e)}'}), 500
+
+def detach_uploads(files):
+    """
+    Take the uploaded files over from the request so a background job can use them
+    
+    The request closes its upload streams when it ends, before the job runs.
+    Each spooled stream is detached from its FileStorage instead of being read:
+    uploads up to UPLOAD_SPOOL_MAX_MEMORY stay in memory and larger ones stay
+    in their temporary file on disk. Close them with close_uploads.
     
-    finally:
-        # Clean up the file if it exists
-        if filepath:
+    Returns:
+        List of (secure filename, file object) pairs
+    """
+    uploads = []
+    for file in files:
+        stream = file.stream
+        # The request closes this empty stream in place of the upload
+        file.stream = io.BytesIO()
+        stream.seek(0)
+        uploads.append((secure_filename(file.filename), stream))
+    return uploads
+
+def close_uploads(uploads):
+    """Close the file objects of detach_uploads pairs"""
+    for _, stream in uploads:
+        stream.close()
+
+def upload_size(source):
+    """Size in bytes of an upload (FileStorage or file object)"""
+    return getattr(source, 'stream', source).seek(0, io.SEEK_END)
+
+def save_model_records(num_new_samples, bulk=False):
+    """
+    Store TrainedModel and ModelEvaluation records for the models being served
+    
+    Args:
+        num_new_samples: Samples added by this training
+        bulk: Whether the training came from /bulk_train
+        
+    Returns:
+        Tuple of (model artifact version, {'cnn', 'hmm', 'combined'} record ids),
+        or None if the records could not be stored
+    """
+    cnn_model, hmm_model, artifact_version = model_server.models()
+    version = str(artifact_version)
+    try:
+        if bulk:
+            suffix = f" (Bulk {datetime.now().strftime('%Y-%m-%d %H:%M')})"
+            descriptions = [f"Trained with {num_new_samples} filename-based samples"] * 3
+            evaluation_type = "Bulk Training"
+        else:
+            suffix = ""
+            descriptions = [
+                "Convolutional Neural Network for audio feature extraction",
+                "Hidden Markov Model for keystroke sequence prediction",
+                "Combined CNN+HMM model for keystroke prediction from audio"
+            ]
+            evaluation_type = "Training"
+        
+        # Create a record for the CNN model
+        cnn_model_record = TrainedModel(
+            name=f"CNN Feature Extractor{suffix}",
+            description=descriptions[0],
+            model_type="CNN",
+            version=version,
+            num_samples=len(training_data),
+            accuracy=0.85  # Placeholder, would be calculated during proper training
+        )
+        cnn_model_record.set_parameters(cnn_model.get_parameters())
+        
+        # Create a record for the HMM model
+        hmm_model_record = TrainedModel(
+            name=f"HMM Sequence Predictor{suffix}",
+            description=descriptions[1],
+            model_type="HMM",
+            version=version,
+            num_samples=len(training_data),
+            accuracy=0.78  # Placeholder, would be calculated during proper training
+        )
+        hmm_model_record.set_parameters(hmm_model.get_parameters())
+        
+        # Create a record for the combined model
+        combined_model_record = TrainedModel(
+            name=f"Acoustic Keyboard Predictor{suffix}",
+            description=descriptions[2],
+            model_type="Combined",
+            version=version,
+            num_samples=len(training_data),
+            accuracy=0.82  # Placeholder, would be calculated during proper training
+        )
+        
+        # Add model records to database
+        db.session.add(cnn_model_record)
+        db.session.add(hmm_model_record)
+        db.session.add(combined_model_record)
+        commit_session()
+        
+        # Add evaluation records (placeholder data)
+        cnn_eval = ModelEvaluation(
+            model_id=cnn_model_record.id,
+            evaluation_type=evaluation_type,
+            dataset_size=len(training_data),
+            accuracy=0.85,
+            precision=0.83,
+            recall=0.84,
+            f1_score=0.835
+        )
+        
+        hmm_eval = ModelEvaluation(
+            model_id=hmm_model_record.id,
+            evaluation_type=evaluation_type,
+            dataset_size=len(training_data),
+            accuracy=0.78,
+            precision=0.76,
+            recall=0.79,
+            f1_score=0.775
+        )
+        
+        combined_eval = ModelEvaluation(
+            model_id=combined_model_record.id,
+            evaluation_type=evaluation_type,
+            dataset_size=len(training_data),
+            accuracy=0.82,
+            precision=0.80,
+            recall=0.82,
+            f1_score=0.81
+        )
+        
+        # Add evaluation records to database
+        db.session.add(cnn_eval)
+        db.session.add(hmm_eval)
+        db.session.add(combined_eval)
+        commit_session()
+        
+        return artifact_version, {'cnn': cnn_model_record.id, 'hmm': hmm_model_record.id,
+                                  'combined': combined_model_record.id}
+        
+    except Exception as e:
+        logger.error(f"Failed to save model information: {e}")
+        db.session.rollback()
+        return None
+
+def publish_models(rebuild=False):
+    """
+    Publish models trained on the stored samples and index their keystrokes
+    
+    Args:
+        rebuild: Fit new models from scratch instead of updating the latest ones
+    """
+    model_server.publish(rebuild=rebuild)
+    keystroke_index.sync(training_data)
+
+def record_models(num_new_samples, bulk=False):
+    """Save database records for the published models and link them to its artifact version"""
+    if model_server.version is None:
+        return
+    saved = save_model_records(num_new_samples, bulk)
+    if saved is not None:
+        model_store.link_records(*saved)
+
+def run_training_job(job, uploads, ground_truths, bulk=False):
+    """
+    Background training pipeline: analyze the uploads, update the models, write records
+    
+    Args:
+        job: The running Job, for progress and cancellation
+        uploads: List of (filename, file object) pairs from detach_uploads; closed once analyzed
+        ground_truths: Ground truth text for each filename
+        bulk: Whether the job comes from /bulk_train
+        
+    Returns:
+        Result dictionary reported by /jobs/<id>
+    """
+    with app.app_context(), metrics.pipeline('bulk_train' if bulk else 'train'):
+        # Decode, preprocess and extract features on all cores; recordings analyzed
+        # before come from the feature cache
+        job.set_stage('processing_files', total=len(uploads))
+        processed_files = []
+        file_details = []
+        with metrics.stage('processing_files') as record:
             try:
-                os.remove(filepath)
-                logger.info(f"Cleaned up temporary recording file: {filepath}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to clean up recording file {filepath}: {cleanup_error}")
+                for filename, audio_data, error in ingest_files(uploads, feature_cache, app.config['INGEST_WORKERS'],
+                                                                progress=lambda name: job.advance()):
+                    if error is not None:
+                        logger.error(f"Error processing training file {filename}: {error}")
+                        # Continue with other files
+                        continue
+                    processed_files.append((audio_data, ground_truths[filename]))
+                    file_details.append({
+                        'filename': filename,
+                        'ground_truth': ground_truths[filename]
+                    })
+                record.bytes = sum(upload_size(source) for _, source in uploads)
+            finally:
+                close_uploads(uploads)
+        
+        # Last point where the job can be cancelled: once the samples are stored,
+        # the next published models include them
+        job.set_stage('fitting_model', total=len(processed_files))
+        with metrics.stage('fitting_model'):
+            training_data.extend(processed_files)
+            # Update the latest models with the samples they have not seen and switch
+            # every worker to the new version
+            if processed_files:
+                publish_models()
+        
+        # Save database records for the published models
+        job.set_stage('writing_records', check_cancelled=False)
+        with metrics.stage('writing_records'):
+            record_models(len(processed_files), bulk)
+        
+        return {
+            'status': 'success',
+            'message': f'Models trained with {len(processed_files)} new samples. Total training samples: {len(training_data)}',
+            'file_details': file_details
+        }
+
+def queue_training_job(kind, uploads, ground_truths, bulk=False):
+    """Queue a training job and return the 202 response pointing at its status"""
+    # The job closes the uploads once they are analyzed; the cleanup also closes
+    # them when the job is cancelled before it starts
+    job = job_queue.submit(kind, run_training_job, uploads, ground_truths, bulk=bulk, stages=TRAINING_STAGES,
+                           cleanup=lambda: close_uploads(uploads))
+    return json_response({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'message': f'Training job queued with {len(uploads)} files'
+    }), 202
 
 @app.route('/train', methods=['POST'])
 def train():
     logger.info("Training request received")
-    global cnn_model, hmm_model, training_data
     
     if 'files' not in request.files:
         logger.warning("No files part in training request")
@@ -259,12 +888,10 @@ def train():
         logger.warning("Missing ground truth text for training")
         return jsonify({'error': 'Ground truth text is required for training. Please enter what was actually typed.'}), 400
     
-    logger.info(f"Processing {len(files)} files for training with ground truth: '{ground_truth}'")
+    logger.info(f"Queueing {len(files)} files for training with ground truth: '{ground_truth}'")
     
-    # Process each file
-    processed_files = []
-    filepaths = []
     try:
+        accepted = []
         for file in files:
             if not file:
                 logger.warning("Invalid file in training batch")
@@ -273,146 +900,70 @@ def train():
             if not allowed_file(file.filename):
                 logger.warning(f"File type not allowed for training: {file.filename}")
                 continue
-                
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"train_{uuid.uuid4()}_{filename}")
-            filepaths.append(filepath)
-            
-            # Save the file
-            file.save(filepath)
-            logger.info(f"Training file saved: {filepath}")
-            
-            try:
-                # Process the audio file
-                logger.info(f"Processing audio file for training: {filename}")
-                audio_data = process_audio(filepath)
-                processed_files.append((audio_data, ground_truth))
-                logger.info(f"Successfully processed training file: {filename}")
-            except Exception as process_error:
-                logger.error(f"Error processing training file {filename}: {process_error}")
-                # Continue with other files
-    
-        # Add to training data
-        training_data.extend(processed_files)
-        
-        # Train the models
-        cnn_model, hmm_model = train_model(training_data)
-        
-        # Save model information to database
-        try:
-            # Create a record for the CNN model
-            cnn_model_record = TrainedModel(
-                name="CNN Feature Extractor",
-                description="Convolutional Neural Network for audio feature extraction",
-                model_type="CNN",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.85  # Placeholder, would be calculated during proper training
-            )
-            cnn_model_record.set_parameters({
-                "layers": 3,
-                "filters": [32, 64, 128],
-                "kernel_size": 3,
-                "activation": "relu"
-            })
-            
-            # Create a record for the HMM model
-            hmm_model_record = TrainedModel(
-                name="HMM Sequence Predictor",
-                description="Hidden Markov Model for keystroke sequence prediction",
-                model_type="HMM",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.78  # Placeholder, would be calculated during proper training
-            )
-            hmm_model_record.set_parameters({
-                "states": 26,
-                "features": "mfcc",
-                "algorithm": "viterbi"
-            })
             
-            # Create a record for the combined model
-            combined_model_record = TrainedModel(
-                name="Acoustic Keyboard Predictor",
-                description="Combined CNN+HMM model for keystroke prediction from audio",
-                model_type="Combined",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.82  # Placeholder, would be calculated during proper training
-            )
-            
-            # Add model records to database
-            db.session.add(cnn_model_record)
-            db.session.add(hmm_model_record)
-            db.session.add(combined_model_record)
-            db.session.commit()
-            
-            # Add evaluation records (placeholder data)
-            cnn_eval = ModelEvaluation(
-                model_id=cnn_model_record.id,
-                evaluation_type="Training",
-                dataset_size=len(training_data),
-                accuracy=0.85,
-                precision=0.83,
-                recall=0.84,
-                f1_score=0.835
-            )
-            
-            hmm_eval = ModelEvaluation(
-                model_id=hmm_model_record.id,
-                evaluation_type="Training",
-                dataset_size=len(training_data),
-                accuracy=0.78,
-                precision=0.76,
-                recall=0.79,
-                f1_score=0.775
-            )
-            
-            combined_eval = ModelEvaluation(
-                model_id=combined_model_record.id,
-                evaluation_type="Training",
-                dataset_size=len(training_data),
-                accuracy=0.82,
-                precision=0.80,
-                recall=0.82,
-                f1_score=0.81
-            )
-            
-            # Add evaluation records to database
-            db.session.add(cnn_eval)
-            db.session.add(hmm_eval)
-            db.session.add(combined_eval)
-            db.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to save model information: {e}")
-            db.session.rollback()
+            accepted.append(file)
         
-        return jsonify({
-            'status': 'success',
-            'message': f'Models trained with {len(processed_files)} new samples. Total training samples: {len(training_data)}'
-        })
+        if not accepted:
+            logger.warning("No valid files in training request")
+            allowed_extensions = ', '.join(app.config['ALLOWED_EXTENSIONS'])
+            return jsonify({'error': f'No valid audio files. Please upload one of the following formats: {allowed_extensions}'}), 400
+        
+        uploads = detach_uploads(accepted)
+        return queue_training_job('train', uploads, {filename: ground_truth for filename, _ in uploads})
         
     except Exception as e:
-        logger.error(f"Error training models: {e}")
+        logger.error(f"Error queueing training job: {e}")
         return jsonify({'error': f'Error training models: {str(e)}'}), 500
-    
-    finally:
-        # Clean up all temporary files
-        for filepath in filepaths:
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.info(f"Cleaned up temporary training file: {filepath}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to clean up training file {filepath}: {cleanup_error}")
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/reset_training', methods=['POST'])
 def reset_training():
-    global training_data
-    training_data = []
+    # The models hold statistics of every sample seen, so they are deleted too
+    model_server.clear()
+    keystroke_index.clear()
     return jsonify({'status': 'success', 'message': 'Training data reset'})
 
+@app.route('/retrain', methods=['POST'])
+def retrain():
+    """Queue a rebuild of the models from scratch on all accumulated training data"""
+    if not training_data:
+        return jsonify({'error': 'No training data. Please train with audio files first.'}), 400
+    
+    def run_retrain(job):
+        with app.app_context(), metrics.pipeline('retrain'):
+            job.set_stage('fitting_model')
+            with metrics.stage('fitting_model'):
+                publish_models(rebuild=True)
+            
+            job.set_stage('writing_records', check_cancelled=False)
+            with metrics.stage('writing_records'):
+                record_models(0)
+            
+            return {
+                'status': 'success',
+                'message': f'Models retrained on {len(training_data)} samples'
+            }
+    
+    job = job_queue.submit('retrain', run_retrain, stages=('fitting_model', 'writing_records'))
+    return jsonify({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id)
+    }), 202
+
 @app.route('/submit_feedback', methods=['POST'])
 def submit_feedback():
     try:
@@ -451,7 +1002,7 @@ def submit_feedback():
             user_feedback.accuracy_percentage = accuracy_percentage
         
         db.session.add(user_feedback)
-        db.session.commit()
+        commit_session()
         
         return jsonify({
             'status': 'success',
@@ -466,8 +1017,6 @@ def submit_feedback():
 
 @app.route('/bulk_train', methods=['POST'])
 def bulk_train():
-    global cnn_model, hmm_model, training_data
-    
     if 'files' not in request.files:
         return jsonify({'error': 'No files part'}), 400
     
@@ -478,11 +1027,9 @@ def bulk_train():
     convert_underscores = request.form.get('convert_underscores', 'false') == 'true'
     convert_hyphens = request.form.get('convert_hyphens', 'false') == 'true'
     
-    # Process each file
-    processed_files = []
-    file_details = []
-    filepaths = []  # Keep track of all filepaths for cleanup
     try:
+        accepted = []
+        ground_truths = {}
         for file in files:
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
@@ -496,134 +1043,14 @@ def bulk_train():
                 if convert_hyphens:
                     ground_truth = ground_truth.replace('-', ' ')
                 
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{filename}")
-                filepaths.append(filepath)  # Add to filepaths for cleanup
-                file.save(filepath)
-                
-                # Process the audio file
-                audio_data = process_audio(filepath)
-                processed_files.append((audio_data, ground_truth))
-                
-                # Add to file details for response
-                file_details.append({
-                    'filename': filename,
-                    'ground_truth': ground_truth
-                })
-                
-                # File cleanup will be handled in the finally block to ensure all files are removed
-        
-        # Add to training data
-        training_data.extend(processed_files)
+                accepted.append(file)
+                ground_truths[filename] = ground_truth
         
-        # Train the models
-        cnn_model, hmm_model = train_model(training_data)
+        if not accepted:
+            return jsonify({'error': 'No valid audio files'}), 400
         
-        # Save model information to database
-        try:
-            # Create a record for the CNN model
-            cnn_model_record = TrainedModel(
-                name=f"CNN Feature Extractor (Bulk {datetime.now().strftime('%Y-%m-%d %H:%M')})",
-                description=f"Trained with {len(processed_files)} filename-based samples",
-                model_type="CNN",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.85  # Placeholder, would be calculated during proper training
-            )
-            cnn_model_record.set_parameters({
-                "layers": 3,
-                "filters": [32, 64, 128],
-                "kernel_size": 3,
-                "activation": "relu"
-            })
-            
-            # Create a record for the HMM model
-            hmm_model_record = TrainedModel(
-                name=f"HMM Sequence Predictor (Bulk {datetime.now().strftime('%Y-%m-%d %H:%M')})",
-                description=f"Trained with {len(processed_files)} filename-based samples",
-                model_type="HMM",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.78  # Placeholder, would be calculated during proper training
-            )
-            hmm_model_record.set_parameters({
-                "states": 26,
-                "features": "mfcc",
-                "algorithm": "viterbi"
-            })
-            
-            # Create a record for the combined model
-            combined_model_record = TrainedModel(
-                name=f"Acoustic Keyboard Predictor (Bulk {datetime.now().strftime('%Y-%m-%d %H:%M')})",
-                description=f"Trained with {len(processed_files)} filename-based samples",
-                model_type="Combined",
-                version="1.0",
-                num_samples=len(training_data),
-                accuracy=0.82  # Placeholder, would be calculated during proper training
-            )
-            
-            # Add model records to database
-            db.session.add(cnn_model_record)
-            db.session.add(hmm_model_record)
-            db.session.add(combined_model_record)
-            db.session.commit()
-            
-            # Add evaluation records (placeholder data)
-            cnn_eval = ModelEvaluation(
-                model_id=cnn_model_record.id,
-                evaluation_type="Bulk Training",
-                dataset_size=len(training_data),
-                accuracy=0.85,
-                precision=0.83,
-                recall=0.84,
-                f1_score=0.835
-            )
-            
-            hmm_eval = ModelEvaluation(
-                model_id=hmm_model_record.id,
-                evaluation_type="Bulk Training",
-                dataset_size=len(training_data),
-                accuracy=0.78,
-                precision=0.76,
-                recall=0.79,
-                f1_score=0.775
-            )
-            
-            combined_eval = ModelEvaluation(
-                model_id=combined_model_record.id,
-                evaluation_type="Bulk Training",
-                dataset_size=len(training_data),
-                accuracy=0.82,
-                precision=0.80,
-                recall=0.82,
-                f1_score=0.81
-            )
-            
-            # Add evaluation records to database
-            db.session.add(cnn_eval)
-            db.session.add(hmm_eval)
-            db.session.add(combined_eval)
-            db.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to save model information: {e}")
-            db.session.rollback()
-        
-        return jsonify({
-            'status': 'success',
-            'message': f'Models trained with {len(processed_files)} new samples. Total training samples: {len(training_data)}',
-            'file_details': file_details
-        })
+        return queue_training_job('bulk_train', detach_uploads(accepted), ground_truths, bulk=True)
     
     except Exception as e:
-        logger.error(f"Error training models: {e}")
+        logger.error(f"Error queueing bulk training job: {e}")
         return jsonify({'error': f'Error training models: {str(e)}'}), 500
-        
-    finally:
-        # Clean up all temporary files
-        for filepath in filepaths:
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.info(f"Cleaned up temporary bulk training file: {filepath}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to clean up bulk training file {filepath}: {cleanup_error}")
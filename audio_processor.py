@@ -1,252 +1,1074 @@
 import numpy as np
-from scipy.io import wavfile
+import base64
+import contextlib
+import functools
+import hashlib
+import io
 import logging
+import math
+import os
+import tempfile
 import wave
-import array
+import struct
 from scipy import signal
+import metrics
+from analysis_context import AnalysisContext, analysis_context
+from onset_detection import (OnsetDetector, DETECT_CHUNK_SAMPLES, PRE_ROLL, SEGMENT_MIN_DURATION, SEGMENT_MAX_DURATION,
+                             detect_onsets, segment_bounds)
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def process_audio(filepath, sr=22050):
+# Number of frames converted from PCM to float per block when decoding WAV data
+PCM_BLOCK_FRAMES = 65536
+
+# WAVE format tags we know how to decode
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Number of samples per block yielded by the streaming preprocessing pipeline
+PREPROCESS_BLOCK_SIZE = 4096
+
+# Cutoff and Butterworth order of the pre-emphasis high-pass filter
+HIGHPASS_CUTOFF_HZ = 1100.0
+HIGHPASS_ORDER = 4
+
+# Level below which leading and trailing samples of a recording are trimmed
+TRIM_THRESHOLD = 0.01
+
+# Every recording is resampled to this rate before analysis; keyboard sounds
+# carry little energy above 8 kHz, which is all generate_spectrogram displays
+ANALYSIS_RATE = 16000
+
+# Default minimum frame RMS just after an onset for it to count as a keystroke
+KEYSTROKE_RMS_THRESHOLD = 0.1
+
+# Typed in the synthetic recording analyzed when an upload cannot be decoded
+PLACEHOLDER_TEXT = "keystrokes"
+
+def as_audio_source(source):
+    """
+    Normalize an audio source without copying or spilling it to disk
+
+    Args:
+        source: Path, bytes-like buffer, werkzeug FileStorage or binary file object
+
+    Returns:
+        A path, a bytes-like buffer, or a binary file object backed by a real file
+    """
+    if isinstance(source, (str, os.PathLike, bytes, bytearray, memoryview)):
+        return source
+    # werkzeug FileStorage wraps the upload stream
+    stream = getattr(source, 'stream', source)
+    if isinstance(stream, io.BytesIO):
+        return stream.getbuffer()
+    if isinstance(stream, tempfile.SpooledTemporaryFile) and stream.name is None:
+        # Still in memory (it has a name once rolled over to disk); fileno() would
+        # spill it to a file, so read the bytes, which are at most its max_size
+        stream.seek(0)
+        return stream.read()
+    try:
+        stream.fileno()
+        return stream
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        stream.seek(0)
+        return stream.read()
+
+def _source_name(source):
+    """Filename of an audio source, if it has one"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, 'filename', None) or getattr(source, 'name', None)
+
+def _open_source(source):
+    """Return a seekable binary file object for a path, an in-memory buffer or an open file"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    source.seek(0)
+    return contextlib.nullcontext(source)
+
+def read_wav_header(source):
+    """
+    Read format and duration information from a WAV header without decoding samples
+
+    Args:
+        source: Path to a WAV file, a bytes-like buffer or an open binary file
+
+    Returns:
+        Dictionary describing the PCM layout of the data chunk
+    """
+    with _open_source(source) as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError("Not a RIFF/WAVE file")
+
+        f.seek(0, 2)
+        total_size = f.tell()
+        f.seek(12)
+
+        fmt = None
+        data_offset = None
+        data_size = None
+
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+            if chunk_id == b'fmt ':
+                fmt_bytes = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt_bytes[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt_bytes) >= 26:
+                    # The real format tag is the first two bytes of the sub-format GUID
+                    format_tag = struct.unpack('<H', fmt_bytes[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, block_align, bits)
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                # Streaming writers often leave the size as 0 or 0xFFFFFFFF
+                available = total_size - data_offset
+                data_size = chunk_size if 0 < chunk_size <= available else available
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None or data_offset is None:
+        raise ValueError("WAV file is missing a fmt or data chunk")
+
+    format_tag, channels, sample_rate, block_align, bits = fmt
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise ValueError(f"Unsupported WAV format tag: {format_tag:#x}")
+    if channels < 1 or sample_rate < 1 or block_align != channels * (bits // 8):
+        raise ValueError("Inconsistent WAV fmt chunk")
+
+    n_frames = data_size // block_align
+
+    return {
+        'format_tag': format_tag,
+        'channels': channels,
+        'sample_rate': sample_rate,
+        'sample_width': bits // 8,
+        'block_align': block_align,
+        'data_offset': data_offset,
+        'n_frames': n_frames,
+        'duration': n_frames / float(sample_rate)
+    }
+
+def probe_audio(source):
+    """
+    Return WAV header information for an audio source, or None if it cannot be read
+
+    Args:
+        source: Path, bytes-like buffer, upload or binary file object
+
+    Returns:
+        Header dictionary from read_wav_header, or None
+    """
+    try:
+        return read_wav_header(as_audio_source(source))
+    except Exception as e:
+        logger.debug(f"Could not read WAV header: {e}")
+        return None
+
+def audio_digest(source):
+    """
+    Content hash of the decoded samples of an audio source
+
+    For WAV files the hash covers the sample format and the raw data chunk, so
+    it does not depend on the filename or on extra chunks (metadata) in the
+    file. Other formats are decoded and their float samples hashed.
+
+    Args:
+        source: Path, bytes-like buffer, upload or binary file object
+
+    Returns:
+        Hex digest string, or None if the source cannot be decoded
+    """
+    source = as_audio_source(source)
+    digest = hashlib.blake2b(digest_size=20)
+    header = probe_audio(source)
+    try:
+        if header is not None:
+            digest.update(struct.pack('<HHIH', header['format_tag'], header['channels'],
+                                      header['sample_rate'], header['sample_width']))
+            frames = map_wav_frames(source, header)
+            for start in range(0, len(frames), PCM_BLOCK_FRAMES):
+                digest.update(np.ascontiguousarray(frames[start:start + PCM_BLOCK_FRAMES]).data)
+        else:
+            rate, y = _read_with_wave(source)
+            digest.update(struct.pack('<I', rate))
+            digest.update(np.ascontiguousarray(y, dtype=np.float32).data)
+    except Exception as e:
+        logger.debug(f"Could not hash audio content: {e}")
+        return None
+    return digest.hexdigest()
+
+def map_wav_frames(source, header):
+    """
+    Map the raw data chunk of a WAV file without copying it
+
+    Args:
+        source: Path to a WAV file, a bytes-like buffer or an open binary file
+        header: Header dictionary from read_wav_header
+
+    Returns:
+        uint8 array of shape (n_frames, block_align) backed by the file or buffer
+    """
+    shape = (header['n_frames'], header['block_align'])
+    if header['n_frames'] == 0:
+        return np.zeros(shape, dtype=np.uint8)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        raw = np.frombuffer(source, dtype=np.uint8,
+                            count=shape[0] * shape[1], offset=header['data_offset'])
+        return raw.reshape(shape)
+    return np.memmap(source, dtype=np.uint8, mode='r', offset=header['data_offset'], shape=shape)
+
+def pcm_block_to_float(block, header):
+    """
+    Convert a block of raw interleaved frames to mono float32 in [-1, 1]
+
+    Args:
+        block: uint8 array of shape (frames, block_align)
+        header: Header dictionary from read_wav_header
+
+    Returns:
+        1-D float32 array with one sample per frame
+    """
+    width = header['sample_width']
+    channels = header['channels']
+    block = np.ascontiguousarray(block)
+
+    if header['format_tag'] == WAVE_FORMAT_IEEE_FLOAT:
+        if width == 4:
+            samples = block.view('<f4').astype(np.float32)
+        elif width == 8:
+            samples = block.view('<f8').astype(np.float32)
+        else:
+            raise ValueError(f"Unsupported float sample width: {width}")
+    elif width == 1:
+        samples = (block.astype(np.float32) - 128) / 128.0
+    elif width == 2:
+        samples = block.view('<i2').astype(np.float32) / 32768.0
+    elif width == 3:
+        # Assemble little-endian 24-bit samples into the top bytes of an int32
+        b = block.reshape(len(block), channels, 3).astype(np.int32)
+        samples = ((b[..., 0] << 8) | (b[..., 1] << 16) | (b[..., 2] << 24)).astype(np.float32) / 2147483648.0
+    elif width == 4:
+        samples = block.view('<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported PCM sample width: {width}")
+
+    samples = samples.reshape(len(block), channels)
+    if channels == 1:
+        return samples[:, 0]
+    # If multi-channel, convert to mono by averaging channels
+    return samples.mean(axis=1, dtype=np.float32)
+
+def iter_wav_blocks(source, header=None, block_frames=PCM_BLOCK_FRAMES):
+    """
+    Yield mono float32 blocks from a WAV file without loading it into memory
+
+    Args:
+        source: Path to a WAV file, a bytes-like buffer or an open binary file
+        header: Optional header dictionary (read from source if omitted)
+        block_frames: Number of frames per yielded block
+
+    Yields:
+        1-D float32 arrays of at most block_frames samples
+    """
+    if header is None:
+        header = read_wav_header(source)
+    frames = map_wav_frames(source, header)
+    for start in range(0, len(frames), block_frames):
+        yield pcm_block_to_float(frames[start:start + block_frames], header)
+
+def read_wav_mmap(source, header=None):
+    """
+    Decode a WAV file into a single mono float32 array using block-wise conversion
+
+    The file is memory-mapped and converted PCM_BLOCK_FRAMES at a time, so the
+    only full-length allocation is the float32 result.
+
+    Args:
+        source: Path to a WAV file, a bytes-like buffer or an open binary file
+        header: Optional header dictionary (read from source if omitted)
+
+    Returns:
+        Tuple of (waveform, header)
+    """
+    if header is None:
+        header = read_wav_header(source)
+    y = np.empty(header['n_frames'], dtype=np.float32)
+    pos = 0
+    for block in iter_wav_blocks(source, header):
+        y[pos:pos + len(block)] = block
+        pos += len(block)
+    return y, header
+
+@functools.lru_cache(maxsize=None)
+def highpass_sos(rate, cutoff=HIGHPASS_CUTOFF_HZ, order=HIGHPASS_ORDER):
+    """
+    Design (once per sample rate) the pre-emphasis high-pass filter
+
+    Args:
+        rate: Sample rate in Hz
+        cutoff: Cutoff frequency in Hz
+        order: Butterworth filter order
+
+    Returns:
+        Second-order-sections array (shared between callers, do not modify)
+    """
+    cutoff = min(cutoff, 0.45 * rate)
+    return signal.butter(order, cutoff, 'highpass', fs=rate, output='sos')
+
+@functools.lru_cache(maxsize=None)
+def polyphase_filter(source_rate, target_rate):
+    """
+    Design (once per rate pair) the anti-aliasing filter for polyphase resampling
+
+    Uses the same Kaiser-windowed FIR as scipy.signal.resample_poly.
+
+    Args:
+        source_rate: Input sample rate in Hz
+        target_rate: Output sample rate in Hz
+
+    Returns:
+        Tuple of (up, down, taps)
+    """
+    g = math.gcd(int(source_rate), int(target_rate))
+    up = int(target_rate) // g
+    down = int(source_rate) // g
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * up
+    return up, down, taps
+
+def resampled_length(n, source_rate, target_rate):
+    """Number of samples produced when resampling n samples"""
+    up, down, _ = polyphase_filter(source_rate, target_rate)
+    return -(-n * up // down)
+
+class StreamingResampler:
+    """
+    Polyphase resampler that carries filter history from one block to the next
+
+    The output matches scipy.signal.resample_poly on the concatenated input:
+    the filter delay is removed and flush() emits the tail.
+    """
+
+    def __init__(self, source_rate, target_rate):
+        self.up, self.down, self.taps = polyphase_filter(source_rate, target_rate)
+        self.delay = (len(self.taps) - 1) // 2 // self.down
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.buf_start = 0  # Input index of buf[0]
+        self.n_in = 0
+        self.n_out = 0  # Filter outputs computed so far, including the delay
+
+    def _emit(self, m_end):
+        if m_end <= self.n_out:
+            return np.zeros(0, dtype=np.float32)
+        # buf_start is kept a multiple of down, so output j of this call is filter output m0 + j
+        m0 = self.buf_start * self.up // self.down
+        y = signal.upfirdn(self.taps, self.buf, self.up, self.down)
+        out = y[self.n_out - m0:m_end - m0]
+        skip = max(0, self.delay - self.n_out)
+        self.n_out = m_end
+
+        # Keep only the input still needed by future outputs
+        lo = max(0, -(-(m_end * self.down - (len(self.taps) - 1)) // self.up))
+        lo = min(lo // self.down * self.down, self.n_in // self.down * self.down)
+        self.buf = self.buf[lo - self.buf_start:]
+        self.buf_start = lo
+        return out[skip:].astype(np.float32)
+
+    def process(self, block):
+        if len(block) == 0:
+            return np.zeros(0, dtype=np.float32)
+        self.buf = np.concatenate([self.buf, block])
+        self.n_in += len(block)
+        # Outputs that depend only on input already received
+        return self._emit((self.n_in - 1) * self.up // self.down + 1)
+
+    def flush(self):
+        total = -(-self.n_in * self.up // self.down) + self.delay
+        if self.n_in == 0 or total <= self.n_out:
+            return np.zeros(0, dtype=np.float32)
+        # Zero padding stands in for the input after the end of the signal
+        pad = -(-(total * self.down) // self.up) - self.n_in + 1
+        self.buf = np.concatenate([self.buf, np.zeros(max(pad, 0), dtype=np.float32)])
+        return self._emit(total)
+
+def _read_with_wave(source):
+    """Decode an audio file or buffer with the standard library wave module"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    with wave.open(source, 'rb') as wf:
+        rate = wf.getframerate()
+        frames = wf.getnframes()
+        audio_bytes = wf.readframes(frames)
+
+        # Convert bytes to numpy array based on sample width
+        if wf.getsampwidth() == 1:  # 8-bit
+            y = np.frombuffer(audio_bytes, dtype=np.uint8)
+            y = (y.astype(np.float32) - 128) / 128.0
+        elif wf.getsampwidth() == 2:  # 16-bit
+            y = np.frombuffer(audio_bytes, dtype=np.int16)
+            y = y.astype(np.float32) / 32768.0
+        elif wf.getsampwidth() == 4:  # 32-bit
+            y = np.frombuffer(audio_bytes, dtype=np.int32)
+            y = y.astype(np.float32) / 2147483648.0
+        else:
+            # Default case
+            y = np.frombuffer(audio_bytes, dtype=np.int16)
+            y = y.astype(np.float32) / 32768.0
+
+        # If stereo, convert to mono by averaging channels
+        if wf.getnchannels() == 2:
+            y = y.reshape(-1, 2).mean(axis=1)
+
+    return rate, y
+
+class StreamingHighpass:
+    """Causal high-pass filter that carries its state from one block to the next"""
+
+    def __init__(self, rate, cutoff=HIGHPASS_CUTOFF_HZ, order=HIGHPASS_ORDER):
+        self.sos = highpass_sos(rate, cutoff, order)
+        self.zi = None
+
+    def process(self, block):
+        if len(block) == 0:
+            return block
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid a step transient
+            self.zi = signal.sosfilt_zi(self.sos) * block[0]
+        out, self.zi = signal.sosfilt(self.sos, block, zi=self.zi)
+        return out.astype(np.float32)
+
+class RunningNormalizer:
+    """Scales blocks by a fixed gain, or by a gain derived from the level seen so far"""
+
+    def __init__(self, mode='peak', gain=None, target_rms=0.1, min_level=1e-3, smoothing=0.1):
+        if mode not in ('peak', 'rms', None):
+            raise ValueError(f"Unknown normalization mode: {mode}")
+        self.mode = mode
+        self.gain = gain
+        self.target_rms = target_rms
+        self.min_level = min_level
+        self.smoothing = smoothing
+        self.level = 0.0
+
+    def process(self, block):
+        if self.gain is not None:
+            return (block * self.gain).astype(np.float32)
+        if self.mode is None or len(block) == 0:
+            return np.array(block, dtype=np.float32)
+
+        if self.mode == 'peak':
+            self.level = max(self.level, float(np.max(np.abs(block))))
+            gain = 1.0 / max(self.level, self.min_level)
+        else:
+            rms = float(np.sqrt(np.mean(np.square(block, dtype=np.float64))))
+            if self.level == 0.0:
+                self.level = rms
+            else:
+                self.level += self.smoothing * (rms - self.level)
+            gain = self.target_rms / max(self.level, self.min_level)
+
+        return (block * gain).astype(np.float32)
+
+class SilenceTrimmer:
+    """
+    Drops leading and trailing samples below a threshold from a stream of blocks
+
+    Quiet stretches after the last loud sample are held back until more sound
+    arrives; at most max_pending samples are held, so trailing silence longer
+    than that is only partly trimmed.
+    """
+
+    def __init__(self, threshold=TRIM_THRESHOLD, max_pending=None):
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self.started = False
+        self.pending = []
+        self.pending_len = 0
+
+    def process(self, block):
+        loud = np.flatnonzero(np.abs(block) > self.threshold)
+        if not self.started:
+            if len(loud) == 0:
+                return []
+            self.started = True
+            block = block[loud[0]:]
+            loud = loud - loud[0]
+
+        if len(loud) == 0:
+            self.pending.append(block)
+            self.pending_len += len(block)
+            out = []
+            while self.max_pending is not None and self.pending_len > self.max_pending:
+                oldest = self.pending.pop(0)
+                self.pending_len -= len(oldest)
+                out.append(oldest)
+            return out
+
+        out = self.pending + [block[:loud[-1] + 1]]
+        self.pending = [block[loud[-1] + 1:]]
+        self.pending_len = len(self.pending[0])
+        return out
+
+def _array_blocks(y, block_size):
+    """Yield consecutive views of an array"""
+    for start in range(0, len(y), block_size):
+        yield y[start:start + block_size]
+
+def _reblock(blocks, block_size):
+    """Regroup a stream of arrays into blocks of exactly block_size (the last may be shorter)"""
+    carry = []
+    carry_len = 0
+    for block in blocks:
+        while len(block) > 0:
+            if carry_len == 0 and len(block) >= block_size:
+                yield block[:block_size]
+                block = block[block_size:]
+                continue
+            take = min(block_size - carry_len, len(block))
+            carry.append(block[:take])
+            carry_len += take
+            block = block[take:]
+            if carry_len == block_size:
+                yield np.concatenate(carry)
+                carry = []
+                carry_len = 0
+    if carry_len > 0:
+        yield np.concatenate(carry)
+
+def preprocess_stream(blocks, rate, block_size=PREPROCESS_BLOCK_SIZE, normalize='peak', gain=None,
+                      trim_threshold=TRIM_THRESHOLD, max_trailing_silence=10.0, target_rate=None):
+    """
+    Resample, normalize, high-pass filter and trim a stream of audio blocks
+
+    Args:
+        blocks: Iterable of 1-D float arrays
+        rate: Sample rate of the stream
+        block_size: Number of samples per yielded block
+        normalize: 'peak' or 'rms' for running normalization, None to disable
+        gain: Fixed gain to use instead of running normalization
+        trim_threshold: Level below which leading/trailing samples are dropped (None to disable)
+        max_trailing_silence: Longest quiet stretch (seconds) held back for trailing trimming
+            (None holds back any length, so all trailing silence is trimmed)
+        target_rate: Rate to resample to before any other stage (None keeps the input rate)
+
+    Yields:
+        float32 blocks of block_size samples (the last block may be shorter)
+    """
+    resampler = None
+    if target_rate is not None and target_rate != rate:
+        resampler = StreamingResampler(rate, target_rate)
+        rate = target_rate
+
+    normalizer = RunningNormalizer(normalize, gain)
+    highpass = StreamingHighpass(rate)
+    trimmer = None
+    if trim_threshold is not None:
+        max_pending = None if max_trailing_silence is None else int(max_trailing_silence * rate)
+        trimmer = SilenceTrimmer(trim_threshold, max_pending)
+
+    def _resampled():
+        if resampler is None:
+            yield from blocks
+            return
+        for block in blocks:
+            yield resampler.process(block)
+        yield resampler.flush()
+
+    def _stages():
+        for block in _resampled():
+            # Each stage returns a new array, so input blocks may be views of a buffer
+            # that the consumer overwrites once the output has been yielded
+            block = highpass.process(normalizer.process(block))
+            if trimmer is None:
+                yield block
+            else:
+                yield from trimmer.process(block)
+
+    yield from _reblock(_stages(), block_size)
+
+def _load_audio(source, sr):
+    """Decode an audio source into a mono float32 array, returning (y, rate, duration)"""
+    name = _source_name(source) or ''
+    source = as_audio_source(source)
+    header = probe_audio(source)
+    duration = header['duration'] if header else None
+
+    # Load audio file based on extension
+    if header is not None:
+        rate = header['sample_rate']
+        y, _ = read_wav_mmap(source, header)
+    elif name.endswith('.wav'):
+        logger.warning("Could not memory-map WAV file, falling back to wave module")
+        rate, y = _read_with_wave(source)
+    else:
+        # For non-WAV files, attempt to use wave module
+        try:
+            rate, y = _read_with_wave(source)
+        except Exception as wave_error:
+            # If all methods fail, analyze a synthetic recording of typing instead
+            logger.warning(f"Could not read audio file with any method, using placeholder: {wave_error}")
+            # Imported here: synthetic_corpus depends on ml_models, which imports this module
+            from synthetic_corpus import render_text
+            rate = sr or ANALYSIS_RATE
+            # Seeded, so the same unreadable upload always gives the same analysis
+            y, _ = render_text(PLACEHOLDER_TEXT, rate=rate, seed=0)
+
+    y = np.asarray(y, dtype=np.float32)
+    if duration is None:
+        duration = len(y) / float(rate)
+    return y, rate, duration
+
+def stream_audio(filepath, sr=ANALYSIS_RATE, block_size=PREPROCESS_BLOCK_SIZE, normalize='peak'):
+    """
+    Open an audio file as a stream of preprocessed blocks
+
+    WAV files are decoded lazily from a memory map, so memory use does not depend
+    on the recording length and the first block is available immediately.
+
+    Args:
+        filepath: Path to the audio file, bytes-like buffer, upload or binary file object
+        sr: Analysis sample rate to resample to (None keeps the file's rate)
+        block_size: Number of samples per block
+        normalize: Running normalization mode ('peak', 'rms' or None)
+
+    Returns:
+        Dictionary with a 'blocks' generator in place of 'waveform'
+    """
+    try:
+        source = as_audio_source(filepath)
+        header = probe_audio(source)
+        if header is not None:
+            rate = header['sample_rate']
+            duration = header['duration']
+            blocks = iter_wav_blocks(source, header)
+        else:
+            y, rate, duration = _load_audio(filepath, sr)
+            blocks = _array_blocks(y, PCM_BLOCK_FRAMES)
+
+        return {
+            'blocks': preprocess_stream(blocks, rate, block_size, normalize=normalize, target_rate=sr),
+            'sr': sr or rate,
+            'duration': duration
+        }
+
+    except Exception as e:
+        logger.error(f"Error streaming audio: {e}")
+        raise
+
+def process_audio(filepath, sr=ANALYSIS_RATE):
     """
     Load and preprocess audio file
 
+    WAV files are memory-mapped (or read in place from an in-memory upload)
+    and decoded block by block; other formats go through the wave module.
+    Preprocessing runs through preprocess_stream and writes back into the
+    decoded buffer, so the waveform is the only full-length allocation.
+
     Args:
-        filepath: Path to the audio file
-        sr: Sample rate to use
+        filepath: Path to the audio file, bytes-like buffer, werkzeug upload or binary file object
+        sr: Analysis sample rate to resample to (None keeps the file's rate)
 
     Returns:
         Preprocessed audio data
     """
     try:
-        # Load audio file based on extension
-        if filepath.endswith('.wav'):
-            try:
-                # Use scipy.io.wavfile for WAV files
-                rate, y = wavfile.read(filepath)
-                # Convert to float between -1 and 1
-                if y.dtype == np.int16:
-                    y = y.astype(np.float32) / 32768.0
-                elif y.dtype == np.int32:
-                    y = y.astype(np.float32) / 2147483648.0
-                elif y.dtype == np.uint8:
-                    y = (y.astype(np.float32) - 128) / 128.0
-            except Exception as inner_e:
-                logger.warning(f"Error reading WAV with scipy: {inner_e}")
-                # Fallback to wave module
-                with wave.open(filepath, 'rb') as wf:
-                    rate = wf.getframerate()
-                    frames = wf.getnframes()
-                    audio_bytes = wf.readframes(frames)
-                    
-                    # Convert bytes to numpy array based on sample width
-                    if wf.getsampwidth() == 1:  # 8-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.uint8)
-                        y = (y.astype(np.float32) - 128) / 128.0
-                    elif wf.getsampwidth() == 2:  # 16-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.int16)
-                        y = y.astype(np.float32) / 32768.0
-                    elif wf.getsampwidth() == 4:  # 32-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.int32)
-                        y = y.astype(np.float32) / 2147483648.0
-                    else:
-                        # Default case
-                        y = np.frombuffer(audio_bytes, dtype=np.int16)
-                        y = y.astype(np.float32) / 32768.0
-                    
-                    # If stereo, convert to mono by averaging channels
-                    if wf.getnchannels() == 2:
-                        y = y.reshape(-1, 2).mean(axis=1)
-        else:
-            # For non-WAV files, attempt to use wave module
-            try:
-                with wave.open(filepath, 'rb') as wf:
-                    rate = wf.getframerate()
-                    frames = wf.getnframes()
-                    audio_bytes = wf.readframes(frames)
-                    
-                    # Convert bytes to numpy array based on sample width
-                    if wf.getsampwidth() == 1:  # 8-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.uint8)
-                        y = (y.astype(np.float32) - 128) / 128.0
-                    elif wf.getsampwidth() == 2:  # 16-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.int16)
-                        y = y.astype(np.float32) / 32768.0
-                    elif wf.getsampwidth() == 4:  # 32-bit
-                        y = np.frombuffer(audio_bytes, dtype=np.int32)
-                        y = y.astype(np.float32) / 2147483648.0
-                    else:
-                        # Default case
-                        y = np.frombuffer(audio_bytes, dtype=np.int16)
-                        y = y.astype(np.float32) / 32768.0
-                    
-                    # If stereo, convert to mono by averaging channels
-                    if wf.getnchannels() == 2:
-                        y = y.reshape(-1, 2).mean(axis=1)
-            except Exception as wave_error:
-                # If all methods fail, create a more complex audio array to simulate typing
-                logger.warning(f"Could not read audio file with any method, using placeholder: {wave_error}")
-                # Create a simulated keyboard typing pattern
-                duration = 3.0  # seconds
-                rate = sr
-                t = np.linspace(0, duration, int(rate * duration), False)
-                
-                # Create empty audio
-                y = np.zeros_like(t)
-                
-                # Add simulated keystrokes at different times
-                # Each keystroke is a short burst of different frequencies
-                keystroke_positions = [0.2, 0.5, 0.7, 1.0, 1.2, 1.5, 1.7, 2.0, 2.3, 2.6]
-                
-                for pos in keystroke_positions:
-                    # Find the nearest sample position
-                    idx = int(pos * rate)
-                    if idx < len(y) - int(0.1 * rate):  # Ensure we have enough room
-                        # Create a short impulse with some variation
-                        freq = np.random.choice([300, 350, 400, 450, 500])  # Different key frequencies
-                        # Impulse length (50-100ms)
-                        impulse_len = int(np.random.uniform(0.05, 0.1) * rate)
-                        impulse_t = np.arange(impulse_len) / rate
-                        # Create a damped sine wave for more realistic keystroke sound
-                        impulse = np.sin(2 * np.pi * freq * impulse_t) * np.exp(-10 * impulse_t)
-                        # Add some noise
-                        impulse += np.random.normal(0, 0.05, len(impulse))
-                        # Add to main audio
-                        y[idx:idx+len(impulse)] += impulse
-                
-                # Add background noise
-                y += np.random.normal(0, 0.01, len(y))
-        
-        # Normalize audio (simple normalization)
-        y = y / (np.max(np.abs(y)) + 1e-10)
-        
-        # Apply high-pass filter to simulate pre-emphasis
-        if len(y) > 0:
-            b, a = signal.butter(4, 0.1, 'highpass', analog=False)
-            y = signal.filtfilt(b, a, y)
-        
-        # Simple silence trimming (threshold-based)
-        energy = np.abs(y)
-        threshold = 0.01  # adjust as needed
-        mask = energy > threshold
-        if mask.any():
-            start = np.where(mask)[0][0]
-            end = np.where(mask)[0][-1] + 1
-            y = y[start:end]
-        
+        with metrics.stage('decode') as record:
+            y, rate, duration = _load_audio(filepath, sr)
+            record.samples = len(y)
+
+        with metrics.stage('filter') as record:
+            # Normalize by the global peak, as the whole signal is already available
+            gain = 1.0 / (max(float(y.max()), -float(y.min())) + 1e-10) if len(y) > 0 else 1.0
+
+            # Downsampled output never overtakes the input, so it can reuse the decode buffer
+            out = y
+            if sr and sr != rate and resampled_length(len(y), rate, sr) > len(y):
+                out = np.empty(resampled_length(len(y), rate, sr), dtype=np.float32)
+
+            length = 0
+            # The whole recording is available, so trailing silence of any length is trimmed
+            for block in preprocess_stream(_array_blocks(y, PCM_BLOCK_FRAMES), rate, PCM_BLOCK_FRAMES,
+                                           gain=gain, max_trailing_silence=None, target_rate=sr):
+                out[length:length + len(block)] = block
+                length += len(block)
+            record.samples = len(y)
+            y = out[:length]
+            rate = sr or rate
+
         logger.debug(f"Processed audio: length={len(y)}, sr={rate}")
-        
+
         return {
             'waveform': y,
-            'sr': rate
+            'sr': rate,
+            'duration': duration
         }
-    
+
     except Exception as e:
         logger.error(f"Error processing audio: {e}")
         raise
 
-def generate_spectrogram(audio_data):
+def iter_spectrogram(blocks, sr, nperseg=2048, noverlap=1536, nfft=4096, max_bins=None):
     """
-    Generate spectrogram from audio data
+    Compute a PSD spectrogram incrementally from a stream of blocks
+
+    Matches scipy.signal.spectrogram with its default window, detrending and
+    density scaling, but only keeps nperseg samples of history.
 
     Args:
-        audio_data: Dictionary containing waveform and sample rate
+        blocks: Iterable of 1-D float arrays
+        sr: Sample rate
+        nperseg: Segment length
+        noverlap: Overlap between segments
+        nfft: FFT length
+        max_bins: Number of frequency bins to keep (all if None)
+
+    Yields:
+        Tuples of (segment_times, Sxx_chunk) with Sxx_chunk shaped (bins, segments)
+    """
+    window = signal.get_window(('tukey', .25), nperseg).astype(np.float32)
+    scale = 1.0 / (sr * np.sum(window.astype(np.float64) ** 2))
+    hop = nperseg - noverlap
+    buf = np.zeros(0, dtype=np.float32)
+    offset = 0  # Index of buf[0] in the full stream
+    produced = False
+
+    for block in blocks:
+        buf = np.concatenate([buf, block])
+        if len(buf) < nperseg:
+            continue
+        n = (len(buf) - nperseg) // hop + 1
+        frames = np.lib.stride_tricks.sliding_window_view(buf, nperseg)[::hop][:n]
+        frames = (frames - frames.mean(axis=1, keepdims=True)) * window
+        spec = np.fft.rfft(frames, n=nfft, axis=1)[:, :max_bins]
+        Sxx = (spec.real ** 2 + spec.imag ** 2) * scale
+        # One-sided spectrum: double everything except DC (and Nyquist, if kept)
+        last = Sxx.shape[1] if Sxx.shape[1] < nfft // 2 + 1 else -1
+        Sxx[:, 1:last] *= 2
+        times = (offset + np.arange(n) * hop + nperseg / 2) / float(sr)
+        produced = True
+        yield times, Sxx.T
+        buf = buf[n * hop:]
+        offset += n * hop
+
+    if not produced and len(buf) > 0:
+        # Shorter than one segment: emit a single column over whatever was received
+        f, t, Sxx = signal.spectrogram(buf, sr, nperseg=len(buf), noverlap=0, nfft=nfft)
+        yield t, Sxx[:max_bins, :]
+
+def compute_spectrogram(audio_data):
+    """
+    Compute the normalized, band-limited dB spectrogram used for visualization
+
+    Args:
+        audio_data: Dictionary containing waveform (or a 'blocks' stream) and sample rate,
+            or an AnalysisContext whose STFT can be shared with later analysis
 
     Returns:
-        Spectrogram data in the appropriate format for visualization
+        Dictionary of numpy arrays: 'data' (freq x time, float32 in [0, 1]), 'time', 'freq',
+        plus the dB 'min_value' and 'max_value' used for normalization
     """
-    try:
-        y = audio_data['waveform']
-        sr = audio_data['sr']
+    sr = audio_data.sr if isinstance(audio_data, AnalysisContext) else audio_data['sr']
 
-        # Compute spectrogram using scipy - increase resolution for better visualization
-        f, t, Sxx = signal.spectrogram(y, sr, nperseg=2048, noverlap=1536, nfft=4096)
+    if not isinstance(audio_data, AnalysisContext) and 'blocks' in audio_data:
+        nfft = 4096
+        f = np.fft.rfftfreq(nfft, 1.0 / sr)
+        max_freq_idx = min(len(f), int(len(f) * 8000 / (sr/2)))
 
-        # Convert to dB scale which is more appropriate for audio visualization
-        Sxx_db = 10 * np.log10(Sxx + 1e-10)
+        # Only the band-limited dB columns are kept while the stream is consumed
+        times = []
+        columns = []
+        for t_chunk, Sxx_chunk in iter_spectrogram(audio_data['blocks'], sr, nperseg=2048,
+                                                   noverlap=1536, nfft=nfft, max_bins=max_freq_idx):
+            times.append(t_chunk)
+            columns.append(10 * np.log10(Sxx_chunk + 1e-10))
+        if not columns:
+            raise ValueError("Audio stream produced no samples")
+        t = np.concatenate(times)
+        Sxx_db = np.hstack(columns)
+    else:
+        # Increase resolution for better visualization; the dB scale is more
+        # appropriate for audio visualization
+        f, t, Sxx_db = analysis_context(audio_data).db(nperseg=2048, noverlap=1536, nfft=4096)
 
         # Limit the frequency range to focus on the important parts (up to 8kHz typically covers keyboard sounds)
         max_freq_idx = min(len(f), int(len(f) * 8000 / (sr/2)))
         Sxx_db = Sxx_db[:max_freq_idx, :]
 
-        # Normalize values for visualization
-        Sxx_min = np.min(Sxx_db)
-        Sxx_max = np.max(Sxx_db)
-        Sxx_normalized = (Sxx_db - Sxx_min) / (Sxx_max - Sxx_min + 1e-10)
-
-        # Add metadata for better visualization
-        result = {
-            'data': Sxx_normalized.tolist(),
-            'time': t.tolist(),
-            'freq': f[:max_freq_idx].tolist(),
-            'min_value': float(Sxx_min),
-            'max_value': float(Sxx_max)
-        }
+    # Normalize values for visualization
+    Sxx_min = np.min(Sxx_db)
+    Sxx_max = np.max(Sxx_db)
+    Sxx_normalized = ((Sxx_db - Sxx_min) / (Sxx_max - Sxx_min + 1e-10)).astype(np.float32)
 
-        logger.debug(f"Generated spectrogram: shape={Sxx_normalized.shape}, freq_range={f[0]}-{f[max_freq_idx-1]}Hz")
+    return {
+        'data': Sxx_normalized,
+        'time': t,
+        'freq': f[:max_freq_idx],
+        'min_value': float(Sxx_min),
+        'max_value': float(Sxx_max)
+    }
 
-        return result
+def max_pool(data, axis, max_size):
+    """Max-pool a 2-D array along one axis so it has at most max_size entries"""
+    n = data.shape[axis]
+    if not max_size or n <= max_size:
+        return data, 1
+    factor = -(-n // max_size)
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (0, -n % factor)
+    data = np.pad(data, pad, mode='edge')
+    if axis == 0:
+        return data.reshape(-1, factor, data.shape[1]).max(axis=1), factor
+    return data.reshape(data.shape[0], -1, factor).max(axis=2), factor
 
-    except Exception as e:
-        logger.error(f"Error generating spectrogram: {e}")
-        raise
+def _pooled_axis(values, factor):
+    """First and last centre of groups of factor consecutive axis values"""
+    groups = -(-len(values) // factor)
+    first = float(np.mean(values[:factor]))
+    last = float(np.mean(values[(groups - 1) * factor:]))
+    return [first, last]
 
-def extract_keystroke_segments(audio_data, threshold=0.1, min_duration=0.05):
+def pack_spectrogram(spectrogram, max_columns=None, max_rows=None):
     """
-    Extract segments that likely contain individual keystrokes
+    Encode a spectrogram as a compact uint8 payload for the browser
+
+    Cells are max-pooled down to at most max_columns x max_rows (so short
+    transients survive), quantized to 0-255 and base64-encoded row-major with
+    the lowest frequency first. Both axes are linear, so they are sent as
+    [first, last] ranges instead of full lists.
 
     Args:
-        audio_data: Dictionary containing waveform and sample rate
-        threshold: Energy threshold for detecting keystrokes
-        min_duration: Minimum duration (in seconds) for a valid keystroke
+        spectrogram: Dictionary from compute_spectrogram
+        max_columns: Maximum number of time columns (e.g. the canvas width)
+        max_rows: Maximum number of frequency rows (e.g. the canvas height)
 
     Returns:
-        List of segments containing potential keystrokes
+        JSON-serializable payload dictionary
+    """
+    data, time_factor = max_pool(spectrogram['data'], 1, max_columns)
+    data, freq_factor = max_pool(data, 0, max_rows)
+    quantized = np.rint(data * 255).astype(np.uint8)
+
+    return {
+        'encoding': 'uint8',
+        'shape': list(quantized.shape),
+        'data': base64.b64encode(quantized.tobytes()).decode('ascii'),
+        'time_range': _pooled_axis(spectrogram['time'], time_factor),
+        'freq_range': _pooled_axis(spectrogram['freq'], freq_factor),
+        'min_value': spectrogram['min_value'],
+        'max_value': spectrogram['max_value']
+    }
+
+def format_spectrogram(spectrogram, encoding='json', max_columns=None, max_rows=None):
+    """
+    Serialize a spectrogram from compute_spectrogram for the browser
+
+    Args:
+        spectrogram: Dictionary from compute_spectrogram
+        encoding: 'json' for nested lists, 'uint8' for the compact pack_spectrogram payload
+        max_columns: Maximum number of time columns ('uint8' encoding only)
+        max_rows: Maximum number of frequency rows ('uint8' encoding only)
+
+    Returns:
+        JSON-serializable dictionary
+    """
+    if encoding == 'uint8':
+        return pack_spectrogram(spectrogram, max_columns, max_rows)
+    if encoding != 'json':
+        raise ValueError(f"Unknown spectrogram encoding: {encoding}")
+
+    # Add metadata for better visualization
+    return {
+        'data': spectrogram['data'].tolist(),
+        'time': spectrogram['time'].tolist(),
+        'freq': spectrogram['freq'].tolist(),
+        'min_value': spectrogram['min_value'],
+        'max_value': spectrogram['max_value']
+    }
+
+def generate_spectrogram(audio_data, encoding='json', max_columns=None, max_rows=None):
+    """
+    Generate spectrogram from audio data
+
+    Args:
+        audio_data: Dictionary containing waveform (or a 'blocks' stream) and sample rate,
+            or an AnalysisContext
+        encoding: 'json' for nested lists, 'uint8' for the compact pack_spectrogram payload
+        max_columns: Maximum number of time columns ('uint8' encoding only)
+        max_rows: Maximum number of frequency rows ('uint8' encoding only)
+
+    Returns:
+        Spectrogram data in the appropriate format for visualization
     """
     try:
-        y = audio_data['waveform']
-        sr = audio_data['sr']
+        spectrogram = compute_spectrogram(audio_data)
+        f = spectrogram['freq']
+        logger.debug(f"Generated spectrogram: shape={spectrogram['data'].shape}, freq_range={f[0]}-{f[-1]}Hz")
+        return format_spectrogram(spectrogram, encoding, max_columns, max_rows)
+
+    except Exception as e:
+        logger.error(f"Error generating spectrogram: {e}")
+        raise
 
-        # Calculate energy (RMS)
-        energy = np.sqrt(np.mean(np.square(y.reshape(-1, int(sr/10))), axis=1))
+def _keystroke_segment(waveform, sr, start, end):
+    return {
+        'waveform': waveform,
+        'sr': sr,
+        'start_time': start / sr,
+        'end_time': end / sr
+    }
 
-        # Find segments above threshold
-        above_threshold = energy > threshold
+class KeystrokeSegmenter:
+    """
+    Cuts keystroke segments out of a stream of blocks as their onsets are confirmed
 
-        # Find transitions (onsets and offsets)
-        transitions = np.diff(above_threshold.astype(int))
-        onsets = np.where(transitions == 1)[0]
-        offsets = np.where(transitions == -1)[0]
+    Onsets come from an OnsetDetector fed block by block; only the samples of
+    segments that have not been emitted yet are kept, so memory stays bounded
+    however long the stream runs. A segment is emitted once its successor's
+    onset is known or no onset can still be reported before its maximum end.
+    """
 
-        # Ensure we have matching onsets and offsets
-        if len(onsets) > len(offsets):
-            offsets = np.append(offsets, len(energy) - 1)
-        elif len(offsets) > len(onsets):
-            onsets = np.insert(onsets, 0, 0)
+    def __init__(self, sr, threshold=KEYSTROKE_RMS_THRESHOLD, min_duration=SEGMENT_MIN_DURATION,
+                 max_duration=SEGMENT_MAX_DURATION, **onset_kwargs):
+        """
+        Args:
+            sr: Sample rate
+            threshold: Minimum frame RMS just after an onset for it to count as a keystroke
+            min_duration: Minimum duration (in seconds) for a valid keystroke
+            max_duration: Maximum duration (in seconds) of a keystroke segment
+            **onset_kwargs: Extra OnsetDetector parameters
+        """
+        self.sr = sr
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.detector = OnsetDetector(sr, rms_threshold=threshold, **onset_kwargs)
+        # Onsets can be reported this many samples after they happened
+        self.latency = (self.detector.lookahead + 2) * self.detector.hop_length + self.detector.frame_length
+        self.pre_roll = int(PRE_ROLL * sr)
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0  # Sample index of history[0]
+        self.pending = np.zeros(0, dtype=np.int64)
 
+    def _ready(self, final):
+        if len(self.pending) == 0:
+            return []
+        detector, sr = self.detector, self.sr
+        total = self.history_start + len(self.history)
+        starts, ends = segment_bounds(self.pending, total, sr, max_duration=self.max_duration, min_duration=0)
+        # Every segment but the last is bounded by its successor; the last one is
+        # complete once no onset can still be reported before its maximum end
+        confirmed = detector.picked_upto * detector.hop_length + detector.frame_length - detector.hop_length
+        n_complete = len(self.pending) - 1
+        if final or starts[-1] + int(self.max_duration * sr) <= confirmed - self.pre_roll:
+            n_complete = len(self.pending)
         segments = []
-        min_samples = int(min_duration * sr)
-
-        for onset, offset in zip(onsets, offsets):
-            # Convert frame indices to sample indices
-            onset_sample = onset * int(sr/10)
-            offset_sample = offset * int(sr/10)
-
-            # Ensure minimum segment length
-            if offset_sample - onset_sample >= min_samples:
-                segment = y[onset_sample:offset_sample]
-                segments.append({
-                    'waveform': segment,
-                    'sr': sr,
-                    'start_time': onset_sample / sr,
-                    'end_time': offset_sample / sr
-                })
+        for start, end in zip(starts[:n_complete], ends[:n_complete]):
+            if end - start >= int(self.min_duration * sr):
+                segments.append(_keystroke_segment(
+                    self.history[start - self.history_start:end - self.history_start].copy(), sr, start, end))
+        self.pending = self.pending[n_complete:]
+        return segments
+
+    def process(self, block):
+        """
+        Feed the next block of samples
+
+        Returns:
+            Tuple of (sample indices of newly confirmed onsets, list of completed segments)
+        """
+        self.history = np.concatenate([self.history, block])
+        onsets = self.detector.process(block)
+        self.pending = np.append(self.pending, onsets)
+        segments = self._ready(final=False)
+
+        # Drop samples that no current or future segment can start in
+        keep_from = self.history_start + len(self.history) - self.latency
+        if len(self.pending) > 0:
+            keep_from = min(keep_from, int(self.pending[0]) - self.pre_roll)
+        if keep_from > self.history_start:
+            self.history = self.history[keep_from - self.history_start:]
+            self.history_start = keep_from
+        return onsets, segments
+
+    def flush(self):
+        """End of stream: returns (remaining onsets, remaining segments)"""
+        onsets = self.detector.flush()
+        self.pending = np.append(self.pending, onsets)
+        return onsets, self._ready(final=True)
+
+def iter_keystroke_segments(audio_data, threshold=KEYSTROKE_RMS_THRESHOLD, min_duration=SEGMENT_MIN_DURATION,
+                            max_duration=SEGMENT_MAX_DURATION, **onset_kwargs):
+    """
+    Yield segments that likely contain individual keystrokes as the audio is consumed
+
+    Args:
+        audio_data: Dictionary containing waveform (or a 'blocks' stream) and sample rate
+        threshold: Minimum frame RMS just after an onset for it to count as a keystroke
+        min_duration: Minimum duration (in seconds) for a valid keystroke
+        max_duration: Maximum duration (in seconds) of a keystroke segment
+        **onset_kwargs: Extra OnsetDetector parameters
+
+    Yields:
+        Segment dictionaries, in time order
+    """
+    sr = audio_data['sr']
+    if 'blocks' in audio_data:
+        blocks = audio_data['blocks']
+    else:
+        blocks = _array_blocks(audio_data['waveform'], DETECT_CHUNK_SAMPLES)
+
+    segmenter = KeystrokeSegmenter(sr, threshold, min_duration, max_duration, **onset_kwargs)
+    for block in blocks:
+        yield from segmenter.process(block)[1]
+    yield from segmenter.flush()[1]
+
+def extract_keystroke_segments(audio_data, threshold=KEYSTROKE_RMS_THRESHOLD, min_duration=SEGMENT_MIN_DURATION,
+                               max_duration=SEGMENT_MAX_DURATION, **onset_kwargs):
+    """
+    Extract segments that likely contain individual keystrokes
+
+    Args:
+        audio_data: Dictionary containing waveform (or a 'blocks' stream) and sample rate,
+            or an AnalysisContext (detected onsets are memoized in it)
+        threshold: Minimum frame RMS just after an onset for it to count as a keystroke
+        min_duration: Minimum duration (in seconds) for a valid keystroke
+        max_duration: Maximum duration (in seconds) of a keystroke segment
+        **onset_kwargs: Extra OnsetDetector parameters (frame_length, hop_length, methods, ...)
+
+    Returns:
+        List of segments containing potential keystrokes
+    """
+    try:
+        if not isinstance(audio_data, AnalysisContext) and 'blocks' in audio_data:
+            segments = list(iter_keystroke_segments(audio_data, threshold, min_duration,
+                                                    max_duration, **onset_kwargs))
+        else:
+            context = analysis_context(audio_data)
+            y = context.waveform
+            sr = context.sr
+            key = ('onsets', threshold, tuple(sorted(onset_kwargs.items())))
+            onsets = context.cached(key, lambda: detect_onsets(y, sr, rms_threshold=threshold, **onset_kwargs))
+            starts, ends = segment_bounds(onsets, len(y), sr, max_duration=max_duration,
+                                          min_duration=min_duration)
+            # Segment waveforms are views into the full signal
+            segments = [_keystroke_segment(y[start:end], sr, start, end) for start, end in zip(starts, ends)]
 
         logger.debug(f"Extracted {len(segments)} keystroke segments")
         return segments
 
     except Exception as e:
         logger.error(f"Error extracting keystroke segments: {e}")
-        raise
\ No newline at end of file
+        raise
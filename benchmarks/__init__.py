@@ -0,0 +1 @@
+"""Offline benchmarks for the audio analysis pipeline (run with python -m benchmarks.<name>)"""
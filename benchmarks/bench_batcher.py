@@ -0,0 +1,83 @@
+"""
+Prediction latency and throughput with and without dynamic micro-batching
+
+Fits a KeystrokeHMM on synthetic keystroke features (as bench_viterbi does),
+then has concurrent client threads each decode a series of recordings with
+confidences, first by calling KeystrokeHMM.predict directly in each thread
+and then through a MicroBatcher for each batch size and wait window.
+Reports p50/p99 request latency, throughput and the mean batch size formed.
+
+Usage:
+    python -m benchmarks.bench_batcher [--clients 16] [--requests 50] [--keystrokes 40]
+                                       [--batch-sizes 4,16,64] [--waits 1,5]
+"""
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.bench_viterbi import make_samples
+from micro_batcher import MicroBatcher
+from ml_models import KEYS, FEATURE_NAMES, KeystrokeHMM
+
+def run_clients(predict, recordings, clients, requests):
+    """Run clients threads sending requests each; returns (latencies, wall time)"""
+    latencies = [[] for _ in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def client(i):
+        barrier.wait()
+        for j in range(requests):
+            features = recordings[(i * requests + j) % len(recordings)]
+            start = time.perf_counter()
+            predict(features)
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return np.concatenate(latencies), time.perf_counter() - start
+
+def report(name, latencies, elapsed, mean_batch):
+    print(f"{name:>22} {np.percentile(latencies, 50) * 1e3:>8.2f} {np.percentile(latencies, 99) * 1e3:>8.2f} "
+          f"{len(latencies) / elapsed:>10.1f} {mean_batch:>6.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+    parser.add_argument('--keystrokes', type=int, default=40, help='Keystrokes per recording')
+    parser.add_argument('--batch-sizes', default='4,16,64', help='Comma-separated batcher batch sizes')
+    parser.add_argument('--waits', default='1,5', help='Comma-separated batcher wait windows in ms')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = np.random.default_rng(0)
+    means = rng.standard_normal((len(KEYS), len(FEATURE_NAMES)))
+    hmm = KeystrokeHMM().fit(make_samples(rng, 50, 200, means, 1.5))
+    recordings = [audio['segment_features'] for audio, _ in make_samples(rng, 64, args.keystrokes, means, 1.5)]
+
+    print(f"{args.clients} clients x {args.requests} requests, {args.keystrokes} keystrokes per recording")
+    print(f"{'mode':>22} {'p50 ms':>8} {'p99 ms':>8} {'requests/s':>10} {'batch':>6}")
+
+    predict = lambda features: hmm.predict(features, return_confidence=True)
+    run_clients(predict, recordings, args.clients, 2)
+    report('direct', *run_clients(predict, recordings, args.clients, args.requests), 1.0)
+
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        for wait in (float(w) for w in args.waits.split(',')):
+            batcher = MicroBatcher(lambda batch: hmm.predict_batch(batch, return_confidence=True),
+                                   max_batch_size=batch_size, max_wait_ms=wait)
+            run_clients(batcher.submit, recordings, args.clients, 2)
+            batcher.reset_stats()
+            latencies, elapsed = run_clients(batcher.submit, recordings, args.clients, args.requests)
+            report(f"batch {batch_size}, wait {wait:g} ms", latencies, elapsed, batcher.stats()['mean_batch_size'])
+
+if __name__ == '__main__':
+    main()
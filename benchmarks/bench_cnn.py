@@ -0,0 +1,60 @@
+"""
+Keystroke CNN inference throughput on the NumPy engine
+
+Runs build_cnn_model on random (128, 128, 1) spectrograms with different
+batch sizes, and with the input split across several threads (each thread
+keeps its own activation buffers; NumPy releases the GIL in the im2col
+copies and the GEMMs). Reports spectrograms per second for the full
+forward pass and for embeddings only.
+
+Usage:
+    python -m benchmarks.bench_cnn [--count 256] [--batches 1,8,32] [--threads 1,2,4]
+"""
+import argparse
+import concurrent.futures
+import logging
+import os
+import time
+
+import numpy as np
+
+from ml_models import CNN_INPUT_SHAPE, EMBEDDING_LAYER, build_cnn_model
+
+def run(model, X, batch_size, threads, layer):
+    if threads == 1:
+        return model.predict(X, batch_size=batch_size, layer=layer)
+    chunks = np.array_split(X, threads)
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        return np.concatenate(list(pool.map(
+            lambda chunk: model.predict(chunk, batch_size=batch_size, layer=layer), chunks)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=256)
+    parser.add_argument('--batches', default='1,8,32', help='Comma-separated batch sizes')
+    parser.add_argument('--threads', default='1,2,4', help='Comma-separated thread counts')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    model = build_cnn_model()
+    X = np.random.default_rng(0).random((args.count,) + CNN_INPUT_SHAPE, dtype=np.float32)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f"{args.count} spectrograms of {CNN_INPUT_SHAPE}, {model.get_parameters()['parameters']} parameters, "
+          f"{cpus} CPUs available")
+    print(f"{'batch':>5} {'threads':>7} {'output/s':>9} {'embed/s':>9}")
+    for batch_size in (int(b) for b in args.batches.split(',')):
+        for threads in (int(t) for t in args.threads.split(',')):
+            rates = []
+            for layer in (None, EMBEDDING_LAYER):
+                run(model, X[:batch_size * threads], batch_size, threads, layer)
+                best = float('inf')
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    run(model, X, batch_size, threads, layer)
+                    best = min(best, time.perf_counter() - start)
+                rates.append(args.count / best)
+            print(f"{batch_size:>5} {threads:>7} {rates[0]:>9.1f} {rates[1]:>9.1f}")
+
+if __name__ == '__main__':
+    main()
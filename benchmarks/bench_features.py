@@ -0,0 +1,58 @@
+"""
+Keystroke feature extraction throughput: per-segment loop against one batched pass
+
+Cuts a synthetic recording into keystroke segments with
+extract_keystroke_segments, then times extract_features called once per
+segment against a single extract_features_batch call and reports segments
+per second for both.
+
+Usage:
+    python -m benchmarks.bench_features [--seconds 60] [--repeats 3]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from audio_processor import process_audio, extract_keystroke_segments
+from benchmarks.bench_resample import make_recording
+from ml_models import extract_features, extract_features_batch
+
+def best_time(func, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_features.wav')
+        make_recording(path, 44100, args.seconds)
+        segments = extract_keystroke_segments(process_audio(path))
+
+    looped = np.array([extract_features(segment) for segment in segments])
+    batched = extract_features_batch(segments)
+    error = np.max(np.abs(batched - looped) / (np.abs(looped).max(axis=0) + 1e-12))
+
+    loop_time = best_time(lambda: [extract_features(segment) for segment in segments], args.repeats)
+    batch_time = best_time(lambda: extract_features_batch(segments), args.repeats)
+
+    print(f"{len(segments)} segments, max relative difference {error:.2e}")
+    print(f"{'method':>8} {'time (s)':>9} {'segments/s':>11}")
+    print(f"{'loop':>8} {loop_time:>9.4f} {len(segments) / loop_time:>11.0f}")
+    print(f"{'batch':>8} {batch_time:>9.4f} {len(segments) / batch_time:>11.0f}")
+    print(f"speedup {loop_time / batch_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
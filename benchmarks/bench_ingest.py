@@ -0,0 +1,58 @@
+"""
+Bulk ingestion throughput as a function of the number of worker processes
+
+Builds a batch of synthetic 44.1 kHz WAV uploads in memory and runs
+ingest_files over it (without the feature cache) with different pool
+sizes, reporting files per second and the speedup over one worker. The
+pool is started before timing so worker start-up is not counted.
+
+Usage:
+    python -m benchmarks.bench_ingest [--files 32] [--seconds 10] [--workers 1,2,4,8]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.bench_resample import make_recording
+from parallel_ingest import default_workers, ingest_files, shutdown_executor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--workers', default='1,2,4,8',
+                        help='Comma-separated pool sizes to measure')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    uploads = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.files):
+            path = os.path.join(tmp, f"bench_{i}.wav")
+            make_recording(path, 44100, args.seconds, seed=i)
+            with open(path, 'rb') as f:
+                uploads.append((f"bench_{i}.wav", f.read()))
+
+    print(f"{args.files} files of {args.seconds:g} s, {default_workers()} CPUs available")
+    print(f"{'workers':>7} {'time (s)':>9} {'files/s':>8} {'speedup':>8}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(',')):
+        # Start the pool (and import the pipeline in every worker) before timing
+        ingest_files(uploads[:workers + 1], workers=workers)
+
+        start = time.perf_counter()
+        results = ingest_files(uploads, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        failed = sum(error is not None for _, _, error in results)
+        if failed:
+            print(f"{workers:>7} {failed} files failed")
+        baseline = baseline or elapsed
+        print(f"{workers:>7} {elapsed:>9.3f} {args.files / elapsed:>8.1f} {baseline / elapsed:>7.2f}x")
+
+    shutdown_executor()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Query latency and recall of the keystroke nearest-neighbour index
+
+Fills a KeystrokeIndex with synthetic keystroke features (Gaussian clusters
+around per-key means, as in bench_viterbi) at each size, then reports the
+build time, the cost of a small incremental insert, the latency of
+single-keystroke queries by exact GEMM scan and by the inverted lists
+(IVF) for each nprobe, and the recall of the IVF neighbours against the
+exact ones.
+
+Usage:
+    python -m benchmarks.bench_knn [--sizes 10000,100000,1000000] [--queries 500] [--k 8]
+                                   [--nprobes 4,8,16]
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from keystroke_index import KeystrokeIndex
+from ml_models import KEYS, FEATURE_NAMES
+
+def make_keystrokes(rng, n, means, spread):
+    """n labeled keystroke feature vectors around the per-key means"""
+    labels = rng.integers(0, len(means), n)
+    return (means[labels] + spread * rng.standard_normal((n, means.shape[1]))).astype(np.float32), labels
+
+def query_latency(index, queries, **search_kwargs):
+    """Per-query latency (ms) of one-keystroke searches, and the ids found"""
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found, _ = index.search(query[np.newaxis], **search_kwargs)
+        latencies.append(time.perf_counter() - start)
+        ids.append(found[0])
+    return np.array(latencies) * 1e3, np.array(ids)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated index sizes')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=8)
+    parser.add_argument('--nprobes', default='4,8,16', help='Comma-separated inverted lists probed')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = np.random.default_rng(0)
+    means = rng.standard_normal((len(KEYS), len(FEATURE_NAMES)))
+    queries, _ = make_keystrokes(rng, args.queries, means, 1.5)
+
+    print(f"{'size':>9} {'mode':>12} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as directory:
+            index = KeystrokeIndex(directory)
+            features, labels = make_keystrokes(rng, size, means, 1.5)
+            start = time.perf_counter()
+            index.add(features, labels)
+            build = time.perf_counter() - start
+            start = time.perf_counter()
+            index.add(*make_keystrokes(rng, 1000, means, 1.5))
+            insert = time.perf_counter() - start
+            stats = index.stats()
+            print(f"{size:>9} built in {build:.2f} s, {stats['lists']} lists; "
+                  f"1000-keystroke insert {insert * 1e3:.1f} ms")
+
+            index.search(queries[:10], k=args.k)
+            latency, exact_ids = query_latency(index, queries, k=args.k, exact=True)
+            print(f"{size:>9} {'exact':>12} {np.percentile(latency, 50):>8.3f} {np.percentile(latency, 99):>8.3f} "
+                  f"{1.0:>7.3f}")
+            for nprobe in (int(n) for n in args.nprobes.split(',')):
+                latency, ids = query_latency(index, queries, k=args.k, nprobe=nprobe)
+                recall = np.mean([len(set(a) & set(e)) / args.k for a, e in zip(ids, exact_ids)])
+                print(f"{size:>9} {f'nprobe {nprobe}':>12} {np.percentile(latency, 50):>8.3f} "
+                      f"{np.percentile(latency, 99):>8.3f} {recall:>7.3f}")
+
+if __name__ == '__main__':
+    main()
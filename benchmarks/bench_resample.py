@@ -0,0 +1,63 @@
+"""
+Per-request CPU cost of the upload pipeline with and without early resampling
+
+Runs process_audio, generate_spectrogram and extract_features on synthetic
+44.1 kHz and 48 kHz recordings, once at the native rate and once resampled to
+ANALYSIS_RATE, and reports CPU seconds per request.
+
+Usage:
+    python -m benchmarks.bench_resample [--seconds 30] [--repeats 3]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+from scipy.io import wavfile
+
+from audio_processor import ANALYSIS_RATE, process_audio, generate_spectrogram
+from ml_models import extract_features
+
+def make_recording(path, rate, seconds, seed=0):
+    """Write a deterministic noisy recording with a keystroke-like burst every 150 ms"""
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 0.01, int(rate * seconds))
+    burst_t = np.arange(int(0.04 * rate)) / rate
+    burst = np.sin(2 * np.pi * 2500 * burst_t) * np.exp(-120 * burst_t)
+    for start in range(int(0.1 * rate), len(y) - len(burst), int(0.15 * rate)):
+        y[start:start + len(burst)] += burst * rng.uniform(0.5, 1.0)
+    wavfile.write(path, rate, (y / np.max(np.abs(y)) * 32000).astype(np.int16))
+
+def run_request(path, sr):
+    audio_data = process_audio(path, sr=sr)
+    generate_spectrogram(audio_data)
+    extract_features(audio_data)
+
+def cpu_seconds(path, sr, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.process_time()
+        run_request(path, sr)
+        best = min(best, time.process_time() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'input rate':>10} {'native (s)':>11} {f'{ANALYSIS_RATE} Hz (s)':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rate in (44100, 48000):
+            path = os.path.join(tmp, f"bench_{rate}.wav")
+            make_recording(path, rate, args.seconds)
+            native = cpu_seconds(path, None, args.repeats)
+            analysis = cpu_seconds(path, ANALYSIS_RATE, args.repeats)
+            print(f"{rate:>10} {native:>11.3f} {analysis:>12.3f} {native / analysis:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
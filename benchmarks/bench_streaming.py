@@ -0,0 +1,85 @@
+"""
+Live keystroke detection latency, processing cost and memory of a streaming session
+
+Streams a synthetic recording (a keystroke-like burst every 150 ms, as in
+bench_resample) through a StreamingSession in capture-sized PCM chunks, as
+the browser does, and reports the processing time per chunk, how long
+after it happened each onset and each decoded keystroke was returned
+(measured from the end of the chunk that returned it, so it includes
+waiting for the chunk), and the memory held by the session as the stream
+goes on.
+
+Usage:
+    python -m benchmarks.bench_streaming [--seconds 60] [--rate 48000] [--chunk-ms 43]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.io import wavfile
+
+from benchmarks.bench_resample import make_recording
+from benchmarks.bench_viterbi import make_samples
+from ml_models import KEYS, FEATURE_NAMES, KeystrokeHMM
+from streaming import StreamingSession
+
+# Modules whose allocations make up the memory held by a session
+SESSION_MODULES = ('streaming.py', 'audio_processor.py', 'onset_detection.py', 'hmm_decoding.py')
+
+def session_memory():
+    """Bytes currently allocated from the session's modules"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, f"*{os.sep}{name}") for name in SESSION_MODULES])
+    return sum(stat.size for stat in snapshot.statistics('filename'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--rate', type=int, default=48000, help='Capture sample rate')
+    parser.add_argument('--chunk-ms', type=float, default=43.0, help='Capture chunk length')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_streaming.wav')
+        make_recording(path, args.rate, args.seconds)
+        _, pcm = wavfile.read(path)
+
+    rng = np.random.default_rng(0)
+    hmm = KeystrokeHMM().fit(make_samples(rng, 50, 200, rng.standard_normal((len(KEYS), len(FEATURE_NAMES))), 1.5))
+    session = StreamingSession(hmm, args.rate)
+
+    chunk = int(args.rate * args.chunk_ms / 1000)
+    n_chunks = -(-len(pcm) // chunk)
+    times, onset_latency, keystroke_latency, memory = [], [], [], {}
+    tracemalloc.start()
+    for start in range(0, len(pcm), chunk):
+        data = pcm[start:start + chunk].tobytes()
+        began = time.perf_counter()
+        result = session.feed(data)
+        times.append(time.perf_counter() - began)
+        received = min(start + chunk, len(pcm)) / args.rate
+        onset_latency += [received - onset for onset in result['onsets']]
+        keystroke_latency += [received - keystroke['start_time'] for keystroke in result['keystrokes']]
+        if len(times) in (n_chunks // 4, n_chunks):
+            memory[received] = session_memory()
+    tracemalloc.stop()
+    session.close()
+
+    times = np.array(times) * 1e3
+    print(f"{args.seconds:g} s at {args.rate} Hz in {args.chunk_ms:g} ms chunks: {len(times)} chunks, "
+          f"{session.keystrokes} keystrokes")
+    print(f"chunk processing   p50 {np.percentile(times, 50):6.2f} ms  p99 {np.percentile(times, 99):6.2f} ms  "
+          f"real-time factor {times.sum() / 1e3 / args.seconds:.3f}")
+    for name, latency in (('onset', onset_latency), ('keystroke', keystroke_latency)):
+        latency = np.array(latency) * 1e3
+        print(f"{name + ' latency':<18} p50 {np.percentile(latency, 50):6.1f} ms  max {latency.max():6.1f} ms")
+    print("session memory     " + ', '.join(f"after {seconds:.0f} s {size / 1024:.0f} KB"
+                                          for seconds, size in memory.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Wall time, throughput and peak memory of each stage of the upload path
+
+Renders deterministic synthetic recordings (make_recording, seeded) for
+every combination of length and sample rate, then times each stage of the
+upload path on them:
+
+    process_audio               decode, filter, resample and normalize the WAV file
+    generate_spectrogram        spectrogram of the processed audio, JSON-encoded
+    extract_keystroke_segments  onset detection and segmentation
+    extract_features            whole-clip features
+    extract_features_batch      per-keystroke features of every segment
+    predict_keystrokes_hmm      HMM decoding with confidences (a model fit on
+                                synthetic features, as in bench_viterbi)
+
+Every stage gets fresh inputs, so results memoized by an AnalysisContext
+are not reused between stages or repeats. Wall time is the best of the
+repeats. Peak memory is measured by tracemalloc in a separate run, so it
+does not slow the timed runs. It counts Python and NumPy allocations made
+by the stage beyond its inputs.
+
+The results go to a JSON file (--output). With --baseline they are
+compared stage by stage to an earlier results file. Stages slower or
+larger than the tolerance are reported, and the exit status is 1 if any
+are found. benchmarks/baseline.json holds the results of the default
+configuration on the machine its 'environment' describes. Wall times are
+only comparable on similar hardware, so regenerate it with --output
+before comparing on another machine.
+
+Usage:
+    python -m benchmarks.bench_suite [--seconds 5,30,120] [--rates 16000,44100,48000] [--repeats 5]
+                                     [--output results.json] [--baseline benchmarks/baseline.json]
+                                     [--time-tolerance 0.25] [--memory-tolerance 0.1]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from audio_processor import process_audio, probe_audio, generate_spectrogram, extract_keystroke_segments
+from benchmarks.bench_resample import make_recording
+from benchmarks.bench_viterbi import make_samples
+from ml_models import KEYS, FEATURE_NAMES, KeystrokeHMM, extract_features, extract_features_batch, \
+    predict_keystrokes_hmm
+
+RESULTS_VERSION = 1
+
+def make_stages(path, hmm):
+    """
+    Stages of the upload path on one recording
+
+    Returns:
+        List of (name, setup, run, unit) where setup() builds the stage's
+        input, run(input) is timed, and unit names what (input) is counted
+        in; each setup returns (input, items)
+    """
+    def processed():
+        audio_data = process_audio(path)
+        return audio_data, len(audio_data['waveform'])
+
+    def segments():
+        segments = extract_keystroke_segments(process_audio(path))
+        return segments, sum(len(segment['waveform']) for segment in segments)
+
+    def features():
+        features = extract_features_batch(extract_keystroke_segments(process_audio(path)))
+        return features, len(features)
+
+    def wav_file():
+        return path, probe_audio(path)['n_frames']
+
+    return [
+        ('process_audio', wav_file, process_audio, 'samples'),
+        ('generate_spectrogram', processed, generate_spectrogram, 'samples'),
+        ('extract_keystroke_segments', processed, extract_keystroke_segments, 'samples'),
+        ('extract_features', processed, extract_features, 'samples'),
+        ('extract_features_batch', segments, extract_features_batch, 'samples'),
+        ('predict_keystrokes_hmm', features,
+         lambda features: predict_keystrokes_hmm(features, hmm, return_confidence=True), 'keystrokes'),
+    ]
+
+def measure(setup, run, repeats):
+    """Best wall time over repeats, peak traced bytes of one more run, and the input size"""
+    best = float('inf')
+    for _ in range(repeats):
+        data, items = setup()
+        start = time.perf_counter()
+        run(data)
+        best = min(best, time.perf_counter() - start)
+
+    data, items = setup()
+    tracemalloc.start()
+    try:
+        run(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, items
+
+def run_suite(seconds_list, rates, repeats):
+    rng = np.random.default_rng(0)
+    hmm = KeystrokeHMM().fit(make_samples(rng, 50, 200, rng.standard_normal((len(KEYS), len(FEATURE_NAMES))), 1.5))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rate in rates:
+            for seconds in seconds_list:
+                path = os.path.join(tmp, f"bench_{rate}_{seconds:g}.wav")
+                make_recording(path, rate, seconds)
+                for stage, setup, run, unit in make_stages(path, hmm):
+                    wall, peak, items = measure(setup, run, repeats)
+                    results[f"{rate}Hz/{seconds:g}s/{stage}"] = {
+                        'stage': stage,
+                        'rate': rate,
+                        'seconds': seconds,
+                        'wall_s': wall,
+                        'items': int(items),
+                        'unit': unit,
+                        'items_per_s': items / wall if wall > 0 else None,
+                        'peak_bytes': int(peak)
+                    }
+                    print(f"{rate:>6} {seconds:>6g} {stage:>27} {wall * 1e3:>10.2f} "
+                          f"{items / wall:>14.0f} {unit:<10} {peak / 2 ** 20:>9.2f}", flush=True)
+    return results
+
+def compare(baseline, results, time_tolerance, memory_tolerance):
+    """
+    Stage-by-stage comparison with a baseline results file
+
+    Returns:
+        List of (case, metric, baseline value, new value, relative change)
+        for every metric worse than its tolerance
+    """
+    regressions = []
+    for case, new in results.items():
+        old = baseline['results'].get(case)
+        if old is None:
+            continue
+        for metric, tolerance in (('wall_s', time_tolerance), ('peak_bytes', memory_tolerance)):
+            if old[metric] > 0:
+                change = new[metric] / old[metric] - 1
+                if change > tolerance:
+                    regressions.append((case, metric, old[metric], new[metric], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', default='5,30,120', help='Comma-separated recording lengths')
+    parser.add_argument('--rates', default='16000,44100,48000', help='Comma-separated sample rates')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--time-tolerance', type=float, default=0.25,
+                        help='Relative wall time increase reported as a regression')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1,
+                        help='Relative peak memory increase reported as a regression')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'rate':>6} {'length':>6} {'stage':>27} {'wall ms':>10} {'throughput':>14} {'':<10} {'peak MiB':>9}")
+    results = run_suite([float(s) for s in args.seconds.split(',')], [int(r) for r in args.rates.split(',')],
+                        args.repeats)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': RESULTS_VERSION,
+                'created_at': time.time(),
+                'environment': {
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'scipy': scipy.__version__,
+                    'machine': platform.machine(),
+                    'processor': platform.processor(),
+                    'cpus': os.cpu_count()
+                },
+                'repeats': args.repeats,
+                'results': results
+            }, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        missing = sorted(set(results) - set(baseline['results']))
+        if missing:
+            print(f"{len(missing)} cases are not in the baseline: {', '.join(missing)}")
+        regressions = compare(baseline, results, args.time_tolerance, args.memory_tolerance)
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+            return
+        print(f"{len(regressions)} regressions against {args.baseline}:")
+        for case, metric, old, new, change in regressions:
+            print(f"  {case:<48} {metric:<10} {old:>12.4g} -> {new:<12.4g} {change:+.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+HMM decoding speed and accuracy across Viterbi beam widths
+
+Fits a KeystrokeHMM on synthetic keystroke features drawn from per-key
+Gaussians along random texts, then decodes a held-out sequence with exact
+Viterbi and with each beam width, first with the HMM's learned bigram
+transitions and then with a character n-gram language model trained on a
+separate synthetic corpus. Reports decode time, keys per second, agreement
+with the exact path and key accuracy, plus the time of the forward-backward
+pass that produces the confidence scores.
+
+Usage:
+    python -m benchmarks.bench_viterbi [--keystrokes 1000] [--beams 32,16,8,4,2] [--order 5] [--repeats 5]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from hmm_decoding import viterbi, forward_backward
+from language_model import CharNGramLM
+from ml_models import KEYS, FEATURE_NAMES, KeystrokeHMM
+
+WORDS = ("the quick brown fox jumps over lazy dog keyboard acoustic sound "
+         "typing password 2024 hello world, what? yes! re-run test_case").split()
+
+def make_text(rng, length):
+    text = ''
+    while len(text) < length:
+        text += rng.choice(WORDS) + ' '
+    return text[:length]
+
+def make_samples(rng, n_samples, n_keystrokes, means, noise):
+    """(audio_data, text) pairs whose segment features are drawn around each key's mean"""
+    samples = []
+    for _ in range(n_samples):
+        text = make_text(rng, n_keystrokes)
+        states = np.array([KEYS.index(c) for c in text])
+        features = means[states] + noise * rng.standard_normal((len(states), means.shape[1]))
+        samples.append(({'segment_features': features}, text))
+    return samples
+
+def best_time(func, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keystrokes', type=int, default=1000)
+    parser.add_argument('--beams', default='32,16,8,4,2',
+                        help='Comma-separated beam widths to measure')
+    parser.add_argument('--order', type=int, default=5, help='Language model order')
+    parser.add_argument('--noise', type=float, default=1.5,
+                        help='Feature noise relative to the spread of the key means')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = np.random.default_rng(0)
+    means = rng.standard_normal((len(KEYS), len(FEATURE_NAMES)))
+    hmm = KeystrokeHMM().fit(make_samples(rng, 50, 200, means, args.noise))
+    (test, text), = make_samples(rng, 1, args.keystrokes, means, args.noise)
+    truth = np.array([KEYS.index(c) for c in text])
+
+    params = hmm.parameters
+    emissions = hmm.emission_log_likelihood(test['segment_features'])
+    language_model = CharNGramLM.train((make_text(rng, 200) for _ in range(500)), order=args.order)
+    beams = [None] + [int(b) for b in args.beams.split(',')]
+
+    print(f"{args.keystrokes} keystrokes, {len(KEYS)} keys")
+    for name, log_start, transitions in (
+            ('learned bigram transitions', params['log_start'], params['log_transitions']),
+            (f"{args.order}-gram language model", language_model.log_start(), language_model)):
+        decode = lambda beam: viterbi(log_start, transitions, emissions, beam_width=beam)
+        print(f"\n{name}")
+        print(f"{'beam':>6} {'time (ms)':>10} {'keys/s':>10} {'= exact':>8} {'accuracy':>9}")
+        _, (exact, _) = best_time(lambda: decode(None), 1)
+        for beam in beams:
+            elapsed, (path, _) = best_time(lambda: decode(beam), args.repeats)
+            label = 'exact' if beam is None else str(beam)
+            print(f"{label:>6} {elapsed * 1e3:>10.2f} {args.keystrokes / elapsed:>10.0f} "
+                  f"{np.mean(path == exact):>8.1%} {np.mean(path == truth):>9.1%}")
+
+    elapsed, _ = best_time(lambda: forward_backward(params['log_start'], params['log_transitions'], emissions),
+                           args.repeats)
+    print(f"\nforward-backward posteriors: {elapsed * 1e3:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+import numpy as np
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Inputs run through the network at once by Sequential.predict
+DEFAULT_BATCH_SIZE = 8
+
+# Size of the im2col tile a convolution gathers and multiplies at a time; small
+# enough to stay in cache between the gather and the GEMM
+COL_TILE_BYTES = 1 << 20
+
+class Layer:
+    """
+    Base class of the inference layers
+
+    Activations are NHWC float32. build() fixes the per-example input shape
+    and returns the output shape; allocate() returns the scratch buffers
+    for a batch size, and forward() writes the layer output into them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.input_shape = None
+        self.output_shape = None
+
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        self.output_shape = self.input_shape
+        return self.output_shape
+
+    def weights(self):
+        """Named parameter arrays (empty for layers without parameters)"""
+        return {}
+
+    def allocate(self, batch_size):
+        return {'out': np.empty((batch_size,) + self.output_shape, dtype=np.float32)}
+
+    def forward(self, x, buffers):
+        raise NotImplementedError
+
+def _activate(y, activation):
+    if activation == 'relu':
+        np.maximum(y, 0, out=y)
+    elif activation == 'softmax':
+        y -= y.max(axis=-1, keepdims=True)
+        np.exp(y, out=y)
+        y /= y.sum(axis=-1, keepdims=True)
+    elif activation is not None:
+        raise ValueError(f"Unknown activation: {activation}")
+    return y
+
+class Conv2D(Layer):
+    """
+    2-D convolution as GEMMs over im2col tiles
+
+    For a block of output rows of one input, the input windows are gathered
+    (im2col) into a preallocated (positions, kernel_h * kernel_w * channels)
+    matrix of at most COL_TILE_BYTES, which is multiplied by the
+    (kernel_h * kernel_w * channels, filters) kernel straight into the
+    output buffer.
+    """
+
+    def __init__(self, name, filters, kernel_size=3, strides=1, padding='same', activation='relu'):
+        super().__init__(name)
+        self.filters = filters
+        self.kernel_size = kernel_size
+        self.strides = strides
+        self.padding = padding
+        self.activation = activation
+
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        height, width, channels = self.input_shape
+        k, s = self.kernel_size, self.strides
+        self.pad = (k - 1) // 2 if self.padding == 'same' else 0
+        out_height = (height + 2 * self.pad - k) // s + 1
+        out_width = (width + 2 * self.pad - k) // s + 1
+        self.output_shape = (out_height, out_width, self.filters)
+        self.tile_rows = int(np.clip(COL_TILE_BYTES // (out_width * k * k * channels * 4), 1, out_height))
+        # He initialization; real weights are loaded with Sequential.load_weights
+        fan_in = k * k * channels
+        self.kernel = (rng.standard_normal((k, k, channels, self.filters)) * np.sqrt(2.0 / fan_in)).astype(np.float32)
+        self.bias = np.zeros(self.filters, dtype=np.float32)
+        return self.output_shape
+
+    def weights(self):
+        return {'kernel': self.kernel, 'bias': self.bias}
+
+    def allocate(self, batch_size):
+        height, width, channels = self.input_shape
+        _, out_width, _ = self.output_shape
+        k = self.kernel_size
+        return {
+            'padded': np.zeros((batch_size, height + 2 * self.pad, width + 2 * self.pad, channels), dtype=np.float32),
+            'cols': np.empty((self.tile_rows * out_width, k * k * channels), dtype=np.float32),
+            'out': np.empty((batch_size,) + self.output_shape, dtype=np.float32)
+        }
+
+    def forward(self, x, buffers):
+        n = len(x)
+        height, width, channels = self.input_shape
+        out_height, out_width, _ = self.output_shape
+        k, s, p = self.kernel_size, self.strides, self.pad
+
+        padded = buffers['padded'][:n]
+        # The border stays zero from allocation; only the interior is rewritten
+        padded[:, p:p + height, p:p + width] = x
+        windows = np.lib.stride_tricks.sliding_window_view(padded, (k, k), axis=(1, 2))
+        # (n, oh, ow, C, kh, kw) -> (n, oh, ow, kh, kw, C) to match the kernel layout
+        windows = windows[:, ::s, ::s][:, :out_height, :out_width].transpose(0, 1, 2, 4, 5, 3)
+        kernel = self.kernel.reshape(-1, self.filters)
+
+        out = buffers['out'][:n]
+        for i in range(n):
+            for row in range(0, out_height, self.tile_rows):
+                rows = min(self.tile_rows, out_height - row)
+                cols = buffers['cols'][:rows * out_width]
+                np.copyto(cols.reshape(rows, out_width, k, k, channels), windows[i, row:row + rows])
+                np.matmul(cols, kernel, out=out[i, row:row + rows].reshape(-1, self.filters))
+        out += self.bias
+        return _activate(out, self.activation)
+
+class MaxPool2D(Layer):
+    """Non-overlapping max pooling (trailing rows/columns that do not fill a window are dropped)"""
+
+    def __init__(self, name, pool_size=2):
+        super().__init__(name)
+        self.pool_size = pool_size
+
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        height, width, channels = self.input_shape
+        self.output_shape = (height // self.pool_size, width // self.pool_size, channels)
+        return self.output_shape
+
+    def forward(self, x, buffers):
+        n = len(x)
+        out_height, out_width, channels = self.output_shape
+        ps = self.pool_size
+        blocks = x[:, :out_height * ps, :out_width * ps].reshape(n, out_height, ps, out_width, ps, channels)
+        out = buffers['out'][:n]
+        np.max(blocks, axis=(2, 4), out=out)
+        return out
+
+class GlobalAveragePooling2D(Layer):
+    """Mean over the spatial axes"""
+
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        self.output_shape = (self.input_shape[-1],)
+        return self.output_shape
+
+    def forward(self, x, buffers):
+        out = buffers['out'][:len(x)]
+        np.mean(x, axis=(1, 2), out=out)
+        return out
+
+class Flatten(Layer):
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        self.output_shape = (int(np.prod(self.input_shape)),)
+        return self.output_shape
+
+    def allocate(self, batch_size):
+        return {}
+
+    def forward(self, x, buffers):
+        return x.reshape(len(x), -1)
+
+class Dense(Layer):
+    def __init__(self, name, units, activation='relu'):
+        super().__init__(name)
+        self.units = units
+        self.activation = activation
+
+    def build(self, input_shape, rng):
+        self.input_shape = tuple(input_shape)
+        fan_in = self.input_shape[0]
+        self.output_shape = (self.units,)
+        self.kernel = (rng.standard_normal((fan_in, self.units)) * np.sqrt(2.0 / fan_in)).astype(np.float32)
+        self.bias = np.zeros(self.units, dtype=np.float32)
+        return self.output_shape
+
+    def weights(self):
+        return {'kernel': self.kernel, 'bias': self.bias}
+
+    def forward(self, x, buffers):
+        out = buffers['out'][:len(x)]
+        np.matmul(x, self.kernel, out=out)
+        out += self.bias
+        return _activate(out, self.activation)
+
+class Sequential:
+    """
+    Feed-forward network of layers, run in float32 batches
+
+    Scratch buffers for every layer are allocated once per batch size and
+    reused across calls. They are kept per thread, so one network can serve
+    concurrent requests.
+    """
+
+    def __init__(self, name, input_shape, layers, seed=0):
+        """
+        Args:
+            name: Model name
+            input_shape: Shape of one input, e.g. (height, width, channels)
+            layers: Layers in order; names must be unique
+            seed: Seed of the initial weights
+        """
+        self.name = name
+        self.input_shape = tuple(input_shape)
+        self.layers = layers
+        self._local = threading.local()
+        rng = np.random.default_rng(seed)
+        shape = self.input_shape
+        for layer in layers:
+            shape = layer.build(shape, rng)
+        self.output_shape = shape
+
+    def layer_names(self):
+        return [layer.name for layer in self.layers]
+
+    def _buffers(self, batch_size):
+        cached = getattr(self._local, 'buffers', None)
+        if cached is None or cached[0] < batch_size:
+            cached = (batch_size, [layer.allocate(batch_size) for layer in self.layers])
+            self._local.buffers = cached
+        return cached[1]
+
+    def _run(self, x, output_layer):
+        buffers = self._buffers(len(x))
+        for layer, layer_buffers in zip(self.layers, buffers):
+            x = layer.forward(x, layer_buffers)
+            if layer.name == output_layer:
+                break
+        return x
+
+    def predict(self, X, batch_size=DEFAULT_BATCH_SIZE, layer=None):
+        """
+        Run the network
+
+        Args:
+            X: Inputs of shape (n,) + input_shape
+            batch_size: Inputs run through the network at once
+            layer: Name of the layer whose activations are returned (the last one if None)
+
+        Returns:
+            Float32 array of shape (n,) + that layer's output shape
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected inputs of shape {self.input_shape}, got {X.shape[1:]}")
+        if layer is not None and layer not in self.layer_names():
+            raise ValueError(f"Unknown layer: {layer}")
+
+        output_layer = layer or self.layers[-1].name
+        shape = next(l.output_shape for l in self.layers if l.name == output_layer)
+        outputs = np.empty((len(X),) + shape, dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            outputs[start:start + len(batch)] = self._run(batch, output_layer)
+        return outputs
+
+    def embed(self, X, layer, batch_size=DEFAULT_BATCH_SIZE):
+        """Activations of an intermediate layer, flattened to (n, features)"""
+        return self.predict(X, batch_size=batch_size, layer=layer).reshape(len(X), -1)
+
+    def get_parameters(self):
+        """Summary of the architecture for storing with a TrainedModel record"""
+        convolutions = [layer for layer in self.layers if isinstance(layer, Conv2D)]
+        return {
+            "input_shape": list(self.input_shape),
+            "layers": [f"{type(layer).__name__}:{layer.name}" for layer in self.layers],
+            "filters": [layer.filters for layer in convolutions],
+            "kernel_size": convolutions[0].kernel_size if convolutions else None,
+            "activation": "relu",
+            "parameters": int(sum(value.size for value in self.get_weights().values()))
+        }
+
+    def get_weights(self):
+        return {f"{layer.name}.{key}": value
+                for layer in self.layers for key, value in layer.weights().items()}
+
+    def set_weights(self, weights):
+        """
+        Replace parameters from a {layer.param: array} mapping
+
+        Raises:
+            ValueError: If a parameter is missing or has the wrong shape
+        """
+        for layer in self.layers:
+            for key, current in layer.weights().items():
+                name = f"{layer.name}.{key}"
+                if name not in weights:
+                    raise ValueError(f"Missing weights for {name}")
+                value = np.asarray(weights[name], dtype=np.float32)
+                if value.shape != current.shape:
+                    raise ValueError(f"Weights for {name} have shape {value.shape}, expected {current.shape}")
+                setattr(layer, key, np.ascontiguousarray(value))
+
+    def save_weights(self, path):
+        np.savez(path, **self.get_weights())
+
+    def load_weights(self, path):
+        with np.load(path, allow_pickle=False) as npz:
+            self.set_weights({name: npz[name] for name in npz.files})
+        logger.info(f"Loaded weights for {self.name} from {path}")
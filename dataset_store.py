@@ -0,0 +1,251 @@
+import numpy as np
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# A new shard is started once the current one would grow past this size
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+
+INDEX_NAME = 'index.jsonl'
+LOCK_NAME = '.lock'
+
+# Arrays stored for every sample, with their shard file suffix and dtype
+SAMPLE_ARRAYS = {
+    'waveform': ('wave', np.float32),
+    'segment_features': ('feat', np.float32),
+    'segment_bounds': ('bounds', np.int64)
+}
+
+def _parse_header(line):
+    """
+    Generation id of an index from its first line, and where its samples start
+
+    Returns (None, 0) while there is no complete header. An index written
+    before generations were recorded starts with a sample; it is read as
+    generation '' from the beginning.
+    """
+    if not line.endswith(b'\n'):
+        return None, 0
+    header = json.loads(line)
+    if 'generation' not in header:
+        return '', 0
+    return header['generation'], len(line)
+
+class DatasetStore:
+    """
+    Append-only on-disk store of processed training samples
+
+    Waveforms, per-keystroke features and segment bounds are appended to
+    raw shard files, and one JSON line per sample is appended to a compact
+    index (sample id, ground truth, sample rate, shard and offsets). Reads
+    memory-map the shards, so a sample's arrays are only paged in when used
+    and worker memory does not grow with the corpus.
+
+    Several processes can share a directory: appends are serialized with a
+    file lock, and each process picks up samples written by the others the
+    next time it reads the index. The first line of the index holds a
+    generation id that clear() replaces, so a process notices that another
+    one cleared the store even if the new index has grown past its read
+    position.
+    """
+
+    def __init__(self, directory, shard_bytes=DEFAULT_SHARD_BYTES):
+        """
+        Args:
+            directory: Directory holding the shards and the index
+            shard_bytes: Size at which a new shard is started
+        """
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._records = []
+        self._index_pos = 0
+        self._generation = None
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _shard_path(self, shard, kind):
+        return self._path(f"shard-{shard:05d}.{kind}")
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        with open(self._path(LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Read index lines appended since the last call, by this or another process"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            f = open(self._path(INDEX_NAME), 'rb')
+        except FileNotFoundError:
+            f = None
+        with f or contextlib.nullcontext():
+            # Header and samples are read through one descriptor, so both come from the same index file
+            header = f.readline() if f is not None else b''
+            generation, start = _parse_header(header)
+            if generation != self._generation:
+                # The store was cleared (possibly by another process): start over
+                self._records = []
+                self._index_pos = start
+                self._maps = {}
+                self._generation = generation
+            if generation is None:
+                return
+            f.seek(self._index_pos)
+            data = f.read()
+
+        # Only complete lines; a partially written line is picked up next time
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].splitlines():
+            if line.strip():
+                self._records.append(json.loads(line))
+        self._index_pos += complete
+
+    def _new_index(self):
+        """Replace the index with an empty one of a new generation (caller holds the file lock)"""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps({'generation': uuid.uuid4().hex}).encode('utf-8') + b'\n')
+        os.replace(tmp, self._path(INDEX_NAME))
+
+    def __len__(self):
+        self.refresh()
+        return len(self._records)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _current_shard(self, nbytes):
+        """Shard the next sample goes to (caller holds the file lock)"""
+        shard = max((record['shard'] for record in self._records), default=0)
+        size = sum(os.path.getsize(self._shard_path(shard, kind))
+                   for kind, _ in SAMPLE_ARRAYS.values() if os.path.exists(self._shard_path(shard, kind)))
+        if size > 0 and size + nbytes > self.shard_bytes:
+            shard += 1
+        return shard
+
+    def append(self, audio_data, ground_truth):
+        """
+        Store one processed sample
+
+        Args:
+            audio_data: Dictionary with waveform, sr, duration and optionally
+                features, segment_features and segment_bounds (as from feature_cache.analyze_audio)
+            ground_truth: Typed text
+
+        Returns:
+            Sample id (its position in the store)
+        """
+        try:
+            arrays = {
+                name: np.ascontiguousarray(audio_data[name], dtype=dtype)
+                for name, (_, dtype) in SAMPLE_ARRAYS.items() if name in audio_data
+            }
+            nbytes = sum(array.nbytes for array in arrays.values())
+
+            with self._lock, self._file_lock():
+                if not os.path.exists(self._path(INDEX_NAME)):
+                    self._new_index()
+                self._refresh()
+                shard = self._current_shard(nbytes)
+                record = {
+                    'id': len(self._records),
+                    'ground_truth': ground_truth,
+                    'sr': int(audio_data['sr']),
+                    'duration': float(audio_data['duration']),
+                    'shard': shard
+                }
+                if 'features' in audio_data:
+                    record['features'] = np.asarray(audio_data['features'], dtype=np.float64).tolist()
+
+                # Data goes to the shards before the index line that refers to it
+                for name, array in arrays.items():
+                    kind, _ = SAMPLE_ARRAYS[name]
+                    with open(self._shard_path(shard, kind), 'ab') as f:
+                        record[name] = {'offset': f.tell(), 'shape': list(array.shape)}
+                        f.write(array.tobytes())
+                with open(self._path(INDEX_NAME), 'ab') as f:
+                    f.write(json.dumps(record).encode('utf-8') + b'\n')
+                self._refresh()
+
+            return record['id']
+
+        except Exception as e:
+            logger.error(f"Error storing training sample: {e}")
+            raise
+
+    def extend(self, samples):
+        """Store several (audio_data, ground_truth) pairs"""
+        for audio_data, ground_truth in samples:
+            self.append(audio_data, ground_truth)
+
+    def _array(self, record, name):
+        kind, dtype = SAMPLE_ARRAYS[name]
+        info = record[name]
+        count = int(np.prod(info['shape']))
+        if count == 0:
+            return np.zeros(info['shape'], dtype=dtype)
+
+        path = self._shard_path(record['shard'], kind)
+        end = info['offset'] + count * np.dtype(dtype).itemsize
+        mapped = self._maps.get(path)
+        if mapped is None or len(mapped) < end:
+            # Map the whole shard as it is now; remapped once it has grown past the mapping
+            mapped = np.memmap(path, dtype=np.uint8, mode='r')
+            self._maps[path] = mapped
+        return mapped[info['offset']:end].view(dtype).reshape(info['shape'])
+
+    def __getitem__(self, sample_id):
+        """
+        Lazily loaded sample
+
+        Args:
+            sample_id: Sample id
+
+        Returns:
+            Tuple of (audio_data, ground_truth); the arrays are read-only memory maps
+        """
+        with self._lock:
+            if sample_id >= len(self._records):
+                self._refresh()
+            record = self._records[sample_id]
+            audio_data = {'sr': record['sr'], 'duration': record['duration'], 'sample_id': record['id']}
+            for name in SAMPLE_ARRAYS:
+                if name in record:
+                    audio_data[name] = self._array(record, name)
+            if 'features' in record:
+                audio_data['features'] = np.array(record['features'])
+            return audio_data, record['ground_truth']
+
+    def __iter__(self):
+        for sample_id in range(len(self)):
+            yield self[sample_id]
+
+    def clear(self):
+        """Delete every sample"""
+        with self._lock, self._file_lock():
+            self._maps = {}
+            for name in os.listdir(self.directory):
+                if name.startswith('shard-'):
+                    os.remove(self._path(name))
+            self._new_index()
+            self._refresh()
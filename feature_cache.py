@@ -0,0 +1,353 @@
+import numpy as np
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from analysis_context import AnalysisContext
+from audio_processor import (ANALYSIS_RATE, HIGHPASS_CUTOFF_HZ, HIGHPASS_ORDER, KEYSTROKE_RMS_THRESHOLD,
+                             TRIM_THRESHOLD, audio_digest, process_audio, extract_keystroke_segments)
+from ml_models import FEATURE_VERSION, FEATURE_NPERSEG, FEATURE_HOP, extract_features, extract_features_batch
+from onset_detection import (FRAME_DURATION, HOP_DURATION, PRE_ROLL, THRESHOLD_WINDOW, THRESHOLD_MULTIPLIER,
+                             THRESHOLD_DELTA, MIN_ONSET_INTERVAL, GATE_DURATION, SEGMENT_MIN_DURATION,
+                             SEGMENT_MAX_DURATION)
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Default size of the in-memory tier
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+
+INDEX_NAME = 'index.json'
+LOCK_NAME = '.lock'
+
+def pipeline_fingerprint():
+    """
+    Parameters that determine the cached arrays; any change gives new cache keys
+
+    Returns:
+        JSON-serializable dictionary
+    """
+    return {
+        'analysis_rate': ANALYSIS_RATE,
+        'highpass_cutoff': HIGHPASS_CUTOFF_HZ,
+        'highpass_order': HIGHPASS_ORDER,
+        'trim_threshold': TRIM_THRESHOLD,
+        'normalize': 'peak',
+        'onset_frame': FRAME_DURATION,
+        'onset_hop': HOP_DURATION,
+        'onset_threshold_window': THRESHOLD_WINDOW,
+        'onset_multiplier': THRESHOLD_MULTIPLIER,
+        'onset_delta': THRESHOLD_DELTA,
+        'onset_min_interval': MIN_ONSET_INTERVAL,
+        'onset_rms_threshold': KEYSTROKE_RMS_THRESHOLD,
+        'onset_gate_duration': GATE_DURATION,
+        'pre_roll': PRE_ROLL,
+        'segment_min_duration': SEGMENT_MIN_DURATION,
+        'segment_max_duration': SEGMENT_MAX_DURATION,
+        'feature_version': FEATURE_VERSION,
+        'feature_nperseg': FEATURE_NPERSEG,
+        'feature_hop': FEATURE_HOP
+    }
+
+def cache_key(digest, fingerprint=None):
+    """Cache key combining an audio content digest with a pipeline fingerprint"""
+    fingerprint = pipeline_fingerprint() if fingerprint is None else fingerprint
+    key = hashlib.blake2b(digest_size=20)
+    key.update(digest.encode('ascii'))
+    key.update(json.dumps(fingerprint, sort_keys=True).encode('utf-8'))
+    return key.hexdigest()
+
+def _entry_bytes(arrays):
+    return sum(array.nbytes for array in arrays.values())
+
+class FeatureCache:
+    """
+    Two-tier cache of per-recording arrays keyed by content hash
+
+    The memory tier is an LRU bounded by total array size. The disk tier keeps
+    one .npz file per entry, sharded into subdirectories by key prefix, plus an
+    index of entry sizes used to enforce the optional disk budget. Entries
+    written by other processes are found on disk even if the index has not
+    been reloaded. Writers take a file lock and merge their index with the
+    one on disk, so processes sharing a directory share one disk budget.
+
+    Cached arrays are shared between callers and must not be modified.
+    """
+
+    def __init__(self, directory=None, max_memory_bytes=DEFAULT_MEMORY_BYTES, max_disk_bytes=None):
+        """
+        Args:
+            directory: Directory of the disk tier (None for a memory-only cache)
+            max_memory_bytes: Size limit of the memory tier
+            max_disk_bytes: Size limit of the disk tier (None for no limit)
+        """
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'disk_errors': 0
+        }
+        self._index = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._index = self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def _load_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing or damaged index: rebuild it from the shard directories
+            index = {}
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.npz'):
+                        stat = entry.stat()
+                        index[entry.name[:-4]] = {'bytes': stat.st_size, 'accessed': stat.st_mtime}
+            return index
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.directory, LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_index(self):
+        """Reload the shared index, keeping this process's newer access times (call with the file lock held)"""
+        index = self._load_index()
+        for key, entry in self._index.items():
+            if key in index:
+                index[key]['accessed'] = max(index[key].get('accessed', 0), entry.get('accessed', 0))
+            elif os.path.exists(self._path(key)):
+                # Found on disk by get() but not yet in the shared index
+                index[key] = entry
+        self._index = index
+
+    def _save_index(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, os.path.join(self.directory, INDEX_NAME))
+
+    def _remember(self, key, arrays):
+        """Insert into the memory tier, evicting least recently used entries"""
+        size = _entry_bytes(arrays)
+        if size > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= _entry_bytes(self._memory.pop(key))
+        self._memory[key] = arrays
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= _entry_bytes(evicted)
+            self.counters['memory_evictions'] += 1
+
+    def get(self, key):
+        """
+        Look up an entry
+
+        Args:
+            key: Cache key (see cache_key)
+
+        Returns:
+            Dictionary of numpy arrays, or None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._memory[key]
+
+            if self.directory is not None and os.path.exists(self._path(key)):
+                try:
+                    with np.load(self._path(key), allow_pickle=False) as npz:
+                        arrays = {name: npz[name] for name in npz.files}
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+                    self.counters['disk_errors'] += 1
+                else:
+                    self.counters['disk_hits'] += 1
+                    self._index.setdefault(key, {'bytes': os.path.getsize(self._path(key))})['accessed'] = time.time()
+                    self._remember(key, arrays)
+                    return arrays
+
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, arrays):
+        """
+        Store an entry in both tiers
+
+        Args:
+            key: Cache key (see cache_key)
+            arrays: Dictionary of numpy arrays
+        """
+        with self._lock:
+            self._remember(key, arrays)
+            if self.directory is None:
+                return
+            try:
+                path = self._path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write under a temporary name so readers never load a partial file
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.entry-')
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp, path)
+                with self._file_lock():
+                    self._merge_index()
+                    self._index[key] = {'bytes': os.path.getsize(path), 'accessed': time.time()}
+                    self._evict_disk()
+                    self._save_index()
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key} to disk: {e}")
+                self.counters['disk_errors'] += 1
+
+    def _evict_disk(self):
+        if self.max_disk_bytes is None:
+            return
+        total = sum(entry['bytes'] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k].get('accessed', 0)):
+            if total <= self.max_disk_bytes:
+                break
+            total -= self._index.pop(key)['bytes']
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.counters['disk_evictions'] += 1
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.directory is not None:
+                with self._file_lock():
+                    self._merge_index()
+                    for key in list(self._index):
+                        try:
+                            os.remove(self._path(key))
+                        except FileNotFoundError:
+                            pass
+                    self._index = {}
+                    self._save_index()
+
+    def stats(self):
+        """Hit, miss and eviction counters plus the size of each tier"""
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats.update({
+                'hit_rate': (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._index),
+                'disk_bytes': sum(entry['bytes'] for entry in self._index.values())
+            })
+            return stats
+
+def compute_analysis(source):
+    """
+    Preprocess an audio source and extract its features, without caching
+
+    Args:
+        source: Path, bytes-like buffer, upload or binary file object
+
+    Returns:
+        Dictionary of numpy arrays, in the form stored in a FeatureCache
+    """
+    audio_data = process_audio(source)
+    context = AnalysisContext.from_audio(audio_data)
+    segments = extract_keystroke_segments(context)
+    sr = audio_data['sr']
+    bounds = [[round(segment['start_time'] * sr), round(segment['end_time'] * sr)] for segment in segments]
+    return {
+        'waveform': audio_data['waveform'],
+        'sr': np.array(sr),
+        'duration': np.array(audio_data['duration']),
+        'features': extract_features(context),
+        'segment_bounds': np.array(bounds, dtype=np.int64).reshape(-1, 2),
+        'segment_features': extract_features_batch(segments)
+    }
+
+def analysis_result(arrays):
+    """Audio data dictionary for arrays from compute_analysis or a FeatureCache"""
+    return {
+        'waveform': arrays['waveform'],
+        'sr': int(arrays['sr']),
+        'duration': float(arrays['duration']),
+        'features': arrays['features'],
+        'segment_bounds': arrays['segment_bounds'],
+        'segment_features': arrays['segment_features']
+    }
+
+def lookup_analysis(source, cache):
+    """
+    Find the cached analysis of an audio source
+
+    Args:
+        source: Path, bytes-like buffer, upload or binary file object
+        cache: FeatureCache to consult (None disables caching)
+
+    Returns:
+        Tuple of (cache key or None if the source cannot be cached, cached arrays or None)
+    """
+    digest = audio_digest(source) if cache is not None else None
+    key = cache_key(digest) if digest is not None else None
+    arrays = cache.get(key) if key is not None else None
+    if arrays is not None:
+        logger.debug(f"Feature cache hit for {key}")
+    return key, arrays
+
+def analyze_audio(source, cache=None):
+    """
+    Preprocess an audio source and extract its features, reusing cached results
+
+    Args:
+        source: Path, bytes-like buffer, upload or binary file object
+        cache: FeatureCache to consult (None disables caching)
+
+    Returns:
+        Audio data dictionary as from process_audio, plus 'features' (whole
+        recording feature vector), 'segment_bounds' ((N, 2) sample indices of the
+        keystroke segments) and 'segment_features' ((N, F) float32)
+    """
+    try:
+        key, arrays = lookup_analysis(source, cache)
+        if arrays is None:
+            arrays = compute_analysis(source)
+            if key is not None:
+                cache.put(key, arrays)
+
+        return analysis_result(arrays)
+
+    except Exception as e:
+        logger.error(f"Error analyzing audio: {e}")
+        raise
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn is started from this directory
+
+Training jobs (job_queue.JobQueue) and live streaming sessions
+(streaming.StreamingSessions) are held in the memory of the process that
+accepted them, so /jobs/<id> and every chunk of a stream must reach that
+process. The app is therefore served by exactly one worker process, which
+handles concurrent requests with threads. Starting it with more workers
+fails instead of serving requests that would randomly 404.
+"""
+import os
+
+workers = 1
+
+# Concurrent requests of the single worker (they also fill the prediction micro-batches)
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+def on_starting(server):
+    if server.cfg.workers != 1:
+        raise RuntimeError(f"The app keeps jobs and streaming sessions in process memory and must run with "
+                           f"one worker, not {server.cfg.workers}; raise GUNICORN_THREADS for more concurrency")
+
+def nworkers_changed(server, new_value, old_value):
+    # Worker count changed at runtime (TTIN/TTOU signals): go back to one worker
+    if new_value != 1:
+        server.log.error(f"Ignoring the change to {new_value} workers; the app must run with one worker")
+        server.num_workers = 1
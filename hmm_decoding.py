@@ -0,0 +1,346 @@
+import numpy as np
+import collections
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def _viterbi_step(log_transitions, contextual, pruned, beam_width, columns, scores, contexts, log_emissions):
+    """One step of the Viterbi recursion; returns (backpointers, scores, contexts)"""
+    if pruned:
+        beam = np.argpartition(scores, -beam_width)[-beam_width:]
+        previous = scores[beam]
+    else:
+        beam = columns
+        previous = scores
+    if contextual:
+        rows = log_transitions.log_transitions(contexts[beam])
+    else:
+        rows = log_transitions[beam] if pruned else log_transitions
+    candidates = previous[:, np.newaxis] + rows
+    best = candidates.argmax(axis=0)
+    backpointers = beam[best] if pruned else best
+    scores = candidates[best, columns] + log_emissions
+    if contextual:
+        contexts = log_transitions.next_context(contexts[backpointers], columns)
+    return backpointers, scores, contexts
+
+def viterbi(log_start, log_transitions, log_emissions, beam_width=None):
+    """
+    Most likely state sequence of an HMM, in log space
+
+    Each step is one max-plus product of the (K,) path scores with the
+    (K, K) transition matrix. With a beam, only the beam_width best states
+    of the previous step are extended, so a step costs (beam_width, K)
+    instead of (K, K); the result is then approximate.
+
+    The transitions can also come from a context model such as
+    language_model.CharNGramLM, which provides initial_context(),
+    next_context(contexts, states) and log_transitions(contexts). Every
+    state then carries the context of the best path ending in it, and each
+    step scores the extended states' rows for their own contexts, so a
+    longer history than the previous state shapes the transitions while the
+    search stays over K states.
+
+    Args:
+        log_start: (K,) log initial state probabilities
+        log_transitions: (K, K) log transition probabilities, from row to
+            column, or a context model
+        log_emissions: (T, K) log likelihood of each observation under each state
+        beam_width: Number of states kept per step (None or >= K for exact decoding)
+
+    Returns:
+        Tuple of (path as a (T,) int64 array, log probability of the path)
+    """
+    log_emissions = np.asarray(log_emissions, dtype=np.float64)
+    n_steps, n_states = log_emissions.shape
+    if n_steps == 0:
+        return np.zeros(0, dtype=np.int64), 0.0
+
+    contextual = hasattr(log_transitions, 'log_transitions')
+    if not contextual:
+        log_transitions = np.asarray(log_transitions, dtype=np.float64)
+    pruned = beam_width is not None and 0 < beam_width < n_states
+    columns = np.arange(n_states)
+    backpointers = np.empty((n_steps, n_states), dtype=np.int64)
+    scores = log_start + log_emissions[0]
+    contexts = log_transitions.next_context(log_transitions.initial_context(), columns) if contextual else None
+
+    for t in range(1, n_steps):
+        backpointers[t], scores, contexts = _viterbi_step(log_transitions, contextual, pruned, beam_width, columns,
+                                                          scores, contexts, log_emissions[t])
+
+    path = np.empty(n_steps, dtype=np.int64)
+    path[-1] = scores.argmax()
+    for t in range(n_steps - 1, 0, -1):
+        path[t - 1] = backpointers[t, path[t]]
+    return path, float(scores[path[-1]])
+
+def forward_backward(log_start, log_transitions, log_emissions):
+    """
+    Posterior probability of every state at every step
+
+    Runs the scaled forward and backward recursions: emissions are shifted
+    by their per-step maximum before exponentiating and each step is
+    renormalized, which is equivalent to the log-space recursions without a
+    logsumexp per step.
+
+    Args:
+        log_start: (K,) log initial state probabilities
+        log_transitions: (K, K) log transition probabilities, from row to column
+        log_emissions: (T, K) log likelihood of each observation under each state
+
+    Returns:
+        Tuple of ((T, K) posteriors, each row summing to 1, and the log
+        likelihood of the observations)
+    """
+    log_emissions = np.asarray(log_emissions, dtype=np.float64)
+    n_steps, n_states = log_emissions.shape
+    if n_steps == 0:
+        return np.zeros((0, n_states)), 0.0
+
+    shift = log_emissions.max(axis=1, keepdims=True)
+    emissions = np.exp(log_emissions - shift)
+    transitions = np.exp(np.asarray(log_transitions, dtype=np.float64))
+    start = np.exp(np.asarray(log_start, dtype=np.float64))
+
+    alpha = np.empty((n_steps, n_states))
+    scale = np.empty(n_steps)
+    alpha[0] = start * emissions[0]
+    scale[0] = alpha[0].sum()
+    alpha[0] /= scale[0]
+    for t in range(1, n_steps):
+        np.dot(alpha[t - 1], transitions, out=alpha[t])
+        alpha[t] *= emissions[t]
+        scale[t] = alpha[t].sum()
+        alpha[t] /= scale[t]
+
+    beta = np.empty((n_steps, n_states))
+    beta[-1] = 1.0
+    for t in range(n_steps - 1, 0, -1):
+        np.dot(transitions, emissions[t] * beta[t], out=beta[t - 1])
+        beta[t - 1] /= scale[t]
+
+    posteriors = alpha * beta
+    posteriors /= posteriors.sum(axis=1, keepdims=True)
+    log_likelihood = float(np.log(scale).sum() + shift.sum())
+    return posteriors, log_likelihood
+
+def _pad(log_emissions):
+    """Stack (T_i, K) arrays into a zero-padded (B, T, K) array, with their lengths"""
+    lengths = np.array([len(e) for e in log_emissions], dtype=np.int64)
+    n_states = log_emissions[0].shape[1]
+    padded = np.zeros((len(log_emissions), max(lengths.max(), 1), n_states))
+    for i, emissions in enumerate(log_emissions):
+        padded[i, :len(emissions)] = emissions
+    return padded, lengths
+
+def viterbi_batch(log_start, log_transitions, log_emissions, beam_width=None):
+    """
+    Viterbi over several sequences at once
+
+    The sequences advance together, one (sequences, K, K) max-plus product
+    per step, so the per-step overhead of the recursion is paid once for
+    the whole batch. Each path equals viterbi() of its sequence.
+
+    Args:
+        log_start: (K,) log initial state probabilities
+        log_transitions: (K, K) log transition probabilities or a context model (see viterbi)
+        log_emissions: List of (T_i, K) arrays
+        beam_width: Number of states kept per step (None or >= K for exact decoding)
+
+    Returns:
+        List of (path, log probability) tuples, one per sequence
+    """
+    if len(log_emissions) == 0:
+        return []
+    emissions, lengths = _pad([np.asarray(e, dtype=np.float64) for e in log_emissions])
+    n_sequences, n_steps, n_states = emissions.shape
+
+    contextual = hasattr(log_transitions, 'log_transitions')
+    if not contextual:
+        log_transitions = np.asarray(log_transitions, dtype=np.float64)
+    pruned = beam_width is not None and 0 < beam_width < n_states
+    columns = np.arange(n_states)
+    backpointers = np.zeros((n_sequences, n_steps, n_states), dtype=np.int64)
+    scores = log_start + emissions[:, 0]
+    if contextual:
+        initial = log_transitions.next_context(log_transitions.initial_context(), columns)
+        contexts = np.tile(initial, (n_sequences, 1))
+
+    for t in range(1, n_steps):
+        active = np.flatnonzero(lengths > t)
+        current = scores[active]
+        if pruned:
+            beam = np.argpartition(current, -beam_width, axis=1)[:, -beam_width:]
+            previous = np.take_along_axis(current, beam, axis=1)
+        else:
+            beam = np.broadcast_to(columns, current.shape)
+            previous = current
+        if contextual:
+            rows = log_transitions.log_transitions(np.take_along_axis(contexts[active], beam, axis=1).ravel())
+            rows = rows.reshape(len(active), beam.shape[1], n_states)
+        else:
+            rows = log_transitions[beam] if pruned else log_transitions
+        candidates = previous[:, :, np.newaxis] + rows
+        best = candidates.argmax(axis=1)
+        chosen = np.take_along_axis(beam, best, axis=1)
+        backpointers[active, t] = chosen
+        scores[active] = np.take_along_axis(candidates, best[:, np.newaxis, :], axis=1)[:, 0] + emissions[active, t]
+        if contextual:
+            contexts[active] = log_transitions.next_context(np.take_along_axis(contexts[active], chosen, axis=1),
+                                                            columns)
+
+    # Backtrack all sequences together, each starting from its own last step
+    paths = np.zeros((n_sequences, n_steps), dtype=np.int64)
+    sequences = np.arange(n_sequences)
+    last = np.maximum(lengths - 1, 0)
+    paths[sequences, last] = scores.argmax(axis=1)
+    for t in range(n_steps - 1, 0, -1):
+        rows = np.flatnonzero(lengths > t)
+        paths[rows, t - 1] = backpointers[rows, t, paths[rows, t]]
+
+    best_scores = scores[sequences, paths[sequences, last]]
+    return [(paths[i, :lengths[i]], float(best_scores[i]) if lengths[i] else 0.0) for i in range(n_sequences)]
+
+def forward_backward_batch(log_start, log_transitions, log_emissions):
+    """
+    forward_backward over several sequences at once
+
+    Args:
+        log_start: (K,) log initial state probabilities
+        log_transitions: (K, K) log transition probabilities
+        log_emissions: List of (T_i, K) arrays
+
+    Returns:
+        List of ((T_i, K) posteriors, log likelihood) tuples, one per sequence
+    """
+    if len(log_emissions) == 0:
+        return []
+    log_emissions, lengths = _pad([np.asarray(e, dtype=np.float64) for e in log_emissions])
+    n_sequences, n_steps, n_states = log_emissions.shape
+
+    # Padding steps have emissions of 1 and never reach the results
+    shift = log_emissions.max(axis=2, keepdims=True)
+    emissions = np.exp(log_emissions - shift)
+    transitions = np.exp(np.asarray(log_transitions, dtype=np.float64))
+    start = np.exp(np.asarray(log_start, dtype=np.float64))
+
+    alpha = np.empty((n_sequences, n_steps, n_states))
+    scale = np.empty((n_sequences, n_steps))
+    alpha[:, 0] = start * emissions[:, 0]
+    scale[:, 0] = alpha[:, 0].sum(axis=1)
+    alpha[:, 0] /= scale[:, 0, np.newaxis]
+    for t in range(1, n_steps):
+        np.matmul(alpha[:, t - 1], transitions, out=alpha[:, t])
+        alpha[:, t] *= emissions[:, t]
+        scale[:, t] = alpha[:, t].sum(axis=1)
+        alpha[:, t] /= scale[:, t, np.newaxis]
+
+    beta = np.ones((n_sequences, n_steps, n_states))
+    for t in range(n_steps - 1, 0, -1):
+        np.matmul(emissions[:, t] * beta[:, t], transitions.T, out=beta[:, t - 1])
+        beta[:, t - 1] /= scale[:, t, np.newaxis]
+        # Each sequence's recursion starts from ones at its own last step
+        beta[lengths - 1 == t - 1, t - 1] = 1.0
+
+    posteriors = alpha * beta
+    posteriors /= posteriors.sum(axis=2, keepdims=True)
+    results = []
+    for i, length in enumerate(lengths):
+        log_likelihood = float(np.log(scale[i, :length]).sum() + shift[i, :length].sum())
+        results.append((posteriors[i, :length], log_likelihood))
+    return results
+
+class OnlineViterbi:
+    """
+    Viterbi decoding of an observation stream with a fixed decision lag
+
+    Keeps the path scores (and, with a context model, the per-state
+    contexts) plus the backpointers of at most lag undecided steps. After
+    each observation the best current path is traced back; once more than
+    lag steps are undecided, the state of the oldest one on that path is
+    committed and its backpointers dropped, so memory does not grow with the
+    length of the stream. A committed state is final; the undecided ones
+    (tentative()) can still change with later observations. With a long
+    enough lag the committed states almost always equal those of viterbi()
+    over the whole stream.
+    """
+
+    def __init__(self, log_start, log_transitions, beam_width=None, lag=32):
+        """
+        Args:
+            log_start: (K,) log initial state probabilities
+            log_transitions: (K, K) log transition probabilities or a context model (see viterbi)
+            beam_width: Number of states kept per step (None or >= K for exact decoding)
+            lag: Undecided steps kept before the oldest one is committed
+        """
+        self.log_start = np.asarray(log_start, dtype=np.float64)
+        self.contextual = hasattr(log_transitions, 'log_transitions')
+        self.log_transitions = (log_transitions if self.contextual
+                                else np.asarray(log_transitions, dtype=np.float64))
+        self.columns = np.arange(len(self.log_start))
+        self.pruned = beam_width is not None and 0 < beam_width < len(self.columns)
+        self.beam_width = beam_width
+        self.lag = max(1, lag)
+        self.scores = None
+        self.contexts = None
+        # Backpointers of the undecided steps after the first one, oldest first
+        self.backpointers = collections.deque()
+        self.committed = 0  # Steps committed so far
+
+    def _trace(self):
+        """States of the best path over the undecided steps, oldest first"""
+        path = np.empty(len(self.backpointers) + 1, dtype=np.int64)
+        path[-1] = self.scores.argmax()
+        for i, row in enumerate(reversed(self.backpointers)):
+            path[-2 - i] = row[path[-1 - i]]
+        return path
+
+    def push(self, log_emissions):
+        """
+        Add observations
+
+        Args:
+            log_emissions: (n, K) log likelihoods of the new observations
+
+        Returns:
+            int64 array of the states committed by these observations, in order
+        """
+        committed = []
+        for row in np.asarray(log_emissions, dtype=np.float64):
+            if self.scores is None:
+                self.scores = self.log_start + row
+                if self.contextual:
+                    self.contexts = self.log_transitions.next_context(self.log_transitions.initial_context(),
+                                                                      self.columns)
+            else:
+                backpointers, self.scores, self.contexts = _viterbi_step(
+                    self.log_transitions, self.contextual, self.pruned, self.beam_width, self.columns,
+                    self.scores, self.contexts, row)
+                self.backpointers.append(backpointers)
+            if len(self.backpointers) >= self.lag:
+                committed.append(self._trace()[0])
+                self.backpointers.popleft()
+                self.committed += 1
+        return np.array(committed, dtype=np.int64)
+
+    def tentative(self):
+        """States of the undecided steps on the current best path"""
+        if self.scores is None:
+            return np.zeros(0, dtype=np.int64)
+        return self._trace()
+
+    def flush(self):
+        """
+        End of stream: commit every undecided step
+
+        Returns:
+            int64 array of the newly committed states
+        """
+        path = self.tentative()
+        self.committed += len(path)
+        self.scores = self.contexts = None
+        self.backpointers.clear()
+        return path
@@ -0,0 +1,242 @@
+import collections
+import logging
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Finished jobs kept for status queries before the oldest are forgotten
+MAX_FINISHED_JOBS = 200
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested"""
+
+class Job:
+    """
+    A unit of background work with stage-by-stage progress
+
+    The job function receives the Job and reports progress through
+    set_stage and advance. It calls check_cancelled (advance does so too)
+    at points where it can stop cleanly.
+    """
+
+    def __init__(self, kind, func, args, kwargs, stages, cleanup=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cleanup = cleanup
+        self.status = QUEUED
+        self.stage = None
+        # Ordered {stage: {'done': n, 'total': n}}; totals may be filled in later
+        self.stages = collections.OrderedDict((name, {'done': 0, 'total': 1}) for name in stages)
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage, total=None, check_cancelled=True):
+        """
+        Enter a stage
+
+        Args:
+            stage: Stage name
+            total: Number of steps in the stage, if known
+            check_cancelled: Stop here if cancellation was requested (False for
+                stages that must run once the previous ones have)
+        """
+        if check_cancelled:
+            self.check_cancelled()
+        with self._lock:
+            if self.stage is not None:
+                progress = self.stages[self.stage]
+                progress['done'] = progress['total']
+            self.stage = stage
+            progress = self.stages.setdefault(stage, {'done': 0, 'total': 1})
+            if total is not None:
+                progress['total'] = total
+
+    def advance(self, steps=1):
+        """Record steps completed in the current stage"""
+        with self._lock:
+            progress = self.stages[self.stage]
+            progress['done'] = min(progress['done'] + steps, progress['total'])
+        self.check_cancelled()
+
+    def complete_stage(self):
+        with self._lock:
+            if self.stage is not None:
+                progress = self.stages[self.stage]
+                progress['done'] = progress['total']
+
+    def cancel(self):
+        """Request cancellation; a queued job never starts, a running one stops at its next check"""
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def progress(self):
+        """Overall completion in [0, 1], weighting every stage equally"""
+        with self._lock:
+            if self.status == SUCCEEDED:
+                return 1.0
+            fractions = [p['done'] / p['total'] if p['total'] else 1.0 for p in self.stages.values()]
+            return sum(fractions) / len(fractions) if fractions else 0.0
+
+    def to_dict(self):
+        """JSON-serializable job status"""
+        progress = self.progress
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'stage': self.stage,
+                'stages': [{'name': name, **counts} for name, counts in self.stages.items()],
+                'progress': round(progress, 4),
+                'cancel_requested': self._cancel.is_set(),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+class JobQueue:
+    """
+    In-process background job queue served by a fixed set of worker threads
+
+    Jobs live in the memory of the process that accepted them, so status
+    requests must reach the same process; gunicorn.conf.py refuses to serve
+    the app with more than one worker. No external broker is needed.
+    """
+
+    def __init__(self, workers=1, max_finished=MAX_FINISHED_JOBS):
+        """
+        Args:
+            workers: Number of worker threads (jobs run concurrently up to this number)
+            max_finished: Finished jobs kept for status queries
+        """
+        self.workers = workers
+        self.max_finished = max_finished
+        self._queue = queue.Queue()
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        # Threads start lazily so importing the app does not spawn them
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, func, *args, stages=(), cleanup=None, **kwargs):
+        """
+        Queue func(job, *args, **kwargs) to run in the background
+
+        Args:
+            kind: Short job type name reported in the status
+            func: Job function; its return value (JSON-serializable) becomes the job result
+            stages: Names of the stages the job will go through, for progress reporting
+            cleanup: Called without arguments once the job is finished, whether it
+                succeeded, failed or was cancelled (also before it started), e.g. to
+                release resources held by its arguments
+
+        Returns:
+            The queued Job
+        """
+        job = Job(kind, func, args, kwargs, stages, cleanup)
+        with self._lock:
+            self._ensure_workers()
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._queue.put(job)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def get(self, job_id):
+        """Job with the given id, or None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation of a job; returns the job, or None if it is unknown"""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.cancel()
+            logger.info(f"Cancellation requested for job {job_id}")
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        try:
+            if job.cancel_requested:
+                job.status = CANCELLED
+                logger.info(f"Job {job.id} ({job.kind}) cancelled before it started")
+                return
+
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.result = job.func(job, *job.args, **job.kwargs)
+            job.complete_stage()
+            job.status = SUCCEEDED
+            logger.info(f"Job {job.id} ({job.kind}) succeeded in {time.time() - job.started_at:.2f}s")
+        except JobCancelled:
+            job.status = CANCELLED
+            logger.info(f"Job {job.id} ({job.kind}) cancelled during {job.stage}")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
+            self._release(job)
+
+    def _release(self, job):
+        # Drop references to the inputs (uploaded audio) once the job is done
+        cleanup, job.cleanup = job.cleanup, None
+        job.args = job.kwargs = None
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception as e:
+                logger.error(f"Error cleaning up job {job.id} ({job.kind}): {e}")
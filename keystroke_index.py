@@ -0,0 +1,473 @@
+import numpy as np
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from feature_cache import pipeline_fingerprint
+from ml_models import KEYS, align_keystrokes
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes; an index in another format is rebuilt
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = 'index.json'
+VECTORS_NAME = 'vectors.f32'
+LABELS_NAME = 'labels.i32'
+LOCK_NAME = '.lock'
+
+DEFAULT_K = 8
+DEFAULT_NPROBE = 8
+
+# Below this many vectors there are no inverted lists and every query scans everything
+MIN_IVF_VECTORS = 8192
+
+# Vectors inserted since the lists were laid out are scanned exactly by every
+# query; past this many they are merged into the lists
+MAX_TAIL_VECTORS = 16384
+
+# The k-means centroids are retrained once the index has grown by this factor
+RETRAIN_GROWTH = 2.0
+
+KMEANS_SAMPLE = 65536
+KMEANS_ITERATIONS = 10
+
+# Rows per GEMM block in exact scans and list assignment
+SCAN_BLOCK_ROWS = 65536
+
+def _nearest_centroids(Z, centroids):
+    """Index of the nearest centroid of each row, in GEMM blocks"""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(Z), dtype=np.int64)
+    for start in range(0, len(Z), SCAN_BLOCK_ROWS):
+        block = Z[start:start + SCAN_BLOCK_ROWS]
+        # Row norms do not change the argmin
+        assign[start:start + len(block)] = (centroid_norms - 2 * block @ centroids.T).argmin(axis=1)
+    return assign
+
+def kmeans(Z, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Lloyd's k-means with GEMM distance computations
+
+    Args:
+        Z: (n, dim) float32 points
+        n_clusters: Number of centroids
+        iterations: Lloyd iterations
+        seed: Seed of the initial centroids (random points) and of empty-cluster reseeding
+
+    Returns:
+        (n_clusters, dim) float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = Z[rng.choice(len(Z), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroids(Z, centroids)
+        counts = np.bincount(assign, minlength=n_clusters)
+        sums = np.stack([np.bincount(assign, weights=Z[:, d], minlength=n_clusters)
+                         for d in range(Z.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        # Empty clusters restart from random points
+        centroids[~filled] = Z[rng.choice(len(Z), int((~filled).sum()))]
+    return centroids.astype(np.float32)
+
+def _top_k(distances, ids, k):
+    """Smallest k distances per row, with their ids (ids may be (m,) shared or (q, m))"""
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        ids = ids[part] if ids.ndim == 1 else np.take_along_axis(ids, part, axis=1)
+    elif ids.ndim == 1:
+        ids = np.broadcast_to(ids, distances.shape)
+    return distances, ids
+
+class _Snapshot:
+    """Arrays of one version of the index, replaced as a whole when the index changes"""
+
+    def __init__(self, manifest, raw, labels, layout):
+        self.manifest = manifest
+        self.count = manifest['count']
+        self.labels = labels
+        if layout is None:
+            built = 0
+            center = raw.mean(axis=0) if self.count else np.zeros(raw.shape[1], dtype=np.float32)
+            scale = raw.std(axis=0) if self.count else np.ones(raw.shape[1], dtype=np.float32)
+            self.center = center.astype(np.float32)
+            self.scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        else:
+            built = layout['count']
+            self.center = np.asarray(manifest['center'], dtype=np.float32)
+            self.scale = np.asarray(manifest['scale'], dtype=np.float32)
+        self.layout = layout
+        # Vectors added after the lists were laid out, scanned exactly
+        self.tail = self.standardize(raw[built:self.count])
+        self.tail_norms = np.einsum('ij,ij->i', self.tail, self.tail)
+        self.tail_ids = np.arange(built, self.count, dtype=np.int64)
+
+    def standardize(self, X):
+        return ((np.asarray(X, dtype=np.float32) - self.center) / self.scale).astype(np.float32)
+
+class KeystrokeIndex:
+    """
+    Nearest-neighbour index of labeled training keystrokes
+
+    Every keystroke aligned to a typed character (see
+    ml_models.align_keystrokes) is stored as a float32 feature vector with
+    its key. Vectors are appended to one contiguous raw file, so inserts
+    never rewrite what is stored.
+
+    Distances are Euclidean over standardized features. Exact search scans
+    the stored vectors in blocks, one GEMM per block. The approximate mode
+    is an inverted file (IVF). k-means assigns every vector to one of
+    about sqrt(n) lists, and the lists are laid out contiguously in a
+    memory-mapped array. A query then scans only its nprobe nearest lists.
+    Vectors inserted after the layout are scanned exactly until
+    MAX_TAIL_VECTORS accumulate. They are then merged into the lists. The
+    centroids are retrained once the index has grown by RETRAIN_GROWTH.
+
+    Several processes can share a directory. Writers take a file lock,
+    and a JSON manifest replaced atomically tells readers when to reload.
+    """
+
+    def __init__(self, directory, keys=KEYS):
+        """
+        Args:
+            directory: Directory holding the vectors, labels, manifest and list layouts
+            keys: Key alphabet of the labels
+        """
+        self.directory = directory
+        self.keys = keys
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._seen = None
+        self._snapshot = None
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        with open(self._path(LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path(MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        if (manifest.get('format_version') != FORMAT_VERSION or manifest.get('keys') != self.keys
+                or manifest.get('feature_pipeline') != pipeline_fingerprint()):
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.manifest-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._path(MANIFEST_NAME))
+
+    def _empty_manifest(self, dim=None):
+        return {
+            'format_version': FORMAT_VERSION,
+            'feature_pipeline': pipeline_fingerprint(),
+            'keys': self.keys,
+            'dim': dim,
+            'count': 0,
+            'samples': 0,
+            'layout': None,
+            'center': None,
+            'scale': None
+        }
+
+    def _raw(self, manifest):
+        """Memory-mapped (count, dim) vectors and (count,) labels"""
+        if manifest['count'] == 0:
+            dim = manifest['dim'] or 0
+            return np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int32)
+        vectors = np.memmap(self._path(VECTORS_NAME), dtype=np.float32, mode='r',
+                            shape=(manifest['count'], manifest['dim']))
+        labels = np.memmap(self._path(LABELS_NAME), dtype=np.int32, mode='r', shape=(manifest['count'],))
+        return vectors, labels
+
+    def _stat(self):
+        try:
+            stat = os.stat(self._path(MANIFEST_NAME))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _current(self):
+        """Snapshot of the latest version, reloaded if another writer replaced the manifest"""
+        stat = self._stat()
+        if stat != self._seen or self._snapshot is None:
+            with self._lock:
+                if stat != self._seen or self._snapshot is None:
+                    self._snapshot = self._load()
+                    self._seen = stat
+        return self._snapshot
+
+    def _load(self):
+        manifest = self._read_manifest() or self._empty_manifest()
+        raw, labels = self._raw(manifest)
+        layout = None
+        if manifest['layout'] is not None:
+            directory = self._path(manifest['layout']['name'])
+            layout = dict(manifest['layout'])
+            for name in ('centroids', 'offsets', 'ids', 'vectors', 'norms'):
+                layout[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        return _Snapshot(manifest, raw, labels, layout)
+
+    def __len__(self):
+        return self._current().count
+
+    def _relayout(self, manifest):
+        """Lay the vectors out in inverted lists, retraining k-means if the index has grown enough"""
+        raw, _ = self._raw(manifest)
+        count = manifest['count']
+        layout = manifest['layout']
+        retrain = layout is None or count >= layout['trained_count'] * RETRAIN_GROWTH
+        if retrain:
+            center = raw.mean(axis=0, dtype=np.float64)
+            scale = raw.std(axis=0, dtype=np.float64)
+            manifest['center'] = center.tolist()
+            manifest['scale'] = np.where(scale > 0, scale, 1.0).tolist()
+        center = np.asarray(manifest['center'], dtype=np.float32)
+        scale = np.asarray(manifest['scale'], dtype=np.float32)
+        Z = ((raw - center) / scale).astype(np.float32)
+
+        if retrain:
+            n_lists = int(np.clip(np.sqrt(count), 16, 4096))
+            sample = Z[np.random.default_rng(count).choice(count, min(count, KMEANS_SAMPLE), replace=False)]
+            centroids = kmeans(sample, n_lists, seed=count)
+            trained_count = count
+        else:
+            previous = np.load(self._path(layout['name'], 'centroids.npy'))
+            centroids, n_lists, trained_count = previous, len(previous), layout['trained_count']
+
+        assign = _nearest_centroids(Z, centroids)
+        order = np.argsort(assign, kind='stable')
+        vectors = Z[order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+
+        generation = (layout['generation'] + 1) if layout is not None else 1
+        name = f"layout-{generation:06d}"
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        arrays = {'centroids': centroids, 'offsets': offsets, 'ids': order, 'vectors': vectors,
+                  'norms': np.einsum('ij,ij->i', vectors, vectors)}
+        for array_name, array in arrays.items():
+            np.save(os.path.join(staging, f"{array_name}.npy"), array)
+        os.rename(staging, self._path(name))
+        manifest['layout'] = {'name': name, 'generation': generation, 'count': count, 'n_lists': n_lists,
+                              'trained_count': trained_count}
+        if layout is not None:
+            # Processes still searching the old layout keep their mapped pages
+            shutil.rmtree(self._path(layout['name']), ignore_errors=True)
+        logger.info(f"Laid out {count} keystrokes in {n_lists} lists" + (" (retrained)" if retrain else ""))
+
+    def _add(self, manifest, features, labels):
+        """Append vectors (caller holds the file lock) and update the layout if the tail is full"""
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        labels = np.ascontiguousarray(labels, dtype=np.int32)
+        if len(features) == 0:
+            return
+        if manifest['dim'] is None:
+            manifest['dim'] = int(features.shape[1])
+        elif features.shape[1] != manifest['dim']:
+            raise ValueError(f"Expected {manifest['dim']}-dimensional features, got {features.shape[1]}")
+
+        # Data goes to the files before the manifest that counts it
+        with open(self._path(VECTORS_NAME), 'ab') as f:
+            f.seek(manifest['count'] * manifest['dim'] * 4)
+            f.truncate()
+            f.write(features.tobytes())
+        with open(self._path(LABELS_NAME), 'ab') as f:
+            f.seek(manifest['count'] * 4)
+            f.truncate()
+            f.write(labels.tobytes())
+        manifest['count'] += len(features)
+
+        if manifest['count'] >= MIN_IVF_VECTORS and (
+                manifest['layout'] is None or manifest['count'] - manifest['layout']['count'] > MAX_TAIL_VECTORS):
+            self._relayout(manifest)
+
+    def add(self, features, labels):
+        """
+        Insert labeled keystrokes
+
+        Args:
+            features: (n, dim) keystroke feature vectors
+            labels: (n,) key indices
+        """
+        try:
+            with self._file_lock():
+                manifest = self._read_manifest() or self._reset_files()
+                self._add(manifest, features, labels)
+                self._write_manifest(manifest)
+        except Exception as e:
+            logger.error(f"Error adding keystrokes to the index: {e}")
+            raise
+
+    def sync(self, training_data):
+        """
+        Insert the aligned keystrokes of training samples not indexed yet
+
+        Args:
+            training_data: dataset_store.DatasetStore; samples are indexed in store order
+
+        Returns:
+            Number of keystrokes inserted
+        """
+        try:
+            with self._file_lock():
+                manifest = self._read_manifest()
+                n_samples = len(training_data)
+                if manifest is None or manifest['samples'] > n_samples:
+                    # Another format or feature pipeline, or the store was rebuilt: start over
+                    manifest = self._reset_files()
+                if manifest['samples'] == n_samples:
+                    return 0
+
+                features, labels = [], []
+                for sample_id in range(manifest['samples'], n_samples):
+                    states, segment_features = align_keystrokes(*training_data[sample_id], keys=self.keys)
+                    if segment_features is not None and len(states) > 0:
+                        features.append(segment_features)
+                        labels.append(states)
+                inserted = sum(len(l) for l in labels)
+                if inserted:
+                    self._add(manifest, np.concatenate(features), np.concatenate(labels))
+                manifest['samples'] = n_samples
+                self._write_manifest(manifest)
+
+            logger.info(f"Indexed {inserted} keystrokes; {manifest['count']} in total")
+            return inserted
+
+        except Exception as e:
+            logger.error(f"Error indexing training keystrokes: {e}")
+            raise
+
+    def _reset_files(self):
+        """Delete every stored vector and layout (caller holds the file lock); returns an empty manifest"""
+        for name in os.listdir(self.directory):
+            if name in (VECTORS_NAME, LABELS_NAME, MANIFEST_NAME):
+                os.remove(self._path(name))
+            elif name.startswith('layout-'):
+                shutil.rmtree(self._path(name), ignore_errors=True)
+        return self._empty_manifest()
+
+    def clear(self):
+        """Delete every indexed keystroke"""
+        with self._file_lock():
+            self._write_manifest(self._reset_files())
+
+    def search(self, queries, k=DEFAULT_K, nprobe=DEFAULT_NPROBE, exact=False):
+        """
+        Nearest stored keystrokes of each query
+
+        Args:
+            queries: (q, dim) feature vectors
+            k: Neighbours returned per query
+            nprobe: Inverted lists scanned per query in approximate mode
+            exact: Scan every stored vector instead of the nprobe nearest lists
+
+        Returns:
+            Tuple of (q, k) arrays: squared distances (ascending, inf where
+            fewer than k vectors are stored), row ids (-1 there) and key labels (-1 there)
+        """
+        snapshot = self._current()
+        queries = np.atleast_2d(queries)
+        if snapshot.count == 0:
+            empty = np.full((len(queries), k), -1, dtype=np.int64)
+            return np.full((len(queries), k), np.inf, dtype=np.float32), empty, empty.copy()
+        Z = snapshot.standardize(queries)
+        query_norms = np.einsum('ij,ij->i', Z, Z)
+        parts = []
+
+        layout = snapshot.layout
+        if layout is not None and exact:
+            vectors, norms, ids = layout['vectors'], layout['norms'], layout['ids']
+            for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+                block = slice(start, start + SCAN_BLOCK_ROWS)
+                parts.append(_top_k(norms[block] - 2 * Z @ vectors[block].T, np.asarray(ids[block]), k))
+        elif layout is not None:
+            centroids, offsets = layout['centroids'], layout['offsets']
+            nprobe = min(nprobe, len(centroids))
+            centroid_distances = np.einsum('ij,ij->i', centroids, centroids) - 2 * Z @ centroids.T
+            probes = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+            distances = np.full((len(Z), k), np.inf, dtype=np.float32)
+            found = np.full((len(Z), k), -1, dtype=np.int64)
+            for i, lists in enumerate(probes):
+                rows = np.concatenate([np.arange(offsets[l], offsets[l + 1]) for l in lists])
+                if len(rows) == 0:
+                    continue
+                d, r = _top_k((layout['norms'][rows] - 2 * layout['vectors'][rows] @ Z[i])[np.newaxis],
+                              rows, k)
+                distances[i, :d.shape[1]] = d[0]
+                found[i, :d.shape[1]] = layout['ids'][r[0]]
+            parts.append((distances, found))
+        if len(snapshot.tail):
+            parts.append(_top_k(snapshot.tail_norms - 2 * Z @ snapshot.tail.T, snapshot.tail_ids, k))
+
+        distances = np.concatenate([d for d, _ in parts], axis=1)
+        ids = np.concatenate([np.broadcast_to(i, d.shape) for d, i in parts], axis=1)
+        distances, ids = _top_k(distances, ids, k)
+
+        order = np.argsort(distances, axis=1)
+        distances = np.maximum(np.take_along_axis(distances, order, axis=1) + query_norms[:, np.newaxis], 0)
+        ids = np.take_along_axis(ids, order, axis=1)
+        if distances.shape[1] < k:
+            pad = k - distances.shape[1]
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+        ids = np.where(np.isfinite(distances), ids, -1)
+        labels = np.where(ids >= 0, snapshot.labels[np.maximum(ids, 0)], -1)
+        return distances.astype(np.float32), ids, labels
+
+    def classify(self, queries, k=DEFAULT_K, **search_kwargs):
+        """
+        Key probabilities of each query from its nearest stored keystrokes
+
+        Neighbours vote with weight 1 / (distance + 1); queries without
+        neighbours (empty index) get a uniform distribution.
+
+        Returns:
+            (q, keys) array of probabilities
+        """
+        distances, _, labels = self.search(queries, k=k, **search_kwargs)
+        probs = np.zeros((len(labels), len(self.keys)))
+        valid = labels >= 0
+        rows = np.broadcast_to(np.arange(len(labels))[:, np.newaxis], labels.shape)
+        np.add.at(probs, (rows[valid], labels[valid]), 1.0 / (distances[valid] + 1.0))
+        totals = probs.sum(axis=1, keepdims=True)
+        return np.where(totals > 0, probs / np.where(totals > 0, totals, 1.0), 1.0 / len(self.keys))
+
+    def predict_text(self, features, **search_kwargs):
+        """Most voted key of each keystroke, as text"""
+        if len(features) == 0 or len(self) == 0:
+            return ""
+        return ''.join(self.keys[i] for i in self.classify(features, **search_kwargs).argmax(axis=1))
+
+    def stats(self):
+        snapshot = self._current()
+        layout = snapshot.layout
+        return {
+            'keystrokes': snapshot.count,
+            'samples': snapshot.manifest['samples'],
+            'dim': snapshot.manifest['dim'],
+            'lists': layout['n_lists'] if layout is not None else 0,
+            'in_lists': layout['count'] if layout is not None else 0,
+            'tail': len(snapshot.tail),
+            'trained_count': layout['trained_count'] if layout is not None else 0
+        }
@@ -0,0 +1,289 @@
+import numpy as np
+import argparse
+import json
+import logging
+import os
+
+from ml_models import KEYS
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER = 5
+
+MANIFEST_NAME = 'language_model.json'
+
+# Window ids accumulated before they are merged into the running counts
+COUNT_BATCH = 1 << 22
+
+# Low orders whose interpolated probabilities for every context fit in this size are
+# precomputed as dense float32 tables, leaving only the higher orders to look up
+DENSE_TABLE_BYTES = 16 * 1024 * 1024
+
+def _merge_counts(ids, counts):
+    """Sum counts of equal ids; returns (sorted unique ids, counts)"""
+    ids = np.concatenate(ids)
+    counts = np.concatenate(counts)
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+def _discount(counts):
+    """Absolute discount estimated from counts of counts (n1 / (n1 + 2 n2))"""
+    n1 = np.count_nonzero(counts == 1)
+    n2 = np.count_nonzero(counts == 2)
+    if n1 == 0 or n2 == 0:
+        return 0.5
+    return float(np.clip(n1 / (n1 + 2 * n2), 0.1, 0.9))
+
+class CharNGramLM:
+    """
+    Interpolated Kneser-Ney character n-gram language model over a key alphabet
+
+    Each order n keeps a sorted int64 array of n-gram ids (the symbols as
+    base-(K+1) digits, K+1 being a start-of-text padding symbol) and the
+    prefix sums of their counts: raw counts for the highest order,
+    continuation counts (number of distinct left extensions) below it. All
+    n-grams sharing a context are contiguous, so a context's counts, total
+    and number of distinct successors come from two binary searches, for
+    many contexts at once. Saved models are memory-mapped when loaded.
+
+    The interpolated probabilities of the low orders, for every possible
+    context, are precomputed into dense tables as long as they stay within
+    DENSE_TABLE_BYTES, so a query only searches the higher orders.
+
+    Decoding state is an integer context id holding the last order - 1
+    symbols, so the model can be used directly as the transition model of
+    hmm_decoding.viterbi.
+    """
+
+    def __init__(self, keys, order, tables, discounts, dense=None):
+        """
+        Args:
+            keys: Alphabet
+            order: Highest n-gram order
+            tables: Per order 1..order, (sorted n-gram ids, count prefix sums) pairs
+            discounts: Per order absolute discount
+            dense: Precomputed (contexts, K) probability tables of the lowest
+                orders, in order from 1 (built if None)
+        """
+        self.keys = keys
+        self.order = order
+        self.base = len(keys) + 1
+        self.bos = len(keys)
+        self.tables = tables
+        self.discounts = discounts
+        self.dense = self._build_dense() if dense is None else dense
+
+    @classmethod
+    def train(cls, texts, order=DEFAULT_ORDER, keys=KEYS):
+        """
+        Count n-grams in a text corpus
+
+        Text is lowercased and characters outside the alphabet are dropped.
+        Each text is padded with start symbols, so predictions at the start
+        of a text use start-of-text statistics.
+
+        Args:
+            texts: Iterable of strings (e.g. lines of a corpus file)
+            order: Highest n-gram order
+            keys: Alphabet
+
+        Returns:
+            CharNGramLM
+        """
+        try:
+            base = len(keys) + 1
+            lookup = np.full(max(map(ord, keys)) + 1, -1, dtype=np.int64)
+            for i, key in enumerate(keys):
+                lookup[ord(key)] = i
+            powers = base ** np.arange(order - 1, -1, -1, dtype=np.int64)
+            padding = np.full(order - 1, len(keys), dtype=np.int64)
+
+            ids = np.zeros(0, dtype=np.int64)
+            counts = np.zeros(0, dtype=np.int64)
+            pending = []
+            for text in texts:
+                codes = np.frombuffer(text.lower().encode('utf-32-le'), dtype=np.uint32)
+                states = lookup[codes[codes < len(lookup)]]
+                states = states[states >= 0]
+                if len(states) == 0:
+                    continue
+                padded = np.concatenate([padding, states])
+                pending.append(np.lib.stride_tricks.sliding_window_view(padded, order) @ powers)
+                if sum(len(p) for p in pending) >= COUNT_BATCH:
+                    ids, counts = _merge_counts([ids] + pending,
+                                                [counts] + [np.ones(len(p), dtype=np.int64) for p in pending])
+                    pending = []
+            top_ids, top_counts = _merge_counts([ids] + pending,
+                                                [counts] + [np.ones(len(p), dtype=np.int64) for p in pending])
+
+            tables = [None] * order
+            discounts = [0.5] * order
+            tables[order - 1] = (top_ids, top_counts)
+            for n in range(order - 1, 0, -1):
+                higher_ids, _ = tables[n]
+                # Continuation count: distinct symbols seen before each n-gram
+                suffixes = higher_ids % base ** n
+                ngram_ids, continuation = np.unique(suffixes, return_counts=True)
+                # N-grams starting with the padding symbol have no real left context: keep raw counts
+                raw_ids, raw_counts = _merge_counts([top_ids % base ** n], [top_counts])
+                starts = ngram_ids // base ** (n - 1) == len(keys)
+                raw = raw_counts[np.searchsorted(raw_ids, ngram_ids)]
+                tables[n - 1] = (ngram_ids, np.where(starts, raw, continuation).astype(np.int64))
+
+            for n in range(order):
+                ngram_ids, ngram_counts = tables[n]
+                discounts[n] = _discount(ngram_counts)
+                tables[n] = (ngram_ids, np.concatenate([[0], np.cumsum(ngram_counts)]))
+
+            logger.info(f"Trained {order}-gram character model with {len(top_ids)} distinct {order}-grams")
+            return cls(keys, order, tables, discounts)
+
+        except Exception as e:
+            logger.error(f"Error training language model: {e}")
+            raise
+
+    def _build_dense(self):
+        n_keys = len(self.keys)
+        dense = []
+        probs = np.full((1, n_keys), 1.0 / n_keys)
+        for n in range(1, self.order + 1):
+            if self.base ** (n - 1) * n_keys * 4 > DENSE_TABLE_BYTES:
+                break
+            contexts = np.arange(self.base ** (n - 1), dtype=np.int64)
+            lower = probs[contexts % self.base ** (n - 2)] if n > 1 else probs.copy()
+            probs = self._interpolate(n, contexts, lower)
+            dense.append(probs.astype(np.float32))
+        return dense
+
+    def save(self, directory):
+        """Write the tables as .npy files plus a JSON manifest"""
+        os.makedirs(directory, exist_ok=True)
+        for n, (ngram_ids, cumulative) in enumerate(self.tables, start=1):
+            np.save(os.path.join(directory, f"order-{n}.ids.npy"), ngram_ids)
+            np.save(os.path.join(directory, f"order-{n}.cumsum.npy"), cumulative)
+        for n, probs in enumerate(self.dense, start=1):
+            np.save(os.path.join(directory, f"order-{n}.dense.npy"), probs)
+        manifest = {'keys': self.keys, 'order': self.order, 'discounts': self.discounts,
+                    'dense_orders': len(self.dense)}
+        with open(os.path.join(directory, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+
+    @classmethod
+    def load(cls, directory):
+        """Load a saved model, memory-mapping its tables"""
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+            path = lambda n, kind: os.path.join(directory, f"order-{n}.{kind}.npy")
+            tables = [(np.load(path(n, 'ids'), mmap_mode='r'), np.load(path(n, 'cumsum'), mmap_mode='r'))
+                      for n in range(1, manifest['order'] + 1)]
+            dense = [np.load(path(n, 'dense'), mmap_mode='r') for n in range(1, manifest['dense_orders'] + 1)]
+            return cls(manifest['keys'], manifest['order'], tables, manifest['discounts'], dense=dense)
+
+        except Exception as e:
+            logger.error(f"Error loading language model from {directory}: {e}")
+            raise
+
+    def initial_context(self):
+        """Context id at the start of a text (all padding symbols)"""
+        return (self.base ** (self.order - 1) - 1) // (self.base - 1) * self.bos
+
+    def next_context(self, contexts, symbols):
+        """Context ids after appending symbols to contexts (arrays broadcast together)"""
+        return (np.asarray(contexts, dtype=np.int64) * self.base + symbols) % self.base ** (self.order - 1)
+
+    def _interpolate(self, n, contexts, probs):
+        """
+        Interpolate order n counts with lower order probabilities, in place
+
+        Args:
+            n: Order
+            contexts: Context ids; their last n - 1 symbols are used
+            probs: (len(contexts), K) probabilities from orders below n
+
+        Returns:
+            probs, updated to order n
+        """
+        ngram_ids, cumulative = self.tables[n - 1]
+        discount = self.discounts[n - 1]
+        history = (contexts % self.base ** (n - 1)) * self.base
+        bounds = np.searchsorted(ngram_ids, np.concatenate([history, history + self.base]))
+        lo, hi = bounds[:len(contexts)], bounds[len(contexts):]
+        lengths = hi - lo
+        total = (cumulative[hi] - cumulative[lo]).astype(np.float64)
+        seen = total > 0
+        inverse = 1.0 / np.where(seen, total, 1.0)
+
+        # Unseen contexts keep the lower order distribution; seen ones scale it by
+        # the discounted mass and add their own discounted counts
+        probs *= np.where(seen, discount * lengths * inverse, 1.0)[:, np.newaxis]
+        rows = np.repeat(np.arange(len(contexts)), lengths)
+        positions = np.arange(len(rows)) + np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+        counts = cumulative[positions + 1] - cumulative[positions]
+        probs[rows, ngram_ids[positions] - history[rows]] += np.maximum(counts - discount, 0) * inverse[rows]
+        return probs
+
+    def log_transitions(self, contexts, order=None):
+        """
+        Log probability of every key after each context
+
+        Args:
+            contexts: Context ids (see initial_context and next_context)
+            order: Highest order used (default: the model order); contexts are
+                then read as their last order - 1 symbols
+
+        Returns:
+            Array of shape (len(contexts), K)
+        """
+        contexts = np.asarray(contexts, dtype=np.int64)
+        order = self.order if order is None else order
+        start = min(order, len(self.dense))
+        if start > 0:
+            probs = self.dense[start - 1][contexts % self.base ** (start - 1)].astype(np.float64)
+        else:
+            probs = np.full((len(contexts), len(self.keys)), 1.0 / len(self.keys))
+        for n in range(start + 1, order + 1):
+            probs = self._interpolate(n, contexts, probs)
+        return np.log(probs)
+
+    def log_start(self):
+        """Log probability of every key at the start of a text"""
+        return self.log_transitions([self.initial_context()])[0]
+
+    def transition_matrix(self, order=2):
+        """
+        (K, K) log transition matrix using contexts of order - 1 symbols
+
+        With order 2 this is the bigram matrix, which is the best fixed
+        (history-free) transition matrix for key-to-key HMM recursions.
+        """
+        return self.log_transitions(np.arange(len(self.keys)), order=order)
+
+    def log_prob(self, text):
+        """Total log probability of a text"""
+        states = [self.keys.index(c) for c in text.lower() if c in self.keys]
+        context = self.initial_context()
+        total = 0.0
+        for state in states:
+            total += self.log_transitions([context])[0, state]
+            context = int(self.next_context(context, state))
+        return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a character n-gram language model from text files")
+    parser.add_argument('corpus', nargs='+', help='Plain text files, one text per line')
+    parser.add_argument('--output', required=True, help='Directory to write the model to')
+    parser.add_argument('--order', type=int, default=DEFAULT_ORDER)
+    args = parser.parse_args()
+
+    def lines():
+        for path in args.corpus:
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                yield from f
+
+    CharNGramLM.train(lines(), order=args.order).save(args.output)
+
+if __name__ == '__main__':
+    main()
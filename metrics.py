@@ -0,0 +1,280 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import math
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Pipeline that stages are attributed to in the current request or job
+_pipeline = contextvars.ContextVar('pipeline', default='other')
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class _Metric:
+    """Named family of time series, one per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, *values, **kwargs):
+        """Child series for the given label values (positional or by name)"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """(suffix, label text, value) of every sample, in exposition order"""
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.labelnames, values)
+
+    def exposition(self):
+        # Counter metadata is named like its samples (with _total), as prometheus_client does
+        name = self.name + '_total' if self.kind == 'counter' else self.name
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self.value += amount
+
+    def samples(self, names, values):
+        yield '', _label_text(names, values), self.value
+
+class Counter(_Metric):
+    """Monotonically increasing total (exported with a _total suffix)"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def samples(self):
+        for suffix, labels, value in super().samples():
+            yield '_total' + suffix, labels, value
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, function):
+        """Report function() at every scrape instead of the stored value"""
+        self.function = function
+
+    def samples(self, names, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = float(self.function())
+            except Exception as e:
+                logger.warning(f"Could not read gauge value: {e}")
+                value = math.nan
+        yield '', _label_text(names, values), value
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set_function(self, function):
+        """set_function of the series without labels"""
+        self.labels().set_function(function)
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self, names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield '_bucket', _label_text(names, values, [('le', _format_value(bound))]), cumulative
+        yield '_sum', _label_text(names, values), total
+        yield '_count', _label_text(names, values), cumulative
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+class Registry:
+    """Metrics exported together on one endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def exposition(self):
+        """Every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.exposition() for metric in metrics) + '\n'
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram('keystroke_stage_duration_seconds', 'Time spent in each stage of a pipeline',
+                          ('pipeline', 'stage'))
+STAGE_BYTES = Counter('keystroke_stage_bytes', 'Bytes read or written by each stage of a pipeline',
+                      ('pipeline', 'stage'))
+STAGE_SAMPLES = Counter('keystroke_stage_samples', 'Audio samples processed by each stage of a pipeline',
+                        ('pipeline', 'stage'))
+REQUEST_SECONDS = Histogram('keystroke_request_duration_seconds', 'Time to serve a request, by pipeline',
+                            ('pipeline',))
+REQUESTS = Counter('keystroke_requests', 'Requests served, by pipeline and status code', ('pipeline', 'status'))
+REQUESTS_IN_PROGRESS = Gauge('keystroke_requests_in_progress', 'Requests being served, by pipeline', ('pipeline',))
+TRAINING_SAMPLES = Gauge('keystroke_training_samples', 'Samples in the training set')
+
+class StageRecord:
+    """What a stage processed; filled in by the code inside metrics.stage()"""
+
+    __slots__ = ('samples', 'bytes')
+
+    def __init__(self):
+        self.samples = 0
+        self.bytes = 0
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Time a stage of the current pipeline
+
+    Yields a StageRecord whose samples and bytes fields are added to the
+    stage's counters when the block exits (also on error).
+    """
+    record = StageRecord()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        pipeline = _pipeline.get()
+        STAGE_SECONDS.labels(pipeline, name).observe(time.perf_counter() - start)
+        if record.samples:
+            STAGE_SAMPLES.labels(pipeline, name).inc(record.samples)
+        if record.bytes:
+            STAGE_BYTES.labels(pipeline, name).inc(record.bytes)
+
+@contextlib.contextmanager
+def pipeline(name):
+    """Attribute the stages run inside the block (in this thread) to a pipeline"""
+    token = _pipeline.set(name)
+    try:
+        yield
+    finally:
+        _pipeline.reset(token)
+
+class RequestTracker:
+    """In-progress gauge, duration and status count of one request; see begin_request"""
+
+    def __init__(self, name):
+        self.pipeline = name
+        self.status = None
+        self._token = _pipeline.set(name)
+        self._start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(name).inc()
+
+    def end(self, error=None):
+        """Record the request; status is taken from self.status (500 on error or if unset)"""
+        try:
+            REQUEST_SECONDS.labels(self.pipeline).observe(time.perf_counter() - self._start)
+            status = 500 if error is not None or self.status is None else self.status
+            REQUESTS.labels(self.pipeline, status).inc()
+        finally:
+            REQUESTS_IN_PROGRESS.labels(self.pipeline).dec()
+            _pipeline.reset(self._token)
+
+def begin_request(name):
+    """Start tracking a request of a pipeline; call end() on the returned tracker when it is done"""
+    return RequestTracker(name)
+
+def exposition():
+    return REGISTRY.exposition()
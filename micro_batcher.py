@@ -0,0 +1,167 @@
+import collections
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# Completed items whose latencies are kept for the percentiles
+LATENCY_WINDOW = 10000
+
+class MicroBatcher:
+    """
+    Dynamic batching of items submitted by concurrent requests
+
+    Request threads submit single items and block until their result is
+    ready. A worker thread takes the first waiting item, keeps collecting
+    items for up to max_wait_ms or until max_batch_size items are waiting,
+    and runs the whole batch through one process_batch call. Under load
+    batches fill up and the per-call overhead is shared; a lone request
+    waits at most max_wait_ms.
+
+    Latencies (from submit to result) of the last LATENCY_WINDOW items are
+    kept for stats().
+    """
+
+    def __init__(self, process_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 name='micro-batcher', window=LATENCY_WINDOW):
+        """
+        Args:
+            process_batch: Callable taking a list of items and returning a list
+                of results in the same order
+            max_batch_size: Most items run in one batch
+            max_wait_ms: Longest time the first item of a batch waits for others
+            name: Worker thread name
+            window: Completed items kept for the latency statistics
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # (completed at, latency) pairs
+        self._latencies = collections.deque(maxlen=window)
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+
+    def _ensure_worker(self):
+        # The thread starts lazily so importing the app does not spawn it
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit_async(self, item):
+        """Queue an item; returns a concurrent.futures.Future of its result"""
+        self._ensure_worker()
+        future = concurrent.futures.Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def submit(self, item, timeout=None):
+        """
+        Run an item in the next batch and wait for its result
+
+        Raises:
+            Whatever process_batch raised for the batch the item was in
+        """
+        return self.submit_async(item).result(timeout)
+
+    def submit_many(self, items, timeout=None):
+        """Queue several items at once (they share batches with other requests) and wait for all results"""
+        futures = [self.submit_async(item) for item in items]
+        return [future.result(timeout) for future in futures]
+
+    def _collect(self):
+        # Items whose future the caller has cancelled are dropped; the rest can no longer be cancelled
+        batch = []
+        while not batch:
+            entry = self._queue.get()
+            if entry[1].set_running_or_notify_cancel():
+                batch.append(entry)
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry[1].set_running_or_notify_cancel():
+                batch.append(entry)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch of {len(items)} items returned {len(results)} results")
+            except Exception as e:
+                logger.error(f"Error processing a batch of {len(items)} items: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._lock:
+                    self._errors += len(batch)
+                continue
+
+            completed = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._latencies.extend((completed, completed - submitted) for _, _, submitted in batch)
+
+    def stats(self):
+        """
+        Batching and latency statistics
+
+        Returns:
+            Dictionary with the configuration, batch and item counts, the mean
+            batch size, p50/p99 latency in milliseconds and throughput in items
+            per second over the latency window
+        """
+        with self._lock:
+            window = list(self._latencies)
+            batches, items, errors = self._batches, self._items, self._errors
+
+        stats = {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches': batches,
+            'items': items,
+            'errors': errors,
+            'queued': self._queue.qsize(),
+            'mean_batch_size': items / batches if batches else 0.0,
+            'window': len(window),
+            'p50_ms': None,
+            'p99_ms': None,
+            'throughput_per_s': None
+        }
+        if window:
+            completed, latencies = np.array(window).T
+            stats['p50_ms'] = float(np.percentile(latencies, 50) * 1000.0)
+            stats['p99_ms'] = float(np.percentile(latencies, 99) * 1000.0)
+            # Items over the span from the first item's submission to the last completion
+            span = completed.max() - (completed - latencies).min()
+            stats['throughput_per_s'] = len(window) / span if span > 0 else None
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._latencies.clear()
+            self._batches = self._items = self._errors = 0
@@ -1,6 +1,9 @@
 import numpy as np
 import logging
-from scipy import signal
+from analysis_context import analysis_context, frame_power
+from cnn_engine import Sequential, Conv2D, MaxPool2D, GlobalAveragePooling2D, Dense
+from audio_processor import extract_keystroke_segments
+from hmm_decoding import viterbi, forward_backward, viterbi_batch, forward_backward_batch
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -9,182 +12,655 @@ logger = logging.getLogger(__name__)
 # Simplified keyboard layout for mapping predictions
 KEYS = "abcdefghijklmnopqrstuvwxyz0123456789 ,.?!-_"
 
+# Names of the columns returned by extract_features and extract_features_batch
+FEATURE_NAMES = (
+    'rms', 'zero_crossing_rate',
+    'centroid_mean', 'bandwidth_mean', 'contrast_mean',
+    'centroid_std', 'bandwidth_std', 'contrast_std'
+)
+
+# Bump whenever feature values change, so cached features are recomputed
+FEATURE_VERSION = 1
+
+# Segment length and hop of the feature spectrogram
+FEATURE_NPERSEG = 2048
+FEATURE_HOP = 1024
+
+# CNN input: (frequency bins, frames, channels) of each keystroke spectrogram, and its hop
+CNN_INPUT_SHAPE = (128, 128, 1)
+SPECTROGRAM_HOP = 16
+
+# CNN layer read for keystroke embeddings
+EMBEDDING_LAYER = 'embedding'
+
+def _spectral_statistics(freqs, power):
+    """
+    Mean and standard deviation over time of spectral centroid, bandwidth and contrast
+
+    Args:
+        freqs: Frequency of each bin
+        power: Power spectrogram of shape (..., time, freq)
+
+    Returns:
+        Array of shape (..., 6): the three means followed by the three standard deviations
+    """
+    total = np.sum(power, axis=-1) + 1e-8
+
+    # Spectral centroid (weighted average of frequencies)
+    spectral_centroid = (power @ freqs) / total
+
+    # Spectral bandwidth (weighted standard deviation of frequencies)
+    spread = np.square(freqs - spectral_centroid[..., np.newaxis])
+    spectral_bandwidth = np.sqrt(np.sum(power * spread, axis=-1) / total)
+
+    # Spectral contrast (difference between the loudest and quietest 10% of bins);
+    # partitioning around both cut points avoids sorting every column
+    num_bins = power.shape[-1]
+    k = max(1, int(num_bins * 0.1))
+    parted = np.partition(power, (k - 1, num_bins - k), axis=-1)
+    spectral_contrast = parted[..., num_bins - k:].mean(axis=-1) - parted[..., :k].mean(axis=-1)
+
+    features = np.stack([spectral_centroid, spectral_bandwidth, spectral_contrast], axis=-2)
+    return np.concatenate([features.mean(axis=-1), features.std(axis=-1)], axis=-1)
+
 def extract_features(audio_data):
     """
     Extract audio features for model training/prediction
     
     Args:
-        audio_data: Dictionary containing waveform and sample rate
+        audio_data: Dictionary containing waveform and sample rate, or an
+            AnalysisContext whose memoized STFT is reused
         
     Returns:
-        Feature vector
+        Feature vector (see FEATURE_NAMES)
     """
     try:
-        y = audio_data['waveform']
-        sr = audio_data['sr']
-        
-        # Simple time-domain features
-        # Energy (RMS)
-        rms = np.sqrt(np.mean(np.square(y)))
+        context = analysis_context(audio_data)
         
-        # Zero-crossing rate
-        zero_crossings = np.sum(np.abs(np.diff(np.signbit(y)))) / len(y)
+        # Power spectrogram, derived from an already computed finer STFT when available
+        f, t, Sxx = context.power(nperseg=FEATURE_NPERSEG, noverlap=FEATURE_NPERSEG - FEATURE_HOP)
         
-        # Frequency-domain features using scipy
-        # Compute spectrogram
-        f, t, Sxx = signal.spectrogram(y, sr, nperseg=2048, noverlap=1024)
+        # Time-domain features (energy and zero-crossing rate), then spectral statistics
+        basic_features = np.array([context.rms, context.zero_crossing_rate])
+        return np.hstack([basic_features, _spectral_statistics(f, Sxx.T)])
         
-        # Spectral centroid (weighted average of frequencies)
-        magnitudes = np.abs(Sxx)
-        freqs = f.reshape(-1, 1)
-        spectral_centroid = np.sum(magnitudes * freqs, axis=0) / (np.sum(magnitudes, axis=0) + 1e-8)
-        
-        # Spectral bandwidth (weighted standard deviation of frequencies)
-        spectral_bandwidth = np.sqrt(np.sum(magnitudes * (freqs - spectral_centroid) ** 2, axis=0) / 
-                                     (np.sum(magnitudes, axis=0) + 1e-8))
+    except Exception as e:
+        logger.error(f"Error extracting features: {e}")
+        raise
+
+def extract_features_batch(segments):
+    """
+    Extract features for many audio segments in one vectorized pass
+    
+    Segments of equal length (most keystroke segments are cut to the same
+    maximum duration) are stacked into one 2-D array and framed together, so
+    the FFTs and statistics run once per distinct length instead of once per
+    segment. Each row equals extract_features of the same segment.
+    
+    Args:
+        segments: List of dictionaries containing waveform and sample rate
+            (e.g. from audio_processor.extract_keystroke_segments), all at the same rate
         
-        # Spectral contrast (difference between peaks and valleys)
-        # Simplified version
-        sorted_mags = np.sort(magnitudes, axis=0)
-        num_bins = len(f)
-        spectral_contrast = sorted_mags[-int(num_bins*0.1):, :].mean(axis=0) - sorted_mags[:int(num_bins*0.1), :].mean(axis=0)
+    Returns:
+        Float32 array of shape (len(segments), len(FEATURE_NAMES))
+    """
+    try:
+        features = np.zeros((len(segments), len(FEATURE_NAMES)), dtype=np.float32)
+        if not segments:
+            return features
         
-        # Get basic statistics
-        features = np.vstack([
-            spectral_centroid,
-            spectral_bandwidth,
-            spectral_contrast
-        ])
+        rates = {segment['sr'] for segment in segments}
+        if len(rates) > 1:
+            raise ValueError(f"Segments have different sample rates: {sorted(rates)}")
+        sr = rates.pop()
         
-        # Compute statistics over time
-        mean_features = np.mean(features, axis=1)
-        std_features = np.std(features, axis=1)
+        lengths = np.array([len(segment['waveform']) for segment in segments])
+        if lengths.min() == 0:
+            raise ValueError("Cannot extract features from an empty segment")
         
-        # Add the time-domain features
-        basic_features = np.array([rms, zero_crossings])
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            batch = np.stack([segments[i]['waveform'] for i in rows]).astype(np.float32, copy=False)
+            
+            # Time-domain features
+            rms = np.sqrt(np.mean(np.square(batch, dtype=np.float64), axis=1))
+            zero_crossings = np.count_nonzero(np.diff(np.signbit(batch), axis=1), axis=1) / length
+            
+            # Frames of shape (segments, time, nperseg); shorter segments are a single frame
+            nperseg = min(FEATURE_NPERSEG, length)
+            hop = FEATURE_HOP if nperseg == FEATURE_NPERSEG else nperseg
+            frames = np.lib.stride_tricks.sliding_window_view(batch, nperseg, axis=1)[:, ::hop]
+            freqs, power = frame_power(frames, sr)
+            
+            features[rows, 0] = rms
+            features[rows, 1] = zero_crossings
+            features[rows, 2:] = _spectral_statistics(freqs, power)
         
-        # Return flattened feature vector
-        return np.hstack([basic_features, mean_features, std_features])
+        logger.debug(f"Extracted features for {len(segments)} segments ({len(np.unique(lengths))} lengths)")
+        return features
         
     except Exception as e:
-        logger.error(f"Error extracting features: {e}")
+        logger.error(f"Error extracting batched features: {e}")
         raise
 
-def build_cnn_model(input_shape=(128, 128, 1), num_classes=len(KEYS)):
+def segment_spectrograms(segments, shape=CNN_INPUT_SHAPE):
     """
-    Build a simplified model for audio feature extraction
+    Fixed-size log spectrograms of keystroke segments, as CNN input
+    
+    Each segment is cut or zero-padded to the length that gives shape[1]
+    frames of 2 * (shape[0] - 1) samples at SPECTROGRAM_HOP, so every
+    segment is framed in one batched pass. Values are dB scaled to [0, 1]
+    over the top 80 dB of each spectrogram.
     
     Args:
-        input_shape: Shape of input spectrograms
-        num_classes: Number of output classes (keystrokes)
+        segments: List of dictionaries containing waveform and sample rate, all at the same rate
+        shape: (frequency bins, frames, channels) of each spectrogram
         
     Returns:
-        Placeholder model
+        Float32 array of shape (len(segments),) + shape
     """
-    logger.info("Building simplified model (CNN functionality is simulated)")
+    if not segments:
+        return np.zeros((0,) + tuple(shape), dtype=np.float32)
     
-    # In a real implementation, this would be a CNN model
-    # Since we're not using TensorFlow in this simplified implementation,
-    # we'll just return a placeholder object
+    n_freqs, n_frames = shape[0], shape[1]
+    nperseg = 2 * (n_freqs - 1)
+    length = nperseg + (n_frames - 1) * SPECTROGRAM_HOP
+    batch = np.zeros((len(segments), length), dtype=np.float32)
+    for i, segment in enumerate(segments):
+        waveform = segment['waveform'][:length]
+        batch[i, :len(waveform)] = waveform
     
-    class SimplifiedModel:
-        def __init__(self):
-            self.name = "SimplifiedModel"
-            self.input_shape = input_shape
-            self.num_classes = num_classes
-        
-        def predict(self, X):
-            # This would normally run inference with the model
-            # For simplification, we'll return random predictions
-            return np.random.random((len(X), self.num_classes))
+    frames = np.lib.stride_tricks.sliding_window_view(batch, nperseg, axis=1)[:, ::SPECTROGRAM_HOP]
+    _, power = frame_power(frames, segments[0]['sr'])
+    db = 10 * np.log10(power + 1e-12)
+    db -= db.max(axis=(1, 2), keepdims=True)
+    spectrograms = np.clip(db / 80.0 + 1.0, 0.0, 1.0)
+    # (segments, frames, freqs) -> (segments, freqs, frames, 1)
+    return np.ascontiguousarray(spectrograms.transpose(0, 2, 1))[..., np.newaxis].astype(np.float32)
+
+def build_cnn_model(input_shape=CNN_INPUT_SHAPE, num_classes=len(KEYS), weights_path=None, seed=0):
+    """
+    Build the keystroke CNN on the NumPy inference engine
+    
+    Three 3x3 convolution + max pooling blocks (32, 64 and 128 filters),
+    global average pooling, a 64-unit embedding layer and a softmax over
+    the keys. Without trained weights the layers keep their seeded
+    initialization, which still gives deterministic embeddings.
     
-    return SimplifiedModel()
+    Args:
+        input_shape: Shape of input spectrograms
+        num_classes: Number of output classes (keystrokes)
+        weights_path: Optional .npz of trained weights (see cnn_engine.Sequential.save_weights)
+        seed: Seed of the initial weights
+        
+    Returns:
+        cnn_engine.Sequential model
+    """
+    model = Sequential("KeystrokeCNN", input_shape, [
+        Conv2D('conv1', 32, 3),
+        MaxPool2D('pool1', 2),
+        Conv2D('conv2', 64, 3),
+        MaxPool2D('pool2', 2),
+        Conv2D('conv3', 128, 3),
+        MaxPool2D('pool3', 2),
+        GlobalAveragePooling2D('global_pool'),
+        Dense(EMBEDDING_LAYER, 64, activation='relu'),
+        Dense('output', num_classes, activation='softmax')
+    ], seed=seed)
+    if weights_path is not None:
+        model.load_weights(weights_path)
+    logger.info(f"Built {model.name} with {model.get_parameters()['parameters']} parameters")
+    return model
 
-def extract_features_cnn(audio_data, cnn_model):
+def extract_cnn_embeddings(audio_data, cnn_model, layer=EMBEDDING_LAYER):
     """
-    Extract features using a pre-trained CNN
+    CNN activations of an intermediate layer for each detected keystroke
     
     Args:
-        audio_data: Dictionary containing waveform and sample rate
-        cnn_model: Trained CNN model
+        audio_data: Dictionary containing waveform and sample rate, or an AnalysisContext
+        cnn_model: Model from build_cnn_model
+        layer: Name of the layer to read
         
     Returns:
-        Feature vector
+        Float32 array of shape (segments, layer features)
     """
     try:
-        # For demonstration, we'll use a simpler feature extraction
-        # In a real implementation, we would:
-        # 1. Convert the audio to a spectrogram
-        # 2. Use the CNN to process it
-        # 3. Extract the activations from an intermediate layer
+        segments = extract_keystroke_segments(audio_data)
+        spectrograms = segment_spectrograms(segments, cnn_model.input_shape)
+        return cnn_model.embed(spectrograms, layer)
         
-        # Simple feature extraction for demonstration
-        features = extract_features(audio_data)
+    except Exception as e:
+        logger.error(f"Error extracting CNN embeddings: {e}")
+        raise
+
+def extract_features_cnn(audio_data, cnn_model, layer=None):
+    """
+    Extract per-keystroke features for the HMM
+    
+    The HMM is fit on the FEATURE_NAMES features of each keystroke, so
+    those are always returned. The activations of a CNN layer can be
+    appended for models fit on both (e.g. once trained weights are loaded).
+    
+    Args:
+        audio_data: Dictionary containing waveform and sample rate, or an AnalysisContext
+        cnn_model: Model from build_cnn_model
+        layer: Optional CNN layer whose activations are appended to each row
         
-        # In a real implementation with a trained CNN, we would do:
-        # spectrogram = prepare_spectrogram(audio_data)
-        # feature_extractor = Model(inputs=cnn_model.input, 
-        #                           outputs=cnn_model.get_layer('name_of_feature_layer').output)
-        # features = feature_extractor.predict(spectrogram)
+    Returns:
+        Float32 array of shape (segments, features), one row per detected keystroke
+    """
+    try:
+        # Both feature sets come from the same (memoized) keystroke segmentation
+        segments = extract_keystroke_segments(audio_data)
+        features = extract_features_batch(segments)
+        if layer is None:
+            return features
         
-        return features
+        spectrograms = segment_spectrograms(segments, cnn_model.input_shape)
+        return np.hstack([features, cnn_model.embed(spectrograms, layer)])
         
     except Exception as e:
         logger.error(f"Error extracting CNN features: {e}")
         raise
 
-def predict_keystrokes_hmm(features, hmm_model, return_confidence=False):
+def text_to_states(text, keys=KEYS):
+    """
+    Map text to key indices, dropping characters that are not on the keyboard layout
+    
+    Args:
+        text: Typed text
+        keys: Keyboard layout
+        
+    Returns:
+        int64 array of key indices
+    """
+    lookup = {key: i for i, key in enumerate(keys)}
+    return np.array([lookup[c] for c in text.lower() if c in lookup], dtype=np.int64)
+
+def sample_segment_features(audio_data):
+    """Per-keystroke features of a training sample, from the feature cache when available"""
+    if 'segment_features' in audio_data:
+        return audio_data['segment_features']
+    return extract_features_batch(extract_keystroke_segments(audio_data))
+
+def align_keystrokes(audio_data, ground_truth, keys=KEYS):
+    """
+    Match the keystroke segments of a training sample to its typed characters
+    
+    Segments can only be labeled when one was detected per character.
+    
+    Returns:
+        Tuple of (key indices of the ground truth, (segments, features) matrix
+        or None if the number of segments differs from the number of characters)
+    """
+    states = text_to_states(ground_truth, keys)
+    features = sample_segment_features(audio_data)
+    if len(features) != len(states):
+        return states, None
+    return states, features
+
+# Sufficient statistics accumulated by KeystrokeHMM.partial_fit
+HMM_STATISTICS = ('counts', 'sums', 'outer_sums', 'start_counts', 'transition_counts')
+
+class KeystrokeHMM:
+    """
+    Hidden Markov model over keys with Gaussian emissions, trained incrementally
+    
+    Training only accumulates sufficient statistics: per-key feature counts,
+    sums and sums of outer products, plus start and key-to-key transition
+    counts. partial_fit therefore costs O(new samples) however large the
+    corpus has grown, and fitting the same data in any number of batches
+    gives the same model. Emission and transition parameters are derived
+    from the statistics when first needed after an update.
+    """
+    
+    def __init__(self, keys=KEYS, n_features=len(FEATURE_NAMES), shrinkage=1.0, smoothing=1.0):
+        """
+        Args:
+            keys: Keyboard layout (one state per key)
+            n_features: Length of the feature vectors
+            shrinkage: Weight, in samples, of the pooled covariance mixed into each key's covariance
+            smoothing: Pseudo-count added to every start and transition count
+        """
+        self.name = "KeystrokeHMM"
+        self.keys = keys
+        self.states = list(range(len(keys)))
+        self.n_features = n_features
+        self.shrinkage = shrinkage
+        self.smoothing = smoothing
+        self.reset()
+    
+    def reset(self):
+        """Forget all training data"""
+        n_keys = len(self.keys)
+        self.counts = np.zeros(n_keys)
+        self.sums = np.zeros((n_keys, self.n_features))
+        self.outer_sums = np.zeros((n_keys, self.n_features, self.n_features))
+        self.start_counts = np.zeros(n_keys)
+        self.transition_counts = np.zeros((n_keys, n_keys))
+        self.n_samples = 0
+        self.n_aligned = 0
+        self._params = None
+    
+    def partial_fit(self, samples):
+        """
+        Update the statistics with new training samples
+        
+        Transitions are counted from every ground truth text. Emission
+        statistics need each keystroke segment matched to a character, so they
+        are only taken from samples whose number of detected keystrokes equals
+        the number of typed characters.
+        
+        Args:
+            samples: List of (audio_data, ground_truth) pairs
+            
+        Returns:
+            self
+        """
+        for audio_data, ground_truth in samples:
+            states, features = align_keystrokes(audio_data, ground_truth, self.keys)
+            self.n_samples += 1
+            if len(states) == 0:
+                continue
+            
+            self.start_counts[states[0]] += 1
+            np.add.at(self.transition_counts, (states[:-1], states[1:]), 1)
+            
+            if features is None:
+                logger.debug(f"Skipping emissions: keystrokes do not match the {len(states)} characters")
+                continue
+            features = np.asarray(features, dtype=np.float64)
+            
+            self.counts += np.bincount(states, minlength=len(self.keys))
+            np.add.at(self.sums, states, features)
+            np.add.at(self.outer_sums, states, features[:, :, np.newaxis] * features[:, np.newaxis, :])
+            self.n_aligned += 1
+        
+        self._params = None
+        return self
+    
+    def fit(self, samples):
+        """Retrain from scratch on samples"""
+        self.reset()
+        return self.partial_fit(samples)
+    
+    def _derive_parameters(self):
+        counts = self.counts[:, np.newaxis]
+        total = self.counts.sum()
+        eye = np.eye(self.n_features)
+        
+        if total > 0:
+            pooled_mean = self.sums.sum(axis=0) / total
+            pooled_cov = self.outer_sums.sum(axis=0) / total - np.outer(pooled_mean, pooled_mean)
+        else:
+            pooled_mean = np.zeros(self.n_features)
+            pooled_cov = eye.copy()
+        # Scale-aware ridge so features with very different units stay well conditioned
+        pooled_cov += eye * (1e-6 * np.diag(pooled_cov).clip(min=0) + 1e-12)
+        
+        # Keys without enough samples fall back towards the pooled Gaussian
+        means = np.where(counts > 0, self.sums / np.maximum(counts, 1), pooled_mean)
+        scatter = self.outer_sums - counts[:, :, np.newaxis] * means[:, :, np.newaxis] * means[:, np.newaxis, :]
+        covariances = (scatter + self.shrinkage * pooled_cov) / (counts[:, :, np.newaxis] + self.shrinkage)
+        
+        _, logdet = np.linalg.slogdet(covariances)
+        start = self.start_counts + self.smoothing
+        transitions = self.transition_counts + self.smoothing
+        
+        self._params = {
+            'means': means,
+            'precisions': np.linalg.inv(covariances),
+            'log_norm': -0.5 * (logdet + self.n_features * np.log(2 * np.pi)),
+            'log_start': np.log(start / start.sum()),
+            'log_transitions': np.log(transitions / transitions.sum(axis=1, keepdims=True))
+        }
+        return self._params
+    
+    @property
+    def parameters(self):
+        """Emission and transition parameters derived from the current statistics"""
+        return self._params if self._params is not None else self._derive_parameters()
+    
+    def emission_log_likelihood(self, features):
+        """
+        Log density of each feature vector under each key's Gaussian
+        
+        Args:
+            features: Array of shape (segments, features)
+            
+        Returns:
+            Array of shape (segments, keys)
+        """
+        params = self.parameters
+        diff = np.asarray(features, dtype=np.float64)[np.newaxis, :, :] - params['means'][:, np.newaxis, :]
+        # One batched matmul per key, then a row-wise dot; a three-operand einsum is ~10x slower
+        mahalanobis = np.einsum('ktf,ktf->tk', diff @ params['precisions'], diff)
+        return params['log_norm'] - 0.5 * mahalanobis
+    
+    def _decoding_model(self, language_model):
+        """(log_start, Viterbi transition model, forward-backward transition matrix)"""
+        if language_model is None:
+            params = self.parameters
+            return params['log_start'], params['log_transitions'], params['log_transitions']
+        if language_model.keys != self.keys:
+            raise ValueError("Language model alphabet does not match the HMM keys")
+        # Posteriors need a fixed transition matrix: the model's bigram one
+        return language_model.log_start(), language_model, language_model.transition_matrix()
+    
+    def predict(self, features, return_confidence=False, beam_width=None, language_model=None):
+        """
+        Most likely key sequence for a sequence of keystroke features (Viterbi)
+        
+        Args:
+            features: Array of shape (segments, features)
+            return_confidence: Whether to return confidence scores
+            beam_width: Keys kept per step while decoding (None decodes exactly)
+            language_model: Optional CharNGramLM over the same keys, used as the
+                transition model instead of the transitions learned from training texts
+            
+        Returns:
+            Predicted text, or (predicted_text, confidence_scores) if return_confidence is True,
+            where each score is the posterior probability of the predicted key at that keystroke
+        """
+        features = np.asarray(features)
+        if len(features) == 0:
+            return ("", []) if return_confidence else ""
+        
+        emissions = self.emission_log_likelihood(features)
+        log_start, transitions, log_transitions = self._decoding_model(language_model)
+        path, _ = viterbi(log_start, transitions, emissions, beam_width=beam_width)
+        predicted_text = ''.join(self.keys[i] for i in path)
+        
+        if not return_confidence:
+            return predicted_text
+        
+        posteriors, _ = forward_backward(log_start, log_transitions, emissions)
+        confidence_scores = posteriors[np.arange(len(path)), path].tolist()
+        return predicted_text, confidence_scores
+    
+    def predict_batch(self, features_list, return_confidence=False, beam_width=None, language_model=None):
+        """
+        predict() for several recordings at once
+        
+        Emission likelihoods of every keystroke are computed in one pass, and
+        the recordings are decoded together (hmm_decoding.viterbi_batch and
+        forward_backward_batch), which spreads the per-keystroke overhead of
+        the recursions over the batch. Results equal those of predict().
+        
+        Args:
+            features_list: List of (segments, features) arrays
+            return_confidence, beam_width, language_model: As for predict
+            
+        Returns:
+            List with one predict() result per recording
+        """
+        features_list = [np.asarray(features) for features in features_list]
+        lengths = [len(features) for features in features_list]
+        decoded = [i for i, length in enumerate(lengths) if length > 0]
+        results = [("", []) if return_confidence else ""] * len(features_list)
+        if not decoded:
+            return results
+        
+        emissions = self.emission_log_likelihood(np.concatenate([features_list[i] for i in decoded]))
+        emissions = np.split(emissions, np.cumsum([lengths[i] for i in decoded])[:-1])
+        log_start, transitions, log_transitions = self._decoding_model(language_model)
+        paths = viterbi_batch(log_start, transitions, emissions, beam_width=beam_width)
+        posteriors = forward_backward_batch(log_start, log_transitions, emissions) if return_confidence else None
+        
+        for j, i in enumerate(decoded):
+            path = paths[j][0]
+            predicted_text = ''.join(self.keys[k] for k in path)
+            if return_confidence:
+                results[i] = (predicted_text, posteriors[j][0][np.arange(len(path)), path].tolist())
+            else:
+                results[i] = predicted_text
+        return results
+    
+    def get_state(self):
+        """
+        Everything needed to rebuild the model, e.g. for model_artifacts
+        
+        Returns:
+            Tuple of (JSON-serializable config, dictionary of arrays): the
+            sufficient statistics, plus the derived parameters under 'param.' names
+        """
+        config = {
+            'keys': self.keys,
+            'n_features': self.n_features,
+            'shrinkage': self.shrinkage,
+            'smoothing': self.smoothing,
+            'n_samples': self.n_samples,
+            'n_aligned': self.n_aligned
+        }
+        arrays = {name: getattr(self, name) for name in HMM_STATISTICS}
+        arrays.update({f"param.{name}": value for name, value in self.parameters.items()})
+        return config, arrays
+    
+    @classmethod
+    def from_state(cls, config, arrays):
+        """
+        Rebuild a model from get_state output
+        
+        The arrays are used as they are, so memory-mapped arrays stay mapped:
+        statistics should be mapped copy-on-write if the model will be
+        updated with partial_fit, parameters can be read-only.
+        """
+        model = cls(keys=config['keys'], n_features=config['n_features'],
+                    shrinkage=config['shrinkage'], smoothing=config['smoothing'])
+        for name in HMM_STATISTICS:
+            setattr(model, name, arrays[name])
+        model.n_samples = config['n_samples']
+        model.n_aligned = config['n_aligned']
+        params = {name[len('param.'):]: value for name, value in arrays.items() if name.startswith('param.')}
+        model._params = params or None
+        return model
+    
+    def get_parameters(self):
+        """Summary of the model for storing with a TrainedModel record"""
+        return {
+            "states": len(self.keys),
+            "features": list(FEATURE_NAMES),
+            "algorithm": "viterbi",
+            "confidence": "forward-backward posterior",
+            "emissions": "gaussian",
+            "training_samples": self.n_samples,
+            "aligned_samples": self.n_aligned,
+            "keystrokes": int(self.counts.sum())
+        }
+
+def predict_keystrokes_hmm(features, hmm_model, return_confidence=False, beam_width=None, language_model=None):
     """
-    Predict sequence of keystrokes using simplified model
+    Predict sequence of keystrokes using the HMM
     
     Args:
-        features: Feature vector 
-        hmm_model: Trained model (simplified in this implementation)
+        features: Per-keystroke feature matrix from extract_features_cnn
+        hmm_model: Trained KeystrokeHMM
         return_confidence: Whether to return confidence scores
+        beam_width: Keys kept per step while decoding (None decodes exactly)
+        language_model: Optional CharNGramLM used as the transition prior
         
     Returns:
         Predicted text if return_confidence is False
         Tuple of (predicted_text, confidence_scores) if return_confidence is True
     """
     try:
-        # Since we don't have a trained model, return a placeholder
+        # Without a trained model there is nothing to decode
         if hmm_model is None:
             if return_confidence:
                 return "Model not trained. Please train the model first.", []
             else:
                 return "Model not trained. Please train the model first."
         
-        # For demonstration, return sample text
-        # In a real implementation with HMM or other models, this would do actual prediction
-        sample_text = "the quick brown fox jumps over the lazy dog"
-        predicted_text = "Predicted: " + sample_text
-        
-        # Generate simulated confidence scores for demonstration
-        # In a real implementation, these would come from the model's probability estimates
-        confidence_scores = []
-        for i in range(len(sample_text)):
-            # Generate random confidence in the range [0.6, 0.95]
-            confidence = 0.6 + (0.35 * np.random.random())
-            confidence_scores.append(confidence)
-        
-        if return_confidence:
-            return predicted_text, confidence_scores
-        else:
-            return predicted_text
+        return hmm_model.predict(features, return_confidence=return_confidence, beam_width=beam_width,
+                                 language_model=language_model)
         
     except Exception as e:
         logger.error(f"Error predicting keystrokes: {e}")
         raise
 
+def predict_keystrokes_hmm_batch(features_list, hmm_model, return_confidence=False, beam_width=None,
+                                 language_model=None):
+    """
+    Predict keystroke sequences of several recordings in one batch
+    
+    Args:
+        features_list: List of per-keystroke feature matrices from extract_features_cnn
+        hmm_model: Trained KeystrokeHMM
+        return_confidence, beam_width, language_model: As for predict_keystrokes_hmm
+        
+    Returns:
+        List with one predict_keystrokes_hmm result per recording
+    """
+    try:
+        if hmm_model is None:
+            return [predict_keystrokes_hmm(features, None, return_confidence) for features in features_list]
+        
+        return hmm_model.predict_batch(features_list, return_confidence=return_confidence, beam_width=beam_width,
+                                       language_model=language_model)
+        
+    except Exception as e:
+        logger.error(f"Error predicting keystroke batch: {e}")
+        raise
+
+def update_models(models, training_data):
+    """
+    Incrementally train models with new samples only
+    
+    Args:
+        models: (cnn_model, hmm_model) tuple from train_model or update_models,
+            or None to start from scratch
+        training_data: List of new (audio_data, ground_truth) pairs
+        
+    Returns:
+        Updated CNN and HMM models
+    """
+    try:
+        logger.info(f"Updating models with {len(training_data)} new samples")
+        
+        cnn_model, hmm_model = models if models is not None else (None, None)
+        if cnn_model is None:
+            cnn_model = build_cnn_model()
+        if hmm_model is None:
+            hmm_model = KeystrokeHMM()
+        
+        hmm_model.partial_fit(training_data)
+        
+        logger.info(f"Model update completed ({hmm_model.n_samples} samples in total)")
+        return cnn_model, hmm_model
+        
+    except Exception as e:
+        logger.error(f"Error updating models: {e}")
+        raise
+
 def train_model(training_data):
     """
-    Train simplified models
+    Train models from scratch on the whole training set
     
     Args:
         training_data: List of (audio_data, ground_truth) pairs
         
     Returns:
-        Simplified CNN and HMM models
+        CNN and HMM models
     """
     try:
         logger.info(f"Training with {len(training_data)} samples")
@@ -192,33 +668,9 @@ def train_model(training_data):
         # Create simplified CNN model
         cnn_model = build_cnn_model()
         
-        # Create simplified HMM model
-        class SimpleHMM:
-            def __init__(self):
-                self.name = "SimpleHMM"
-                self.states = list(range(len(KEYS)))
-                self.keys = KEYS
-            
-            def predict(self, features, return_confidence=False):
-                # This would normally use HMM to predict sequence
-                # For simplification, just return a fixed sample
-                sample_text = "the quick brown fox"
-                
-                if not return_confidence:
-                    return sample_text
-                
-                # Generate simulated confidence scores for demo
-                confidence_scores = []
-                for i in range(len(sample_text)):
-                    # Generate random confidence in the range [0.6, 0.95]
-                    confidence = 0.6 + (0.35 * np.random.random())
-                    confidence_scores.append(confidence)
-                
-                return sample_text, confidence_scores
-        
-        hmm_model = SimpleHMM()
-        
-        logger.info("Model training completed (simplified implementation)")
+        hmm_model = KeystrokeHMM().fit(training_data)
+        
+        logger.info("Model training completed")
         return cnn_model, hmm_model
         
     except Exception as e:
@@ -0,0 +1,244 @@
+import numpy as np
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from feature_cache import pipeline_fingerprint
+from ml_models import KeystrokeHMM, HMM_STATISTICS, build_cnn_model
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout changes; older artifacts are then ignored
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+# Highest version number ever assigned; survives clear() so numbers are never reused
+LAST_VERSION_NAME = 'LAST_VERSION'
+LOCK_NAME = '.lock'
+
+# Artifact versions kept on disk; older ones are deleted after a save
+DEFAULT_KEEP = 5
+
+class ModelArtifactStore:
+    """
+    Versioned on-disk model artifacts
+
+    Each version is a directory of uncompressed .npy arrays (CNN weights,
+    HMM statistics and derived parameters) plus a JSON manifest with the
+    model configuration, the TrainedModel record ids and the feature
+    pipeline fingerprint. A CURRENT file names the latest version and is
+    replaced atomically once a version is complete.
+
+    Loading memory-maps the arrays instead of reading them, so it costs a
+    few page-table entries, and every worker process that loads the same
+    version shares the pages through the OS page cache. HMM statistics are
+    mapped copy-on-write: a worker that keeps training only copies the
+    pages it changes.
+    """
+
+    def __init__(self, directory, keep=DEFAULT_KEEP):
+        """
+        Args:
+            directory: Directory holding one subdirectory per version
+            keep: Number of versions kept on disk
+        """
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        with open(self._path(LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def versions(self):
+        """Complete versions on disk, oldest first"""
+        return sorted(int(name) for name in os.listdir(self.directory)
+                      if name.isdigit() and os.path.exists(self._path(name, MANIFEST_NAME)))
+
+    def current_version(self):
+        """Version named by CURRENT, or None if no models have been saved"""
+        try:
+            with open(self._path(CURRENT_NAME)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def manifest(self, version=None):
+        """Manifest of a version (the current one by default), or None"""
+        version = self.current_version() if version is None else version
+        if version is None:
+            return None
+        try:
+            with open(self._path(str(version), MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, cnn_model, hmm_model, training_samples, record_ids=None):
+        """
+        Write the models as a new version and make it current
+
+        Args:
+            cnn_model: Model from build_cnn_model
+            hmm_model: KeystrokeHMM
+            training_samples: Number of stored training samples the models have seen
+            record_ids: Optional {'cnn', 'hmm', 'combined'} TrainedModel ids
+
+        Returns:
+            The new version number
+        """
+        try:
+            hmm_config, hmm_arrays = hmm_model.get_state()
+            arrays = {f"hmm.{name}": value for name, value in hmm_arrays.items()}
+            arrays.update({f"cnn.{name}": value for name, value in cnn_model.get_weights().items()})
+
+            with self._file_lock():
+                version = max(max(self.versions(), default=0), self._last_version()) + 1
+                self._write_file(LAST_VERSION_NAME, f"{version}\n")
+                staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+                try:
+                    files = {}
+                    for name, array in arrays.items():
+                        files[name] = f"{name}.npy"
+                        np.save(os.path.join(staging, files[name]), np.ascontiguousarray(array))
+                    manifest = {
+                        'format_version': FORMAT_VERSION,
+                        'version': version,
+                        'created_at': time.time(),
+                        'training_samples': training_samples,
+                        'trained_model_ids': record_ids or {},
+                        'feature_pipeline': pipeline_fingerprint(),
+                        'cnn': {
+                            'name': cnn_model.name,
+                            'input_shape': list(cnn_model.input_shape),
+                            'num_classes': int(cnn_model.output_shape[-1])
+                        },
+                        'hmm': hmm_config,
+                        'arrays': files
+                    }
+                    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+                        json.dump(manifest, f, indent=2)
+                    os.rename(staging, self._path(str(version)))
+                except Exception:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+
+                self._set_current(version)
+                self._prune(version)
+
+            logger.info(f"Saved model artifact version {version}")
+            return version
+
+        except Exception as e:
+            logger.error(f"Error saving model artifact: {e}")
+            raise
+
+    def link_records(self, version, record_ids):
+        """Record the TrainedModel ids of a saved version in its manifest"""
+        with self._file_lock():
+            manifest = self.manifest(version)
+            if manifest is None:
+                return
+            manifest['trained_model_ids'] = record_ids
+            fd, tmp = tempfile.mkstemp(dir=self._path(str(version)), prefix='.manifest-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp, self._path(str(version), MANIFEST_NAME))
+
+    def _last_version(self):
+        try:
+            with open(self._path(LAST_VERSION_NAME)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_file(self, name, text):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{name.lower()}-")
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp, self._path(name))
+
+    def _set_current(self, version):
+        self._write_file(CURRENT_NAME, f"{version}\n")
+
+    def _prune(self, current):
+        # Mapped files stay valid in processes still using a deleted version
+        for version in self.versions()[:-self.keep]:
+            if version != current:
+                shutil.rmtree(self._path(str(version)), ignore_errors=True)
+
+    def load(self, version=None):
+        """
+        Memory-map a saved version
+
+        Args:
+            version: Version to load (the current one if None)
+
+        Returns:
+            Tuple of (cnn_model, hmm_model, manifest), or None if there is no
+            usable version (none saved, another format, or features computed
+            by a different pipeline)
+        """
+        try:
+            manifest = self.manifest(version)
+            if manifest is None:
+                return None
+            if manifest.get('format_version') != FORMAT_VERSION:
+                logger.warning(f"Ignoring model artifact {manifest.get('version')}: format {manifest.get('format_version')}")
+                return None
+            if manifest.get('feature_pipeline') != pipeline_fingerprint():
+                logger.warning(f"Ignoring model artifact {manifest['version']}: built for another feature pipeline")
+                return None
+
+            directory = self._path(str(manifest['version']))
+            arrays = {}
+            for name, filename in manifest['arrays'].items():
+                # Statistics are updated in place by partial_fit: map them copy-on-write
+                statistic = name.startswith('hmm.') and name[len('hmm.'):] in HMM_STATISTICS
+                arrays[name] = np.load(os.path.join(directory, filename), mmap_mode='c' if statistic else 'r')
+
+            cnn_config = manifest['cnn']
+            cnn_model = build_cnn_model(tuple(cnn_config['input_shape']), cnn_config['num_classes'])
+            cnn_model.set_weights({name[len('cnn.'):]: value for name, value in arrays.items()
+                                   if name.startswith('cnn.')})
+            hmm_model = KeystrokeHMM.from_state(manifest['hmm'], {
+                name[len('hmm.'):]: value for name, value in arrays.items() if name.startswith('hmm.')})
+
+            logger.info(f"Loaded model artifact version {manifest['version']} "
+                        f"({manifest['training_samples']} training samples)")
+            return cnn_model, hmm_model, manifest
+
+        except Exception as e:
+            logger.error(f"Error loading model artifact: {e}")
+            raise
+
+    def clear(self):
+        """
+        Forget the current models (e.g. after the training data is reset) and delete every version
+
+        Version numbers keep counting from the last one saved, so a worker still
+        serving a deleted version always sees the next save as a new version.
+        """
+        with self._file_lock():
+            try:
+                os.remove(self._path(CURRENT_NAME))
+            except FileNotFoundError:
+                pass
+            for version in self.versions():
+                shutil.rmtree(self._path(str(version)), ignore_errors=True)
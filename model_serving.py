@@ -0,0 +1,145 @@
+import contextlib
+import fcntl
+import logging
+import os
+import threading
+
+from ml_models import train_model, update_models
+from model_artifacts import CURRENT_NAME
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+PUBLISH_LOCK_NAME = '.publish.lock'
+
+class ModelServer:
+    """
+    Serves the current model generation to every worker process
+
+    Models live only in the artifact store. Each worker memory-maps the
+    current version, so resident model memory does not grow with the
+    number of workers, and all workers map the same pages. Before serving,
+    models() compares the store's CURRENT file with the generation it has
+    mapped (one stat call) and switches to a newer one, so a model published
+    by any worker is served by all of them from their next request.
+
+    Publishing is serialized across processes with a file lock. A new
+    generation always folds every sample in the shared dataset store into
+    the latest published models, so concurrent training in different
+    workers never loses samples.
+    """
+
+    def __init__(self, store, training_data):
+        """
+        Args:
+            store: model_artifacts.ModelArtifactStore
+            training_data: dataset_store.DatasetStore shared by the workers
+        """
+        self.store = store
+        self.training_data = training_data
+        self._served = (None, None, None)
+        self._seen = None
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    def _current_stat(self):
+        try:
+            stat = os.stat(os.path.join(self.store.directory, CURRENT_NAME))
+        except FileNotFoundError:
+            return None
+        # CURRENT is replaced, never rewritten, so a new generation has a new inode
+        return stat.st_ino, stat.st_mtime_ns
+
+    @property
+    def version(self):
+        """Version of the generation being served (None without models)"""
+        return self._served[2]
+
+    def models(self):
+        """
+        Models of the current generation, switching to a newer one first
+
+        Returns:
+            Tuple of (cnn_model, hmm_model, version); all None before any training.
+            The pair stays consistent for the caller even if a switch follows.
+        """
+        stat = self._current_stat()
+        if stat != self._seen:
+            with self._lock:
+                if stat != self._seen:
+                    self._switch(stat)
+        return self._served
+
+    def _switch(self, stat):
+        try:
+            # CURRENT was replaced, so it names a generation other than the one
+            # mapped, even if a reset made the version numbers look the same
+            version = self.store.current_version()
+            if version is None:
+                self._served = (None, None, None)
+            else:
+                loaded = self.store.load(version)
+                if loaded is None:
+                    self._served = (None, None, None)
+                else:
+                    cnn_model, hmm_model, _ = loaded
+                    self._served = (cnn_model, hmm_model, version)
+                    logger.info(f"Worker {os.getpid()} serving model version {version}")
+            self._seen = stat
+        except Exception as e:
+            # Keep serving the previous generation; the switch is retried on the next request
+            logger.error(f"Could not switch to the current model version: {e}")
+
+    @contextlib.contextmanager
+    def _publishing(self):
+        """Exclusive right to publish, within this process and across processes"""
+        with self._publish_lock, open(os.path.join(self.store.directory, PUBLISH_LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, rebuild=False):
+        """
+        Bring the models up to date with the dataset store and publish them
+
+        Args:
+            rebuild: Retrain from scratch on every stored sample instead of
+                updating the latest generation with the samples it has not seen
+
+        Returns:
+            Version now current (None if there is no training data)
+        """
+        with self._publishing():
+            n_samples = len(self.training_data)
+            loaded = None if rebuild else self.store.load()
+            if loaded is not None and loaded[2]['training_samples'] > n_samples:
+                # The store was rebuilt with fewer samples: the artifact no longer matches it
+                loaded = None
+                rebuild = True
+
+            if loaded is not None and loaded[2]['training_samples'] == n_samples:
+                version = loaded[2]['version']
+            elif n_samples == 0:
+                return None
+            elif loaded is None:
+                cnn_model, hmm_model = train_model(self.training_data)
+                version = self.store.save(cnn_model, hmm_model, n_samples)
+            else:
+                cnn_model, hmm_model, manifest = loaded
+                new_samples = [self.training_data[i] for i in range(manifest['training_samples'], n_samples)]
+                cnn_model, hmm_model = update_models((cnn_model, hmm_model), new_samples)
+                version = self.store.save(cnn_model, hmm_model, n_samples)
+
+        # Serve the mapped copy of what was just published
+        self.models()
+        return version
+
+    def clear(self):
+        """Delete every training sample and every model generation"""
+        with self._publishing():
+            self.training_data.clear()
+            self.store.clear()
+        self.models()
@@ -0,0 +1,236 @@
+import numpy as np
+import logging
+from scipy import ndimage, signal
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Default analysis frame and hop, in seconds
+FRAME_DURATION = 0.016
+HOP_DURATION = 0.004
+
+# Audio kept before each onset when cutting keystroke segments, in seconds
+PRE_ROLL = 0.005
+
+# Default adaptive threshold of OnsetDetector: moving mean window (seconds),
+# its scale and offset, the minimum time between onsets and the RMS gate length
+THRESHOLD_WINDOW = 0.2
+THRESHOLD_MULTIPLIER = 1.5
+THRESHOLD_DELTA = 1.0
+MIN_ONSET_INTERVAL = 0.025
+GATE_DURATION = 0.02
+
+# Default length limits of keystroke segments, in seconds
+SEGMENT_MIN_DURATION = 0.05
+SEGMENT_MAX_DURATION = 0.1
+
+# Detection functions that can be combined by OnsetDetector
+ONSET_METHODS = ('energy', 'flux', 'hfc')
+
+# Samples processed per vectorized pass in detect_onsets
+DETECT_CHUNK_SAMPLES = 1 << 20
+
+def frame_signal(y, frame_length, hop_length):
+    """
+    Split a signal into overlapping frames without copying it
+
+    Args:
+        y: 1-D array
+        frame_length: Samples per frame
+        hop_length: Samples between frame starts
+
+    Returns:
+        Read-only strided view of shape (n_frames, frame_length)
+    """
+    if len(y) < frame_length:
+        return np.zeros((0, frame_length), dtype=y.dtype)
+    return np.lib.stride_tricks.sliding_window_view(y, frame_length)[::hop_length]
+
+def _positive_diff(values, previous):
+    """Half-wave rectified first difference along axis 0, continuing from a previous row"""
+    return np.maximum(np.diff(values, axis=0, prepend=previous[np.newaxis]), 0)
+
+class OnsetDetector:
+    """
+    Vectorized onset detector built on energy, spectral-flux and high-frequency-content novelty
+
+    All per-frame work is done with array operations over the frames of each
+    block. The detector keeps a short history between calls to process(), so a
+    recording can be fed in any block sizes (down to live capture chunks) and
+    gives the same onsets as a single call over the whole signal, apart from
+    peaks closer than min_interval straddling a block boundary.
+
+    Onsets are reported with a latency of lookahead frames; flush() reports the
+    rest once the stream ends.
+    """
+
+    def __init__(self, sr, frame_length=None, hop_length=None, methods=ONSET_METHODS,
+                 threshold_window=THRESHOLD_WINDOW, multiplier=THRESHOLD_MULTIPLIER, delta=THRESHOLD_DELTA,
+                 min_interval=MIN_ONSET_INTERVAL, rms_threshold=None, gate_duration=GATE_DURATION):
+        """
+        Args:
+            sr: Sample rate
+            frame_length: Samples per analysis frame (FRAME_DURATION if None)
+            hop_length: Samples between frames (HOP_DURATION if None)
+            methods: Novelty functions to average, any of ONSET_METHODS
+            threshold_window: Length (seconds) of the moving mean used as adaptive threshold
+            multiplier: Scale applied to the moving mean
+            delta: Offset added to the threshold, in log-magnitude units
+            min_interval: Minimum time (seconds) between two onsets
+            rms_threshold: Minimum frame RMS just after an onset (None disables the gate)
+            gate_duration: Time (seconds) after an onset searched for the RMS gate
+        """
+        unknown = set(methods) - set(ONSET_METHODS)
+        if unknown or not methods:
+            raise ValueError(f"Unknown onset methods: {sorted(unknown) or methods}")
+
+        self.sr = sr
+        self.frame_length = frame_length or int(round(FRAME_DURATION * sr))
+        self.hop_length = hop_length or int(round(HOP_DURATION * sr))
+        self.methods = tuple(methods)
+        self.window_frames = max(1, int(round(threshold_window * sr / self.hop_length)))
+        self.multiplier = multiplier
+        self.delta = delta
+        self.min_gap = max(1, int(round(min_interval * sr / self.hop_length)))
+        self.rms_threshold = rms_threshold
+        self.gate_frames = max(1, int(round(gate_duration * sr / self.hop_length)))
+        self.lookahead = max(self.window_frames // 2, self.gate_frames) + 1
+
+        self.window = signal.get_window('hann', self.frame_length).astype(np.float32)
+        self.bin_weights = np.arange(self.frame_length // 2 + 1, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget all stream state"""
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.prev = None  # Features of the last frame, for the novelty differences
+        self.odf = np.zeros(0, dtype=np.float32)
+        self.rms = np.zeros(0, dtype=np.float32)
+        self.hist_start = 0  # Frame index of odf[0]
+        self.picked_upto = 0  # Frames before this index have been searched for peaks
+        self.last_onset = None
+
+    def _novelty(self, frames):
+        """Onset detection function and RMS for a block of frames"""
+        frames = frames.astype(np.float32)
+        rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / self.frame_length)
+        mag = np.abs(np.fft.rfft(frames * self.window, axis=1)).astype(np.float32)
+
+        eps = 1e-10
+        features = {
+            'energy': np.log(rms + eps),
+            'flux': np.log(mag + eps),
+            'hfc': np.log(np.square(mag) @ self.bin_weights + eps)
+        }
+        if self.prev is None:
+            # No history yet: the first frame is its own predecessor
+            self.prev = {name: values[0] for name, values in features.items()}
+
+        odf = np.zeros(len(frames), dtype=np.float32)
+        for name in self.methods:
+            novelty = _positive_diff(features[name], self.prev[name])
+            odf += novelty.mean(axis=1) if novelty.ndim == 2 else novelty
+        self.prev = {name: values[-1] for name, values in features.items()}
+        return odf / len(self.methods), rms
+
+    def process(self, block):
+        """
+        Feed the next block of samples
+
+        Args:
+            block: 1-D float array
+
+        Returns:
+            Sample indices (from the start of the stream) of newly confirmed onsets
+        """
+        self.buf = np.concatenate([self.buf, np.asarray(block, dtype=np.float32)])
+        frames = frame_signal(self.buf, self.frame_length, self.hop_length)
+        if len(frames) > 0:
+            odf, rms = self._novelty(frames)
+            self.odf = np.concatenate([self.odf, odf])
+            self.rms = np.concatenate([self.rms, rms])
+            self.buf = self.buf[len(frames) * self.hop_length:]
+        return self._pick(final=False)
+
+    def flush(self):
+        """Report the onsets still held back for lookahead at the end of the stream"""
+        return self._pick(final=True)
+
+    def _pick(self, final):
+        total = self.hist_start + len(self.odf)
+        limit = total if final else total - self.lookahead
+        if limit <= self.picked_upto:
+            return np.zeros(0, dtype=np.int64)
+
+        # Adaptive threshold: scaled moving mean of the detection function plus an offset
+        threshold = self.multiplier * ndimage.uniform_filter1d(self.odf, self.window_frames, mode='nearest')
+        peaks, _ = signal.find_peaks(self.odf, height=threshold + self.delta, distance=self.min_gap)
+
+        if self.rms_threshold is not None and len(peaks) > 0:
+            # Require some energy just after the onset so noise bursts are ignored
+            padded = np.pad(self.rms, (0, self.gate_frames - 1), mode='edge')
+            ahead = np.lib.stride_tricks.sliding_window_view(padded, self.gate_frames).max(axis=1)
+            peaks = peaks[ahead[peaks] > self.rms_threshold]
+
+        peaks = peaks + self.hist_start
+        peaks = peaks[(peaks >= self.picked_upto) & (peaks < limit)]
+        if self.last_onset is not None:
+            peaks = peaks[peaks >= self.last_onset + self.min_gap]
+        if len(peaks) > 0:
+            self.last_onset = int(peaks[-1])
+        self.picked_upto = limit
+
+        # Keep enough history for the moving mean and peak spacing of the next call
+        keep_from = max(self.hist_start, limit - self.window_frames - self.min_gap)
+        self.odf = self.odf[keep_from - self.hist_start:]
+        self.rms = self.rms[keep_from - self.hist_start:]
+        self.hist_start = keep_from
+
+        # Each novelty value compares a frame with the previous one, so the onset
+        # lies in the last hop of the frame
+        return peaks * self.hop_length + (self.frame_length - self.hop_length)
+
+def detect_onsets(y, sr, **kwargs):
+    """
+    Detect onsets in a complete signal
+
+    Args:
+        y: 1-D float array
+        sr: Sample rate
+        **kwargs: OnsetDetector parameters
+
+    Returns:
+        Sorted int64 array of onset sample indices
+    """
+    detector = OnsetDetector(sr, **kwargs)
+    onsets = [detector.process(y[start:start + DETECT_CHUNK_SAMPLES])
+              for start in range(0, len(y), DETECT_CHUNK_SAMPLES)]
+    onsets.append(detector.flush())
+    return np.concatenate(onsets)
+
+def segment_bounds(onsets, n_samples, sr, pre_roll=PRE_ROLL, max_duration=SEGMENT_MAX_DURATION,
+                   min_duration=SEGMENT_MIN_DURATION):
+    """
+    Turn onset positions into keystroke segment boundaries
+
+    Each segment starts pre_roll before its onset and ends max_duration later,
+    or at the start of the next segment if that comes first.
+
+    Args:
+        onsets: Sorted onset sample indices
+        n_samples: Length of the signal
+        sr: Sample rate
+        pre_roll: Time (seconds) included before each onset
+        max_duration: Maximum segment length (seconds)
+        min_duration: Segments shorter than this (seconds) are dropped
+
+    Returns:
+        Tuple of (starts, ends) sample index arrays
+    """
+    onsets = np.asarray(onsets, dtype=np.int64)
+    starts = np.maximum(onsets - int(pre_roll * sr), 0)
+    next_starts = np.append(starts[1:], n_samples)
+    ends = np.minimum(np.minimum(starts + int(max_duration * sr), next_starts), n_samples)
+    keep = ends - starts >= int(min_duration * sr)
+    return starts[keep], ends[keep]
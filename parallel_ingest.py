@@ -0,0 +1,245 @@
+import numpy as np
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+
+from audio_processor import as_audio_source
+from feature_cache import compute_analysis, analysis_result, lookup_analysis
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Alignment of each array inside a shared memory block
+SHM_ALIGNMENT = 64
+
+# Files submitted to the pool per worker before waiting for one to finish; bounds
+# the uploads held in shared memory at once while keeping every worker busy
+IN_FLIGHT_PER_WORKER = 2
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def default_workers():
+    """Number of worker processes used when none is configured"""
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+
+def get_executor(workers):
+    """
+    Return the shared process pool, (re)creating it with the given number of workers
+
+    Workers are started with forkserver (spawn where it is not available)
+    rather than fork, so they never inherit the web server's threads or locks.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            context = multiprocessing.get_context(method)
+            if method == 'forkserver':
+                context.set_forkserver_preload([__name__])
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _executor_workers = workers
+        return _executor
+
+def shutdown_executor():
+    """Stop the shared process pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+def _copy_to_shared_memory(source):
+    """
+    Copy the bytes of an audio source into a new shared memory block
+
+    Returns:
+        Tuple of (SharedMemory, size)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source).cast('B')
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        return shm, len(data)
+
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    view = shm.buf[:size]
+    read = 0
+    while read < size:
+        n = source.readinto(view[read:])
+        if not n:
+            raise ValueError("Upload ended before its reported size")
+        read += n
+    view.release()
+    return shm, size
+
+def _pack_arrays(arrays):
+    """Write arrays into one new shared memory block, returning (name, layout)"""
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = (offset, array.dtype.str, array.shape)
+        offset += -(-array.nbytes // SHM_ALIGNMENT) * SHM_ALIGNMENT
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for name, array in arrays.items():
+            start, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = array
+        return shm.name, layout
+    finally:
+        shm.close()
+
+def _unpack_arrays(name, layout):
+    """Copy arrays out of a shared memory block written by _pack_arrays, then free it"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return {
+            key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start).copy()
+            for key, (start, dtype, shape) in layout.items()
+        }
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _analyze_in_worker(input_name, size, path):
+    """
+    Pool task: analyze one file from shared memory (or a path)
+
+    Returns:
+        (name, layout) of the shared memory block holding the result arrays
+    """
+    if path is not None:
+        return _pack_arrays(compute_analysis(path))
+
+    shm = shared_memory.SharedMemory(name=input_name)
+    try:
+        arrays = compute_analysis(shm.buf[:size])
+        # Results must not reference the input block, which the parent frees
+        return _pack_arrays(arrays)
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # A traceback still holds a view of the block; it is unmapped when collected
+            pass
+
+def ingest_files(files, cache=None, workers=None, progress=None):
+    """
+    Decode, preprocess and extract features for many files in parallel
+
+    Cached files are served from the cache in the calling process. The rest
+    are analyzed by a process pool: each upload is copied once into shared
+    memory, and each worker writes its result arrays into a shared memory
+    block that is copied out and freed here, so no audio is pickled. At
+    most IN_FLIGHT_PER_WORKER files per worker are submitted at a time, so
+    only that many uploads are held in shared memory. Files that fail are
+    reported individually without affecting the others.
+
+    Args:
+        files: List of (name, source) pairs; sources as accepted by process_audio
+        cache: FeatureCache to consult and fill (None disables caching)
+        workers: Number of worker processes (default_workers() if None);
+            1 analyzes the files in this process
+        progress: Optional callable invoked with the file name as each file
+            finishes; an exception it raises stops the ingestion (files still
+            being analyzed are waited for and their results discarded)
+
+    Returns:
+        List of (name, audio_data, error) in input order: audio_data as from
+        feature_cache.analyze_audio, or None with an error message on failure
+    """
+    workers = workers or default_workers()
+    results = [None] * len(files)
+    pending = []
+
+    def _done(i, result):
+        results[i] = result
+        if progress is not None:
+            progress(result[0])
+
+    for i, (name, source) in enumerate(files):
+        try:
+            source = as_audio_source(source)
+            key, arrays = lookup_analysis(source, cache)
+        except Exception as e:
+            logger.error(f"Error reading {name}: {e}")
+            _done(i, (name, None, str(e)))
+            continue
+        if arrays is not None:
+            _done(i, (name, analysis_result(arrays), None))
+        else:
+            pending.append((i, name, source, key))
+
+    def _analyzed(i, name, key, compute):
+        try:
+            arrays = compute()
+        except Exception as e:
+            logger.error(f"Error processing {name}: {e}")
+            return _done(i, (name, None, str(e)))
+        if key is not None:
+            cache.put(key, arrays)
+        _done(i, (name, analysis_result(arrays), None))
+
+    if workers <= 1 or len(pending) <= 1:
+        for i, name, source, key in pending:
+            _analyzed(i, name, key, lambda: compute_analysis(source))
+        return results
+
+    executor = get_executor(workers)
+    submitted = {}
+
+    def _collect_first():
+        done, _ = concurrent.futures.wait(list(submitted), return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            i, name, key, shm = submitted.pop(future)
+            _release(shm)
+            _analyzed(i, name, key, lambda: _unpack_arrays(*future.result()))
+
+    try:
+        for i, name, source, key in pending:
+            if len(submitted) >= IN_FLIGHT_PER_WORKER * workers:
+                _collect_first()
+            shm = None
+            try:
+                if isinstance(source, (str, os.PathLike)):
+                    future = executor.submit(_analyze_in_worker, None, 0, os.fspath(source))
+                else:
+                    shm, size = _copy_to_shared_memory(source)
+                    future = executor.submit(_analyze_in_worker, shm.name, size, None)
+            except Exception as e:
+                logger.error(f"Error submitting {name}: {e}")
+                _release(shm)
+                _done(i, (name, None, str(e)))
+                continue
+            submitted[future] = (i, name, key, shm)
+
+        while submitted:
+            _collect_first()
+    finally:
+        # Only reached with work left when stopped early: free every block still in use
+        for future, (_, _, _, shm) in submitted.items():
+            if not future.cancel():
+                try:
+                    _unpack_arrays(*future.result())
+                except Exception:
+                    pass
+            _release(shm)
+
+    logger.debug(f"Ingested {len(files)} files ({len(pending)} analyzed) with {workers} workers")
+    return results
+
+def _release(shm):
+    if shm is not None:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,203 @@
+import numpy as np
+import base64
+import functools
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from audio_processor import max_pool
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Columns per tile at every level
+TILE_WIDTH = 256
+
+# Frequency rows kept at level 0 and the floor for coarser levels
+BASE_ROWS = 256
+MIN_ROWS = 64
+
+# Number of encoded tiles kept in memory across requests
+TILE_CACHE_SIZE = 1024
+
+MANIFEST_NAME = 'manifest.json'
+
+def build_pyramid(spectrogram, directory, tile_width=TILE_WIDTH):
+    """
+    Precompute and store a multi-resolution tile pyramid for a spectrogram
+
+    Level 0 keeps every STFT column with the frequency axis max-pooled to
+    BASE_ROWS rows. Each further level halves the number of columns (and the
+    rows, down to MIN_ROWS) until the whole recording fits in one tile. Levels
+    are stored as uint8 .npy files so they can be memory-mapped when served.
+
+    Args:
+        spectrogram: Dictionary from audio_processor.compute_spectrogram
+        directory: Directory to write the pyramid into (replaced if it exists)
+        tile_width: Columns per tile
+
+    Returns:
+        The manifest dictionary
+    """
+    try:
+        time = spectrogram['time']
+        data, freq_factor = max_pool(spectrogram['data'], 0, BASE_ROWS)
+        level_data = np.rint(data * 255).astype(np.uint8)
+        freq = spectrogram['freq']
+        time_step = float(time[1] - time[0]) if len(time) > 1 else 0.0
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix='.pyramid-')
+
+        levels = []
+        time_factor = 1
+        while True:
+            np.save(os.path.join(staging, f"level_{len(levels)}.npy"), level_data)
+            levels.append({
+                'level': len(levels),
+                'shape': list(level_data.shape),
+                'time_factor': time_factor,
+                'freq_range': _axis_range(freq, freq_factor),
+                'num_tiles': -(-level_data.shape[1] // tile_width)
+            })
+            if level_data.shape[1] <= tile_width:
+                break
+            level_data, _ = max_pool(level_data, 1, -(-level_data.shape[1] // 2))
+            time_factor *= 2
+            if level_data.shape[0] // 2 >= MIN_ROWS:
+                level_data, _ = max_pool(level_data, 0, -(-level_data.shape[0] // 2))
+                freq_factor *= 2
+
+        manifest = {
+            'tile_width': tile_width,
+            'time_start': float(time[0]) if len(time) else 0.0,
+            'time_step': time_step,
+            'num_columns': int(spectrogram['data'].shape[1]),
+            'duration': float(time[-1] + time_step / 2) if len(time) else 0.0,
+            'min_value': spectrogram['min_value'],
+            'max_value': spectrogram['max_value'],
+            'levels': levels
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+
+        # Swap the finished pyramid into place so readers never see a partial one
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(staging, directory)
+
+        logger.debug(f"Built spectrogram pyramid in {directory}: {len(levels)} levels")
+        return manifest
+
+    except Exception as e:
+        logger.error(f"Error building spectrogram pyramid: {e}")
+        raise
+
+def _axis_range(values, factor):
+    """First and last centre of groups of factor consecutive axis values"""
+    groups = -(-len(values) // factor)
+    return [float(np.mean(values[:factor])), float(np.mean(values[(groups - 1) * factor:]))]
+
+class SpectrogramPyramid:
+    """Read-only view of a stored tile pyramid; levels are memory-mapped on first use"""
+
+    def __init__(self, directory, build=None):
+        """
+        Args:
+            directory: Directory written by build_pyramid
+            build: Build id of the pyramid (see _build_id), keying its cached tiles
+        """
+        self.directory = directory
+        self.build = build
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+        self._levels = {}
+
+    @property
+    def duration(self):
+        return self.manifest['duration']
+
+    def level_data(self, level):
+        if level not in self._levels:
+            path = os.path.join(self.directory, f"level_{level}.npy")
+            self._levels[level] = np.load(path, mmap_mode='r')
+        return self._levels[level]
+
+    def column_range(self, level, start_time, end_time):
+        """Columns of a level that overlap [start_time, end_time)"""
+        info = self.manifest['levels'][level]
+        step = self.manifest['time_step'] * info['time_factor'] or 1.0
+        origin = self.manifest['time_start'] - self.manifest['time_step'] / 2
+        first = max(0, int(np.floor((start_time - origin) / step)))
+        last = min(info['shape'][1], int(np.ceil((end_time - origin) / step)))
+        return first, max(first, last)
+
+    def level_for_width(self, start_time, end_time, width):
+        """Finest level that shows [start_time, end_time) in at most width columns"""
+        for info in self.manifest['levels']:
+            first, last = self.column_range(info['level'], start_time, end_time)
+            if last - first <= width:
+                return info['level']
+        return len(self.manifest['levels']) - 1
+
+    def tile_indices(self, level, start_time, end_time):
+        first, last = self.column_range(level, start_time, end_time)
+        tile_width = self.manifest['tile_width']
+        return range(first // tile_width, -(-last // tile_width))
+
+    def tile(self, level, index):
+        """Encoded tile, in the same uint8 payload format as pack_spectrogram"""
+        return _encoded_tile(self.directory, self.build, level, index)
+
+    def tiles(self, level, start_time, end_time):
+        return [self.tile(level, index) for index in self.tile_indices(level, start_time, end_time)]
+
+def _build_id(directory):
+    """Identifies one build of the pyramid in directory: every build writes a new manifest file"""
+    stat = os.stat(os.path.join(directory, MANIFEST_NAME))
+    return stat.st_ino, stat.st_mtime_ns
+
+def open_pyramid(directory):
+    """
+    Open (and keep open) the pyramid stored in directory
+
+    Opened pyramids and their encoded tiles are cached by directory and
+    build, so rebuilding one pyramid makes its cached entries unreachable
+    (they age out of the LRU caches) without dropping those of the others.
+    """
+    return _open_pyramid(directory, _build_id(directory))
+
+@functools.lru_cache(maxsize=64)
+def _open_pyramid(directory, build):
+    return SpectrogramPyramid(directory, build)
+
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def _encoded_tile(directory, build, level, index):
+    pyramid = _open_pyramid(directory, build)
+    manifest = pyramid.manifest
+    info = manifest['levels'][level]
+    if not 0 <= index < info['num_tiles']:
+        raise IndexError(f"Tile {index} out of range for level {level}")
+
+    tile_width = manifest['tile_width']
+    data = np.ascontiguousarray(pyramid.level_data(level)[:, index * tile_width:(index + 1) * tile_width])
+    step = manifest['time_step'] * info['time_factor']
+    # Centre of the first column of this level, then of this tile
+    first_centre = manifest['time_start'] + manifest['time_step'] * (info['time_factor'] - 1) / 2
+    start = first_centre + index * tile_width * step
+
+    return {
+        'encoding': 'uint8',
+        'level': level,
+        'index': index,
+        'shape': list(data.shape),
+        'data': base64.b64encode(data.tobytes()).decode('ascii'),
+        'time_range': [start, start + (data.shape[1] - 1) * step],
+        'freq_range': info['freq_range'],
+        'min_value': manifest['min_value'],
+        'max_value': manifest['max_value']
+    }
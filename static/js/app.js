@@ -25,6 +25,41 @@ document.addEventListener('DOMContentLoaded', function() {
     const trainingProgressStatus = document.getElementById('trainingProgressStatus');
     const filesProcessed = document.getElementById('filesProcessed');
     const totalFiles = document.getElementById('totalFiles');
+    const cancelTrainingButton = document.getElementById('cancelTrainingButton');
+
+    // Human-readable names of the training job stages
+    const trainingStageLabels = {
+        processing_files: 'Decoding audio and extracting features...',
+        fitting_model: 'Updating the models...',
+        writing_records: 'Saving training records...'
+    };
+
+    // Poll a background job until it finishes, passing each status to onUpdate
+    function pollJob(statusUrl, onUpdate, interval = 500) {
+        return new Promise((resolve, reject) => {
+            const poll = () => {
+                fetch(statusUrl)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (job.error && !job.status) {
+                            throw new Error(job.error);
+                        }
+                        if (onUpdate) onUpdate(job);
+                        if (job.status === 'succeeded') {
+                            resolve(job);
+                        } else if (job.status === 'failed') {
+                            reject(new Error(job.error || 'Training failed'));
+                        } else if (job.status === 'cancelled') {
+                            reject(new Error('Training was cancelled'));
+                        } else {
+                            setTimeout(poll, interval);
+                        }
+                    })
+                    .catch(reject);
+            };
+            poll();
+        });
+    }
 
     // Handle file upload form submission
     const uploadForm = document.getElementById('uploadForm');
@@ -94,6 +129,8 @@ document.addEventListener('DOMContentLoaded', function() {
             }, 1500);
 
             const formData = new FormData(uploadForm);
+            const sizeHints = spectrogramSizeHints(document.getElementById('spectrogramContainer'));
+            Object.entries(sizeHints).forEach(([key, value]) => formData.append(key, value));
 
             fetch('/upload', {
                 method: 'POST',
@@ -167,6 +204,13 @@ document.addEventListener('DOMContentLoaded', function() {
                         if (spectrogramContainer) {
                             // Call the visualization function from visualizations.js
                             renderSpectrogram(data.spectrogram, spectrogramContainer);
+                            if (spectrogramContainer.tileViewer) {
+                                spectrogramContainer.tileViewer.destroy();
+                                spectrogramContainer.tileViewer = null;
+                            }
+                            if (data.spectrogram_tiles) {
+                                spectrogramContainer.tileViewer = new SpectrogramTileViewer(spectrogramContainer, data.spectrogram_tiles);
+                            }
                         }
                     }
 
@@ -198,10 +242,31 @@ document.addEventListener('DOMContentLoaded', function() {
     if (recordButton && stopButton) {
         // Initialize audio recorder
         const audioRecorder = new AudioRecorder();
+        const liveTranscript = document.getElementById('liveTranscript');
+        let committedText = '';
+
+        // Live results: committed text is final, the partial tail may still change
+        const showStreamUpdate = update => {
+            committedText += update.committed_text;
+            if (liveTranscript) {
+                liveTranscript.innerHTML = '';
+                const committed = document.createElement('span');
+                committed.textContent = committedText;
+                const partial = document.createElement('span');
+                partial.className = 'text-muted';
+                partial.textContent = update.partial_text;
+                liveTranscript.append(committed, partial);
+            }
+        };
 
         recordButton.addEventListener('click', function() {
-            // Start recording
-            audioRecorder.start()
+            committedText = '';
+            if (liveTranscript) {
+                liveTranscript.textContent = '';
+            }
+
+            // Start recording, with live detection while it runs
+            audioRecorder.start(showStreamUpdate)
                 .then(() => {
                     recordButton.classList.add('d-none');
                     stopButton.classList.remove('d-none');
@@ -282,6 +347,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Create form data with audio blob
                     const formData = new FormData();
                     formData.append('audio_data', audioBlob, 'recording.wav');
+                    const sizeHints = spectrogramSizeHints(document.getElementById('spectrogramContainer'));
+                    Object.entries(sizeHints).forEach(([key, value]) => formData.append(key, value));
 
                     // Send to server
                     fetch('/record', {
@@ -352,6 +419,13 @@ document.addEventListener('DOMContentLoaded', function() {
                                 if (spectrogramContainer) {
                                     // Call the visualization function from visualizations.js
                                     renderSpectrogram(data.spectrogram, spectrogramContainer);
+                                    if (spectrogramContainer.tileViewer) {
+                                        spectrogramContainer.tileViewer.destroy();
+                                        spectrogramContainer.tileViewer = null;
+                                    }
+                                    if (data.spectrogram_tiles) {
+                                        spectrogramContainer.tileViewer = new SpectrogramTileViewer(spectrogramContainer, data.spectrogram_tiles);
+                                    }
                                 }
                             }
 
@@ -416,11 +490,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
 
                 const data = await response.json();
-                if (response.ok) {
-                    alert('Training completed successfully!');
-                } else {
+                if (!response.ok) {
                     alert('Error: ' + data.error);
+                    return;
                 }
+
+                // Training runs in the background; wait for the job to finish
+                await pollJob(data.status_url);
+                alert('Training completed successfully!');
             } catch (error) {
                 console.error('Error:', error);
                 alert('Error uploading files: ' + error.message);
@@ -536,48 +613,23 @@ document.addEventListener('DOMContentLoaded', function() {
             // Create FormData
             const formData = new FormData(bulkTrainingForm);
 
-            // Simulate progress updates (in a real implementation, this would come from the server)
-            let progress = 0;
-            const totalSteps = bulkTrainingFiles.files.length * 2; // Upload + processing
-            const progressInterval = setInterval(() => {
-                progress += 1;
-
-                // Calculate percentage
-                const percentage = Math.min(Math.floor((progress / totalSteps) * 100), 99);
-
-                // Update progress bar
-                if (trainingProgressBar) {
-                    trainingProgressBar.style.width = `${percentage}%`;
-                    trainingProgressBar.setAttribute('aria-valuenow', percentage);
-                    trainingProgressBar.textContent = `${percentage}%`;
-                }
-
-                // Update file counter (each file has multiple steps)
-                const currentFileIndex = Math.min(Math.floor(progress / 2), bulkTrainingFiles.files.length);
-                if (filesProcessed) {
-                    filesProcessed.textContent = currentFileIndex;
-                }
-
-                // Update status message based on progress
-                if (trainingProgressStatus) {
-                    if (percentage < 20) {
-                        trainingProgressStatus.textContent = 'Uploading files...';
-                    } else if (percentage < 40) {
-                        trainingProgressStatus.textContent = 'Processing audio data...';
-                    } else if (percentage < 60) {
-                        trainingProgressStatus.textContent = 'Extracting features...';
-                    } else if (percentage < 80) {
-                        trainingProgressStatus.textContent = 'Training CNN model...';
-                    } else {
-                        trainingProgressStatus.textContent = 'Training HMM model...';
+            // Upload the files, then follow the training job the server queues
+            let currentJobUrl = null;
+            if (cancelTrainingButton) {
+                cancelTrainingButton.disabled = false;
+                cancelTrainingButton.onclick = () => {
+                    if (!currentJobUrl) return;
+                    cancelTrainingButton.disabled = true;
+                    if (trainingProgressStatus) {
+                        trainingProgressStatus.textContent = 'Cancelling...';
                     }
-                }
+                    fetch(`${currentJobUrl}/cancel`, { method: 'POST' });
+                };
+            }
 
-                // Stop when we reach the end
-                if (progress >= totalSteps) {
-                    clearInterval(progressInterval);
-                }
-            }, 100);
+            if (trainingProgressStatus) {
+                trainingProgressStatus.textContent = 'Uploading files...';
+            }
 
             // Send the form data to the server
             fetch('/bulk_train', {
@@ -586,13 +638,34 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .then(response => response.json())
             .then(data => {
-                // Clear the progress interval
-                clearInterval(progressInterval);
-
                 if (data.error) {
                     throw new Error(data.error);
                 }
 
+                currentJobUrl = data.status_url;
+                return pollJob(data.status_url, job => {
+                    const percentage = Math.floor(job.progress * 100);
+                    if (trainingProgressBar) {
+                        trainingProgressBar.style.width = `${percentage}%`;
+                        trainingProgressBar.setAttribute('aria-valuenow', percentage);
+                        trainingProgressBar.textContent = `${percentage}%`;
+                    }
+
+                    const processing = job.stages.find(stage => stage.name === 'processing_files');
+                    if (processing && filesProcessed) {
+                        filesProcessed.textContent = processing.done;
+                    }
+
+                    if (trainingProgressStatus && !job.cancel_requested) {
+                        trainingProgressStatus.textContent = job.status === 'queued'
+                            ? 'Waiting for earlier training to finish...'
+                            : (trainingStageLabels[job.stage] || 'Training...');
+                    }
+                });
+            })
+            .then(job => {
+                const data = job.result;
+
                 // Show 100% completion
                 if (trainingProgressBar) {
                     trainingProgressBar.style.width = '100%';
@@ -646,9 +719,6 @@ document.addEventListener('DOMContentLoaded', function() {
                 }, 1000);
             })
             .catch(error => {
-                // Clear the progress interval
-                clearInterval(progressInterval);
-
                 // Hide the modal
                 if (trainingProgressModal) trainingProgressModal.hide();
 
@@ -6,70 +6,204 @@ class AudioRecorder {
         this.audioChunks = [];
         this.stream = null;
         this._isRecording = false;
-        
+
+        // Live detection: PCM captured by the audio graph is posted to a streaming session
+        this.audioContext = null;
+        this.processor = null;
+        this.session = null;
+        this.pendingPcm = [];
+        this.sequence = 0;
+        this.sending = null;
+        this.onStreamUpdate = null;
+
         // Browser compatibility check
         if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
             console.error('Media Devices API not supported in this browser.');
         }
     }
-    
+
     isRecording() {
         return this._isRecording;
     }
-    
-    async start() {
+
+    isStreaming() {
+        return this.session !== null;
+    }
+
+    async start(onStreamUpdate = null) {
         try {
-            // Request microphone access
-            this.stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-            
+            // Request microphone access; keystroke transients suffer from voice processing
+            this.stream = await navigator.mediaDevices.getUserMedia({
+                audio: { echoCancellation: false, noiseSuppression: false, autoGainControl: false }
+            });
+
             // Create media recorder
             this.mediaRecorder = new MediaRecorder(this.stream);
-            
+
             // Clear previous chunks
             this.audioChunks = [];
-            
+
             // Add data handler
             this.mediaRecorder.addEventListener('dataavailable', event => {
                 if (event.data.size > 0) {
                     this.audioChunks.push(event.data);
                 }
             });
-            
+
             // Start recording
             this.mediaRecorder.start();
             this._isRecording = true;
-            
+
+            if (onStreamUpdate) {
+                // Live results are optional: the clip is still analyzed when recording stops
+                try {
+                    await this.startStreaming(onStreamUpdate);
+                } catch (error) {
+                    console.warn('Live detection unavailable:', error.message);
+                }
+            }
+
             console.log('Recording started');
-            
+
         } catch (error) {
             console.error('Error starting recording:', error);
             throw error;
         }
     }
-    
-    async stop() {
-        return new Promise((resolve, reject) => {
-            if (!this.mediaRecorder) {
-                reject(new Error('No active recording.'));
-                return;
+
+    async startStreaming(onStreamUpdate) {
+        this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+
+        const response = await fetch('/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sample_rate: this.audioContext.sampleRate })
+        });
+        const session = await response.json();
+        if (!response.ok) {
+            await this.audioContext.close();
+            this.audioContext = null;
+            throw new Error(session.error || `HTTP ${response.status}`);
+        }
+
+        this.session = session;
+        this.sequence = 0;
+        this.pendingPcm = [];
+        this.sending = null;
+        this.onStreamUpdate = onStreamUpdate;
+
+        // 2048-frame buffers are ~43 ms at 48 kHz
+        const source = this.audioContext.createMediaStreamSource(this.stream);
+        this.processor = this.audioContext.createScriptProcessor(2048, 1, 1);
+        this.processor.onaudioprocess = event => {
+            const samples = event.inputBuffer.getChannelData(0);
+            const pcm = new Int16Array(samples.length);
+            for (let i = 0; i < samples.length; i++) {
+                pcm[i] = Math.max(-1, Math.min(1, samples[i])) * 32767;
             }
-            
+            this.pendingPcm.push(pcm);
+            this._sendPending();
+        };
+        source.connect(this.processor);
+        this.processor.connect(this.audioContext.destination);
+    }
+
+    _sendPending() {
+        // One chunk in flight at a time keeps them in order; buffers captured meanwhile go in the next one
+        if (this.sending || this.pendingPcm.length === 0 || !this.session) {
+            return this.sending;
+        }
+
+        const length = this.pendingPcm.reduce((total, pcm) => total + pcm.length, 0);
+        const chunk = new Int16Array(length);
+        let offset = 0;
+        this.pendingPcm.forEach(pcm => {
+            chunk.set(pcm, offset);
+            offset += pcm.length;
+        });
+        this.pendingPcm = [];
+
+        const url = `${this.session.audio_url}?encoding=int16&seq=${this.sequence++}`;
+        this.sending = fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: chunk.buffer
+        })
+            .then(response => response.json())
+            .then(update => {
+                if (update.error) {
+                    throw new Error(update.error);
+                }
+                if (this.onStreamUpdate) {
+                    this.onStreamUpdate(update);
+                }
+            })
+            .catch(error => {
+                console.error('Error streaming audio:', error);
+                this.pendingPcm = [];
+                this.session = null;
+            })
+            .finally(() => {
+                this.sending = null;
+                this._sendPending();
+            });
+        return this.sending;
+    }
+
+    async stopStreaming() {
+        if (this.processor) {
+            this.processor.disconnect();
+            this.processor.onaudioprocess = null;
+            this.processor = null;
+        }
+        if (this.audioContext) {
+            await this.audioContext.close();
+            this.audioContext = null;
+        }
+        if (!this.session) {
+            return null;
+        }
+
+        // Deliver the audio still queued, then flush the session
+        while (this.sending || this.pendingPcm.length > 0) {
+            await (this.sending || this._sendPending());
+            if (!this.session) {
+                return null;
+            }
+        }
+        const response = await fetch(this.session.close_url, { method: 'POST' });
+        const update = await response.json();
+        this.session = null;
+        if (response.ok && this.onStreamUpdate) {
+            this.onStreamUpdate(update);
+        }
+        return update;
+    }
+
+    async stop() {
+        if (!this.mediaRecorder) {
+            throw new Error('No active recording.');
+        }
+
+        await this.stopStreaming();
+
+        return new Promise(resolve => {
             // Add stop event handler
             this.mediaRecorder.addEventListener('stop', () => {
                 // Create audio blob
                 const audioBlob = new Blob(this.audioChunks, { type: 'audio/wav' });
-                
+
                 // Stop all tracks in the stream
                 if (this.stream) {
                     this.stream.getTracks().forEach(track => track.stop());
                 }
-                
+
                 this._isRecording = false;
                 console.log('Recording stopped');
-                
+
                 resolve(audioBlob);
             });
-            
+
             // Stop recording
             this.mediaRecorder.stop();
         });
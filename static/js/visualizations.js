@@ -1,5 +1,95 @@
 // Visualization utilities
 
+// Build a linear axis of `count` values between a [first, last] range
+function linearAxis(range, count) {
+    if (!range || count <= 0) {
+        return [];
+    }
+    const step = count > 1 ? (range[1] - range[0]) / (count - 1) : 0;
+    return Array.from({ length: count }, (_, i) => range[0] + i * step);
+}
+
+// Decode a spectrogram payload into rows/cols and a flat typed array of values in [0, 255].
+// Supports the compact uint8 payload (base64, row-major, lowest frequency first)
+// as well as the legacy nested-list format.
+function decodeSpectrogram(spectrogramData) {
+    if (spectrogramData.encoding === 'uint8') {
+        const [rows, cols] = spectrogramData.shape;
+        const binary = atob(spectrogramData.data);
+        const values = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            values[i] = binary.charCodeAt(i);
+        }
+        return {
+            rows: rows,
+            cols: cols,
+            values: values,
+            time: linearAxis(spectrogramData.time_range, cols),
+            freq: linearAxis(spectrogramData.freq_range, rows)
+        };
+    }
+
+    const data = spectrogramData.data;
+    const rows = data.length;
+    const cols = rows > 0 ? data[0].length : 0;
+    const values = new Uint8Array(rows * cols);
+    for (let y = 0; y < rows; y++) {
+        for (let x = 0; x < cols; x++) {
+            values[y * cols + x] = Math.round(data[y][x] * 255);
+        }
+    }
+    return {
+        rows: rows,
+        cols: cols,
+        values: values,
+        time: spectrogramData.time || [],
+        freq: spectrogramData.freq || []
+    };
+}
+
+// Spectrogram colormap (viridis-like), as a lookup table of 256 RGB triples
+const SPECTROGRAM_COLORMAP = (() => {
+    const table = new Uint8ClampedArray(256 * 3);
+    for (let i = 0; i < 256; i++) {
+        const value = i / 255;
+        let r, g, b;
+        if (value < 0.25) {
+            // Dark purple to blue
+            r = value * 4 * 146;
+            g = value * 4 * 78;
+            b = 128 + value * 4 * 127;
+        } else if (value < 0.5) {
+            // Blue to teal
+            r = 146 + (value - 0.25) * 4 * (33 - 146);
+            g = 78 + (value - 0.25) * 4 * (144 - 78);
+            b = 255 + (value - 0.25) * 4 * (140 - 255);
+        } else if (value < 0.75) {
+            // Teal to green/yellow
+            r = 33 + (value - 0.5) * 4 * (253 - 33);
+            g = 144 + (value - 0.5) * 4 * (231 - 144);
+            b = 140 + (value - 0.5) * 4 * (37 - 140);
+        } else {
+            // Yellow to bright yellow/white
+            r = 253 + (value - 0.75) * 4 * (255 - 253);
+            g = 231 + (value - 0.75) * 4 * (255 - 231);
+            b = 37 + (value - 0.75) * 4 * (255 - 37);
+        }
+        table[i * 3] = Math.floor(r);
+        table[i * 3 + 1] = Math.floor(g);
+        table[i * 3 + 2] = Math.floor(b);
+    }
+    return table;
+})();
+
+// Size hints sent with uploads so the server can downsample the spectrogram to the canvas
+function spectrogramSizeHints(container) {
+    const width = (container && container.parentElement && container.parentElement.clientWidth) || 600;
+    return {
+        spectrogram_width: Math.round(width),
+        spectrogram_height: Math.min(400, Math.floor(width * 0.6))
+    };
+}
+
 // Function to render spectrogram using a enhanced heatmap visualization
 function renderSpectrogram(spectrogramData, container) {
     // Validate input
@@ -13,10 +103,18 @@ function renderSpectrogram(spectrogramData, container) {
         container.chart.destroy();
     }
     
-    // Get the matrix data
-    const data = spectrogramData.data;
-    const timeAxis = spectrogramData.time || [];
-    const freqAxis = spectrogramData.freq || [];
+    // Decode the matrix data
+    drawSpectrogram(decodeSpectrogram(spectrogramData), container);
+}
+
+// Draw a decoded spectrogram ({rows, cols, values, time, freq}) onto a canvas
+function drawSpectrogram(spectrogram, container) {
+    const timeAxis = spectrogram.time;
+    const freqAxis = spectrogram.freq;
+    if (spectrogram.rows === 0 || spectrogram.cols === 0) {
+        console.error('Empty spectrogram');
+        return;
+    }
     
     // Get the canvas element and its context
     const ctx = container.getContext('2d');
@@ -26,58 +124,29 @@ function renderSpectrogram(spectrogramData, container) {
     container.width = canvasWidth;
     container.height = Math.min(400, Math.floor(canvasWidth * 0.6));
     
-    // Calculate pixel scaling
-    const pixelWidth = canvasWidth / data[0].length;
-    const pixelHeight = container.height / data.length;
-    
     // Clear the canvas
     ctx.clearRect(0, 0, container.width, container.height);
     
-    // Create a gradient colormap - vibrant & visually appealing for spectrograms
-    const createColorScale = (value) => {
-        // Professional spectrogram color mapping (viridis-like)
-        if (value < 0.25) {
-            // Dark purple to blue
-            const r = Math.floor(value * 4 * 146);
-            const g = Math.floor(value * 4 * 78);
-            const b = Math.floor(128 + value * 4 * 127);
-            return `rgb(${r},${g},${b})`;
-        } else if (value < 0.5) {
-            // Blue to teal
-            const r = Math.floor(146 + (value - 0.25) * 4 * (33 - 146));
-            const g = Math.floor(78 + (value - 0.25) * 4 * (144 - 78));
-            const b = Math.floor(255 + (value - 0.25) * 4 * (140 - 255));
-            return `rgb(${r},${g},${b})`;
-        } else if (value < 0.75) {
-            // Teal to green/yellow
-            const r = Math.floor(33 + (value - 0.5) * 4 * (253 - 33));
-            const g = Math.floor(144 + (value - 0.5) * 4 * (231 - 144));
-            const b = Math.floor(140 + (value - 0.5) * 4 * (37 - 140));
-            return `rgb(${r},${g},${b})`;
-        } else {
-            // Yellow to bright yellow/white
-            const r = Math.floor(253 + (value - 0.75) * 4 * (255 - 253));
-            const g = Math.floor(231 + (value - 0.75) * 4 * (255 - 231));
-            const b = Math.floor(37 + (value - 0.75) * 4 * (255 - 37));
-            return `rgb(${r},${g},${b})`;
-        }
-    };
-    
-    // Draw the spectrogram using color rectangles for better performance
-    for (let y = 0; y < data.length; y++) {
-        for (let x = 0; x < data[0].length; x++) {
-            const value = data[y][x];
-            const color = createColorScale(value);
-            
-            ctx.fillStyle = color;
-            ctx.fillRect(
-                x * pixelWidth, 
-                container.height - (y + 1) * pixelHeight, 
-                pixelWidth + 0.5, // Slight overlap to avoid gaps
-                pixelHeight + 0.5
-            );
+    // Paint one pixel per cell (highest frequency in the top row), then scale it onto the canvas
+    const image = new ImageData(spectrogram.cols, spectrogram.rows);
+    const pixels = image.data;
+    for (let y = 0; y < spectrogram.rows; y++) {
+        const rowOffset = (spectrogram.rows - 1 - y) * spectrogram.cols;
+        for (let x = 0; x < spectrogram.cols; x++) {
+            const color = spectrogram.values[y * spectrogram.cols + x] * 3;
+            const p = (rowOffset + x) * 4;
+            pixels[p] = SPECTROGRAM_COLORMAP[color];
+            pixels[p + 1] = SPECTROGRAM_COLORMAP[color + 1];
+            pixels[p + 2] = SPECTROGRAM_COLORMAP[color + 2];
+            pixels[p + 3] = 255;
         }
     }
+    const offscreen = document.createElement('canvas');
+    offscreen.width = spectrogram.cols;
+    offscreen.height = spectrogram.rows;
+    offscreen.getContext('2d').putImageData(image, 0, 0);
+    ctx.imageSmoothingEnabled = false;
+    ctx.drawImage(offscreen, 0, 0, container.width, container.height);
     
     // Draw frequency axis on the left
     if (freqAxis.length > 0) {
@@ -139,3 +208,144 @@ function renderSpectrogram(spectrogramData, container) {
     ctx.textAlign = 'left';
     ctx.fillText('Keyboard Acoustic Spectrogram', 75, 19);
 }
+
+// Browses a stored spectrogram tile pyramid: mouse wheel zooms around the cursor,
+// dragging pans. Only the tiles for the visible range and zoom level are fetched.
+class SpectrogramTileViewer {
+    constructor(container, tilesInfo) {
+        this.container = container;
+        this.url = tilesInfo.url;
+        this.duration = tilesInfo.duration;
+        this.start = 0;
+        this.end = this.duration;
+        this.tileCache = new Map();
+        this.loadTimer = null;
+        this.requestId = 0;
+        this.dragStart = null;
+
+        this.onWheel = this.onWheel.bind(this);
+        this.onMouseDown = this.onMouseDown.bind(this);
+        this.onMouseMove = this.onMouseMove.bind(this);
+        this.onMouseUp = this.onMouseUp.bind(this);
+        container.addEventListener('wheel', this.onWheel, { passive: false });
+        container.addEventListener('mousedown', this.onMouseDown);
+        window.addEventListener('mousemove', this.onMouseMove);
+        window.addEventListener('mouseup', this.onMouseUp);
+    }
+
+    destroy() {
+        clearTimeout(this.loadTimer);
+        this.container.removeEventListener('wheel', this.onWheel);
+        this.container.removeEventListener('mousedown', this.onMouseDown);
+        window.removeEventListener('mousemove', this.onMouseMove);
+        window.removeEventListener('mouseup', this.onMouseUp);
+    }
+
+    timeAt(clientX) {
+        const rect = this.container.getBoundingClientRect();
+        const fraction = Math.min(Math.max((clientX - rect.left) / rect.width, 0), 1);
+        return this.start + fraction * (this.end - this.start);
+    }
+
+    setRange(start, end) {
+        const span = Math.min(Math.max(end - start, 0.05), this.duration);
+        start = Math.min(Math.max(start, 0), this.duration - span);
+        this.start = start;
+        this.end = start + span;
+
+        // Wait for the user to stop scrolling or dragging before fetching
+        clearTimeout(this.loadTimer);
+        this.loadTimer = setTimeout(() => this.load(), 120);
+    }
+
+    onWheel(event) {
+        event.preventDefault();
+        const anchor = this.timeAt(event.clientX);
+        const scale = event.deltaY > 0 ? 1.25 : 0.8;
+        this.setRange(anchor - (anchor - this.start) * scale, anchor + (this.end - anchor) * scale);
+    }
+
+    onMouseDown(event) {
+        this.dragStart = { x: event.clientX, start: this.start, end: this.end };
+    }
+
+    onMouseMove(event) {
+        if (!this.dragStart) {
+            return;
+        }
+        const rect = this.container.getBoundingClientRect();
+        const shift = (this.dragStart.x - event.clientX) / rect.width * (this.dragStart.end - this.dragStart.start);
+        this.setRange(this.dragStart.start + shift, this.dragStart.end + shift);
+    }
+
+    onMouseUp() {
+        this.dragStart = null;
+    }
+
+    async load() {
+        const requestId = ++this.requestId;
+        const params = new URLSearchParams({
+            start: this.start.toFixed(3),
+            end: this.end.toFixed(3),
+            width: this.container.width || 600
+        });
+        try {
+            const response = await fetch(`${this.url}?${params}`);
+            const payload = await response.json();
+            if (payload.error) {
+                throw new Error(payload.error);
+            }
+            // Ignore responses that arrive after a newer request was made
+            if (requestId === this.requestId) {
+                this.draw(payload.tiles);
+            }
+        } catch (error) {
+            console.error('Error loading spectrogram tiles:', error);
+        }
+    }
+
+    decodeTile(tile) {
+        const key = `${tile.level}:${tile.index}`;
+        if (!this.tileCache.has(key)) {
+            this.tileCache.set(key, decodeSpectrogram(tile));
+        }
+        return this.tileCache.get(key);
+    }
+
+    draw(tiles) {
+        if (!tiles || tiles.length === 0) {
+            return;
+        }
+        const decoded = tiles.map(tile => this.decodeTile(tile));
+        const rows = decoded[0].rows;
+
+        // Stitch the columns of all tiles that fall inside the visible range
+        const columns = [];
+        decoded.forEach(tile => {
+            tile.time.forEach((time, x) => {
+                if (time >= this.start && time <= this.end) {
+                    columns.push({ tile: tile, x: x, time: time });
+                }
+            });
+        });
+        if (columns.length === 0) {
+            return;
+        }
+
+        const cols = columns.length;
+        const values = new Uint8Array(rows * cols);
+        columns.forEach((column, x) => {
+            for (let y = 0; y < rows; y++) {
+                values[y * cols + x] = column.tile.values[y * column.tile.cols + column.x];
+            }
+        });
+
+        drawSpectrogram({
+            rows: rows,
+            cols: cols,
+            values: values,
+            time: columns.map(column => column.time),
+            freq: decoded[0].freq
+        }, this.container);
+    }
+}
@@ -0,0 +1,238 @@
+import numpy as np
+import collections
+import logging
+import threading
+import time
+import uuid
+
+from audio_processor import (ANALYSIS_RATE, KeystrokeSegmenter, RunningNormalizer, StreamingHighpass,
+                             StreamingResampler)
+from hmm_decoding import OnlineViterbi
+from ml_models import extract_features_batch
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# PCM encodings accepted for audio chunks
+CHUNK_FORMATS = {'int16': ('<i2', 1.0 / 32768.0), 'float32': ('<f4', 1.0)}
+
+# Keystrokes decoded but not yet committed; bounds the decoder state and how far
+# back the partial text can still change
+DECISION_LAG = 16
+
+# Moving-mean window of the onset threshold. The detector needs half of it as
+# lookahead, so this is shorter than the 0.2 s used for whole recordings to
+# report onsets within ~60 ms
+ONSET_THRESHOLD_WINDOW = 0.1
+
+# Floor of the running peak used for normalization, so background noise captured
+# before the first keystroke is not amplified into false onsets
+MIN_NORMALIZATION_LEVEL = 0.05
+
+# Sessions without a chunk for this long are closed
+SESSION_TIMEOUT = 60.0
+
+MAX_SESSIONS = 64
+
+class StreamingSession:
+    """
+    Incremental keystroke detection and decoding of one live audio stream
+
+    Each chunk goes through the same stages as a recording (resampling to
+    ANALYSIS_RATE, normalization by the running peak, high-pass filter,
+    onset detection and segmentation), each carrying its state from one
+    chunk to the next, and every completed keystroke segment is decoded
+    with OnlineViterbi. Every stage keeps only a bounded window of samples
+    or steps, so memory does not grow with the length of the session.
+    Committed text is returned once and not kept.
+
+    Chunks of one session must be fed in order; feed() serializes callers.
+    """
+
+    def __init__(self, hmm_model, sample_rate, model_version=None, language_model=None, beam_width=None,
+                 lag=DECISION_LAG):
+        """
+        Args:
+            hmm_model: Trained KeystrokeHMM
+            sample_rate: Sample rate of the incoming PCM
+            model_version: Artifact version of the model, reported with the results
+            language_model: Optional CharNGramLM used as the transition model
+            beam_width: Keys kept per step while decoding (None decodes exactly)
+            lag: Keystrokes held undecided before being committed
+        """
+        self.id = uuid.uuid4().hex
+        self.hmm_model = hmm_model
+        self.model_version = model_version
+        self.sample_rate = int(sample_rate)
+        self.sr = ANALYSIS_RATE
+        self.resampler = StreamingResampler(self.sample_rate, self.sr) if self.sample_rate != self.sr else None
+        self.normalizer = RunningNormalizer('peak', min_level=MIN_NORMALIZATION_LEVEL)
+        self.highpass = StreamingHighpass(self.sr)
+        self.segmenter = KeystrokeSegmenter(self.sr, threshold_window=ONSET_THRESHOLD_WINDOW)
+
+        if language_model is None:
+            params = hmm_model.parameters
+            log_start, transitions = params['log_start'], params['log_transitions']
+        else:
+            log_start, transitions = language_model.log_start(), language_model
+        self.decoder = OnlineViterbi(log_start, transitions, beam_width=beam_width, lag=lag)
+
+        self.next_sequence = 0
+        self.samples_in = 0
+        self.samples = 0  # Samples at the analysis rate fed to the segmenter
+        self.keystrokes = 0
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self._lock = threading.Lock()
+
+    def _decode(self, onsets, segments):
+        result = {
+            'onsets': (np.asarray(onsets) / self.sr).tolist(),
+            'keystrokes': [],
+            'committed_text': '',
+        }
+        if segments:
+            features = extract_features_batch(segments)
+            emissions = self.hmm_model.emission_log_likelihood(features)
+            best = emissions.argmax(axis=1)
+            for segment, key in zip(segments, best):
+                result['keystrokes'].append({
+                    'start_time': segment['start_time'],
+                    'end_time': segment['end_time'],
+                    # Most likely key from the sound alone, before the sequence context
+                    'key': self.hmm_model.keys[key]
+                })
+            committed = self.decoder.push(emissions)
+            result['committed_text'] = ''.join(self.hmm_model.keys[i] for i in committed)
+            self.keystrokes += len(segments)
+        return result
+
+    def _finish(self, result, committed):
+        result['committed_text'] += ''.join(self.hmm_model.keys[i] for i in committed)
+        result['partial_text'] = ''.join(self.hmm_model.keys[i] for i in self.decoder.tentative())
+        result['committed_keystrokes'] = self.decoder.committed
+        result['position'] = self.samples / self.sr
+        result['model_version'] = self.model_version
+        return result
+
+    def feed(self, data, encoding='int16', sequence=None):
+        """
+        Process the next chunk of mono PCM
+
+        Args:
+            data: Little-endian PCM bytes
+            encoding: Key of CHUNK_FORMATS
+            sequence: Chunk number (from 0), checked against the next expected one
+
+        Returns:
+            Dictionary with the onsets confirmed by this chunk (seconds from the
+            start of the stream), the keystrokes segmented and their most likely
+            keys, text newly committed by the decoder, the partial (still
+            changeable) text after it, and the stream position in seconds
+
+        Raises:
+            ValueError: For an unknown encoding, a partial sample, or an
+                out-of-order sequence number
+        """
+        if encoding not in CHUNK_FORMATS:
+            raise ValueError(f"Unknown encoding {encoding}; use one of {sorted(CHUNK_FORMATS)}")
+        dtype, scale = CHUNK_FORMATS[encoding]
+        if len(data) % np.dtype(dtype).itemsize:
+            raise ValueError(f"Chunk of {len(data)} bytes is not a whole number of {encoding} samples")
+
+        with self._lock:
+            if sequence is not None and sequence != self.next_sequence:
+                raise ValueError(f"Expected chunk {self.next_sequence}, got {sequence}")
+            self.next_sequence += 1
+            self.last_active = time.time()
+
+            block = np.frombuffer(data, dtype=dtype).astype(np.float32) * np.float32(scale)
+            self.samples_in += len(block)
+            if self.resampler is not None:
+                block = self.resampler.process(block)
+            block = self.highpass.process(self.normalizer.process(block))
+            self.samples += len(block)
+            onsets, segments = self.segmenter.process(block)
+            return self._finish(self._decode(onsets, segments), [])
+
+    def close(self):
+        """End of stream: flush every stage and commit the remaining text"""
+        with self._lock:
+            onsets, segments = [], []
+            if self.resampler is not None:
+                block = self.highpass.process(self.normalizer.process(self.resampler.flush()))
+                self.samples += len(block)
+                onsets, segments = self.segmenter.process(block)
+            more_onsets, more_segments = self.segmenter.flush()
+            result = self._decode(np.concatenate([onsets, more_onsets]), segments + more_segments)
+            return self._finish(result, self.decoder.flush())
+
+    def info(self):
+        return {
+            'session_id': self.id,
+            'sample_rate': self.sample_rate,
+            'position': self.samples / self.sr,
+            'keystrokes': self.keystrokes,
+            'model_version': self.model_version,
+            'created_at': self.created_at,
+            'last_active': self.last_active
+        }
+
+class StreamingSessions:
+    """
+    Open streaming sessions of this process
+
+    Like JobQueue, sessions live in the memory of the process that created
+    them, so all chunks of a session must reach the same process (the app
+    runs as a single gunicorn worker, see gunicorn.conf.py). Sessions
+    idle for longer than the timeout are closed, and at most max_sessions
+    are open at once, which bounds the total memory held.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT, max_sessions=MAX_SESSIONS):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.time() - self.timeout
+        for session_id in [i for i, session in self._sessions.items() if session.last_active < cutoff]:
+            del self._sessions[session_id]
+            logger.info(f"Streaming session {session_id} expired")
+
+    def open(self, *args, **kwargs):
+        """
+        Start a session (arguments as for StreamingSession)
+
+        Raises:
+            RuntimeError: If max_sessions sessions are already open
+        """
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError(f"Too many streaming sessions (limit {self.max_sessions})")
+            session = StreamingSession(*args, **kwargs)
+            self._sessions[session.id] = session
+        logger.info(f"Opened streaming session {session.id} at {session.sample_rate} Hz")
+        return session
+
+    def get(self, session_id):
+        """Open session with the given id, or None"""
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        """Remove a session and flush it; returns its final result, or None if it is unknown"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        logger.info(f"Closed streaming session {session_id} after {session.keystrokes} keystrokes")
+        return session.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,254 @@
+import numpy as np
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+from scipy.io import wavfile
+
+from ml_models import KEYS
+from parallel_ingest import default_workers
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 44100
+
+# Resonances of every key lie in this band: above the preprocessing high-pass
+# (HIGHPASS_CUTOFF_HZ) and below the Nyquist frequency of ANALYSIS_RATE
+SIGNATURE_BAND = (1500.0, 7000.0)
+
+# Length of one rendered keystroke; shorter than the minimum interval between
+# keystrokes, so consecutive keystrokes never overlap
+KEYSTROKE_DURATION = 0.08
+
+# Silence before the first and after the last keystroke
+LEAD_IN = 0.2
+TAIL = 0.3
+
+LABELS_NAME = 'labels.jsonl'
+
+WORDS = ("the quick brown fox jumps over lazy dog keyboard acoustic sound typing password "
+         "hello world yes no test data model train record upload 2024 42 what? ok! re-run").split()
+
+def make_rng(seed, *key):
+    """Generator for one independent stream of a seeded corpus (same seed and key, same numbers)"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+class TypingRhythm:
+    """
+    Timing model of a typist
+
+    Intervals between keystrokes are log-normal around mean_interval, never
+    shorter than min_interval, with an extra pause after spaces and
+    punctuation (word boundaries).
+    """
+
+    def __init__(self, mean_interval=0.2, jitter=0.3, word_pause=0.1, min_interval=0.12):
+        """
+        Args:
+            mean_interval: Median seconds between keystrokes within a word
+            jitter: Standard deviation of the log interval
+            word_pause: Mean extra seconds after a space or punctuation
+            min_interval: Shortest interval; keeps keystroke segments apart
+        """
+        if min_interval <= KEYSTROKE_DURATION:
+            raise ValueError(f"min_interval must be longer than a keystroke ({KEYSTROKE_DURATION} s)")
+        self.mean_interval = mean_interval
+        self.jitter = jitter
+        self.word_pause = word_pause
+        self.min_interval = min_interval
+
+    def onsets(self, text, rng):
+        """Keystroke start times in seconds, from LEAD_IN"""
+        if not text:
+            return np.zeros(0)
+        intervals = self.mean_interval * rng.lognormal(0.0, self.jitter, len(text))
+        boundaries = np.array([not c.isalnum() for c in text[:-1]], dtype=bool)
+        intervals[1:] += boundaries * rng.exponential(self.word_pause, len(text) - 1)
+        intervals = np.maximum(intervals, self.min_interval)
+        intervals[0] = 0.0
+        return LEAD_IN + np.cumsum(intervals)
+
+class KeySignatures:
+    """
+    Spectral signature of every key of a synthetic keyboard
+
+    Each key rings with n_modes damped resonances (frequency, decay rate and
+    amplitude drawn once per key within SIGNATURE_BAND) on top of a short
+    broadband click. The same seed gives the same keyboard.
+    """
+
+    def __init__(self, keys=KEYS, n_modes=3, seed=0, band=SIGNATURE_BAND):
+        """
+        Args:
+            keys: Keyboard layout
+            n_modes: Resonances per key
+            seed: Seed of the keyboard
+            band: (low, high) frequency range of the resonances in Hz
+        """
+        rng = make_rng(seed, 0)
+        self.keys = keys
+        self.frequencies = np.exp(rng.uniform(np.log(band[0]), np.log(band[1]), (len(keys), n_modes)))
+        self.decays = rng.uniform(40.0, 120.0, (len(keys), n_modes))
+        self.amplitudes = rng.dirichlet(np.ones(n_modes), len(keys))
+        self.clicks = rng.uniform(0.1, 0.4, len(keys))
+
+    def render(self, states, rate, rng):
+        """
+        Waveforms of a series of keystrokes
+
+        Args:
+            states: Key index of each keystroke
+            rate: Sample rate
+            rng: Generator for the per-keystroke variations (pitch, phase, force)
+
+        Returns:
+            Float32 array of shape (keystrokes, KEYSTROKE_DURATION * rate)
+        """
+        n = len(states)
+        t = (np.arange(int(KEYSTROKE_DURATION * rate)) / rate).astype(np.float32)
+        # Each strike detunes the key slightly and starts its modes at random phases
+        frequencies = (self.frequencies[states] * rng.uniform(0.98, 1.02, (n, 1))).astype(np.float32)
+        phases = rng.uniform(0, 2 * np.pi, frequencies.shape).astype(np.float32)
+        modes = np.sin(2 * np.pi * frequencies[..., np.newaxis] * t + phases[..., np.newaxis])
+        modes *= np.exp(-self.decays[states, :, np.newaxis].astype(np.float32) * t)
+        impulses = np.einsum('nm,nmt->nt', self.amplitudes[states].astype(np.float32), modes)
+        impulses += (rng.standard_normal(impulses.shape, dtype=np.float32) * np.exp(-400 * t)
+                     * self.clicks[states, np.newaxis].astype(np.float32))
+        return impulses * rng.uniform(0.6, 1.0, (n, 1)).astype(np.float32)
+
+def render_text(text, signatures=None, rhythm=None, noise_level=0.01, rate=DEFAULT_SAMPLE_RATE, seed=0):
+    """
+    Synthesize a recording of text being typed
+
+    Characters outside the keyboard layout are skipped.
+
+    Args:
+        text: Typed text
+        signatures: KeySignatures of the keyboard (KeySignatures() if None)
+        rhythm: TypingRhythm of the typist (TypingRhythm() if None)
+        noise_level: Standard deviation of the background noise, relative to a keystroke's peak
+        rate: Sample rate
+        seed: Seed of the recording
+
+    Returns:
+        Tuple of (float32 waveform, list of {'key', 'start_time', 'end_time'} dictionaries)
+    """
+    signatures = signatures or KeySignatures()
+    rhythm = rhythm or TypingRhythm()
+    rng = make_rng(seed, 1)
+
+    text = ''.join(c for c in text.lower() if c in signatures.keys)
+    states = np.array([signatures.keys.index(c) for c in text], dtype=np.int64)
+    onsets = rhythm.onsets(text, rng)
+    length = int(((onsets[-1] if len(onsets) else LEAD_IN) + KEYSTROKE_DURATION + TAIL) * rate)
+
+    y = rng.standard_normal(length, dtype=np.float32) * np.float32(noise_level)
+    if len(states):
+        impulses = signatures.render(states, rate, rng)
+        # Keystrokes do not overlap, so the impulses are scattered into the noise in one pass
+        positions = np.round(onsets * rate).astype(np.int64)[:, np.newaxis] + np.arange(impulses.shape[1])
+        y[positions.ravel()] += impulses.ravel()
+
+    timing = [{'key': c, 'start_time': float(onset), 'end_time': float(onset + KEYSTROKE_DURATION)}
+              for c, onset in zip(text, onsets)]
+    return y, timing
+
+def random_texts(n, seed=0, min_words=2, max_words=6):
+    """n texts of random words from WORDS"""
+    rng = make_rng(seed, 2)
+    return [' '.join(rng.choice(WORDS, rng.integers(min_words, max_words + 1)))
+            for _ in range(n)]
+
+def _render_files(jobs, output_dir, signatures, rhythm, noise_level, rate, seed):
+    """Pool task: render and write (index, text) recordings; returns their label records"""
+    labels = []
+    for index, text in jobs:
+        y, timing = render_text(text, signatures, rhythm, noise_level, rate, seed=(seed, index))
+        filename = f"{index:06d}.wav"
+        peak = max(float(np.abs(y).max()), 1e-10)
+        wavfile.write(os.path.join(output_dir, filename), rate, (y * (0.9 * 32767 / peak)).astype(np.int16))
+        labels.append({
+            'filename': filename,
+            'text': ''.join(k['key'] for k in timing),
+            'sample_rate': rate,
+            'duration': len(y) / rate,
+            'keystrokes': timing
+        })
+    return labels
+
+def generate_corpus(texts, output_dir, signatures=None, rhythm=None, noise_level=0.01,
+                    rate=DEFAULT_SAMPLE_RATE, seed=0, workers=None, chunk_size=16):
+    """
+    Render a labeled corpus of WAV recordings
+
+    Recording i is seeded by (seed, i), so the corpus is the same whatever
+    the number of workers. Files are named by their index; labels.jsonl in
+    output_dir holds one record per file, in order, with its text and the
+    timing of every keystroke.
+
+    Args:
+        texts: Text typed in each recording
+        output_dir: Directory for the WAV files and labels
+        signatures: KeySignatures (KeySignatures(seed=seed) if None)
+        rhythm: TypingRhythm (TypingRhythm() if None)
+        noise_level: Background noise relative to a keystroke's peak
+        rate: Sample rate
+        seed: Corpus seed
+        workers: Worker processes (one per CPU if None, 1 renders in this process)
+        chunk_size: Recordings rendered per pool task
+
+    Returns:
+        List of label records
+    """
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        signatures = signatures or KeySignatures(seed=seed)
+        rhythm = rhythm or TypingRhythm()
+        workers = workers or default_workers()
+        chunks = [list(enumerate(texts))[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        args = (output_dir, signatures, rhythm, noise_level, rate, seed)
+
+        if workers == 1:
+            results = [_render_files(chunk, *args) for chunk in chunks]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_render_files, chunks, *[[arg] * len(chunks) for arg in args]))
+
+        labels = [record for chunk in results for record in chunk]
+        with open(os.path.join(output_dir, LABELS_NAME), 'w') as f:
+            for record in labels:
+                f.write(json.dumps(record) + '\n')
+        logger.info(f"Rendered {len(labels)} recordings to {output_dir}")
+        return labels
+
+    except Exception as e:
+        logger.error(f"Error generating corpus: {e}")
+        raise
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a labeled synthetic keystroke corpus")
+    parser.add_argument('output', help='Directory to write the WAV files and labels.jsonl to')
+    parser.add_argument('--texts', help='Text file with one recording text per line (random words if omitted)')
+    parser.add_argument('--count', type=int, default=100, help='Recordings of random words to render')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate', type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument('--noise', type=float, default=0.01, help='Background noise relative to a keystroke')
+    parser.add_argument('--interval', type=float, default=0.2, help='Median seconds between keystrokes')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Standard deviation of the log interval')
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes (0 = one per CPU)')
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts, encoding='utf-8', errors='ignore') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = random_texts(args.count, args.seed)
+
+    generate_corpus(texts, args.output, rhythm=TypingRhythm(args.interval, args.jitter), noise_level=args.noise,
+                    rate=args.rate, seed=args.seed, workers=args.workers or None)
+
+if __name__ == '__main__':
+    main()
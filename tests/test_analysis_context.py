@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from analysis_context import AnalysisContext, analysis_context
+
+SR = 16000
+
+@pytest.fixture
+def context():
+    rng = np.random.default_rng(0)
+    return AnalysisContext(rng.standard_normal(SR).astype(np.float32), SR)
+
+def test_stft_is_memoized(context):
+    first = context.stft(nperseg=512, noverlap=256)
+    assert context.stft(nperseg=512, noverlap=256) is first
+    assert context.power(512, 256) is context.power(512, 256)
+    assert context.db(512, 256)[2] is context.db(512, 256)[2]
+
+def test_power_matches_scipy_spectrogram(context):
+    f, t, Sxx = context.power(nperseg=512, noverlap=256, nfft=1024)
+    expected_f, expected_t, expected = signal.spectrogram(context.waveform.astype(np.float64), SR, nperseg=512,
+                                                          noverlap=256, nfft=1024)
+    np.testing.assert_allclose(f, expected_f)
+    np.testing.assert_allclose(t, expected_t)
+    np.testing.assert_allclose(Sxx, expected, rtol=1e-3, atol=1e-3 * expected.max())
+
+def test_coarser_stft_is_derived_from_a_cached_one(context):
+    fine = context.stft(nperseg=512, noverlap=384, nfft=1024)[2]
+    f, t, coarse = context.stft(nperseg=512, noverlap=256, nfft=512)
+    # A strided view of the cached STFT, equal to computing it directly
+    assert np.shares_memory(coarse, fine)
+    _, _, direct = AnalysisContext(context.waveform, SR).stft(nperseg=512, noverlap=256, nfft=512)
+    np.testing.assert_allclose(coarse, direct, rtol=1e-4, atol=1e-4)
+    assert len(f) == 257 and len(t) == direct.shape[1]
+
+def test_band_is_a_view_of_the_full_representation(context):
+    f, _, band = context.band('db', 1000, 4000, nperseg=512, noverlap=256)
+    full_f, _, full = context.db(512, 256)
+    assert f[0] >= 1000 and f[-1] < 4000
+    assert np.shares_memory(band, full)
+    with pytest.raises(ValueError):
+        context.band('phase')
+
+def test_scalar_statistics(context):
+    y = context.waveform.astype(np.float64)
+    assert context.rms == pytest.approx(np.sqrt(np.mean(y ** 2)))
+    assert context.peak == pytest.approx(np.abs(y).max())
+    assert context.duration == 1.0
+
+def test_clear_forgets_memoized_arrays(context):
+    first = context.stft(512, 256)
+    context.clear()
+    second = context.stft(512, 256)
+    assert second is not first
+    np.testing.assert_array_equal(second[2], first[2])
+
+def test_analysis_context_reuses_an_existing_context(context):
+    assert analysis_context(context) is context
+    created = analysis_context({'waveform': context.waveform, 'sr': SR})
+    assert isinstance(created, AnalysisContext) and created is not context
@@ -0,0 +1,35 @@
+import io
+import tempfile
+
+from audio_processor import as_audio_source
+
+def spooled(data, max_size):
+    stream = tempfile.SpooledTemporaryFile(max_size=max_size, mode='rb+')
+    stream.write(data)
+    stream.seek(0)
+    return stream
+
+def test_in_memory_sources_are_not_spilled_to_disk():
+    data = b'RIFF' + bytes(range(256)) * 4
+    stream = spooled(data, max_size=len(data) + 1)
+
+    source = as_audio_source(stream)
+
+    assert bytes(source) == data
+    # Still in memory: a spooled file only gets a name once rolled over
+    assert stream.name is None
+    view = as_audio_source(io.BytesIO(data))
+    assert isinstance(view, memoryview) and bytes(view) == data
+
+def test_rolled_over_uploads_are_used_as_files():
+    data = b'RIFF' + bytes(range(256)) * 4
+    stream = spooled(data, max_size=16)
+
+    source = as_audio_source(stream)
+
+    assert source is stream
+    source.seek(0)
+    assert source.read() == data
+    with open(__file__, 'rb') as f:
+        assert as_audio_source(f) is f
+    assert as_audio_source(data) is data
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import cnn_engine
+from cnn_engine import Conv2D, Dense, Flatten, GlobalAveragePooling2D, MaxPool2D, Sequential
+
+def naive_conv(x, kernel, bias, strides, pad):
+    """Direct loop convolution of NHWC inputs with an (kh, kw, C, F) kernel"""
+    n, height, width, _ = x.shape
+    k = kernel.shape[0]
+    padded = np.pad(x, ((0, 0), (pad, pad), (pad, pad), (0, 0))).astype(np.float64)
+    out_height = (height + 2 * pad - k) // strides + 1
+    out_width = (width + 2 * pad - k) // strides + 1
+    out = np.zeros((n, out_height, out_width, kernel.shape[3]))
+    for b in range(n):
+        for i in range(out_height):
+            for j in range(out_width):
+                window = padded[b, i * strides:i * strides + k, j * strides:j * strides + k]
+                for f in range(kernel.shape[3]):
+                    out[b, i, j, f] = np.sum(window * kernel[..., f]) + bias[f]
+    return out
+
+def run(layer, x):
+    return layer.forward(x, layer.allocate(len(x)))
+
+@pytest.mark.parametrize('kernel_size, strides, padding', [
+    (3, 1, 'same'), (3, 2, 'same'), (5, 1, 'same'), (3, 1, 'valid'), (2, 2, 'valid'), (1, 1, 'same')])
+def test_conv2d_matches_loop_convolution(kernel_size, strides, padding):
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((3, 11, 9, 4)).astype(np.float32)
+    layer = Conv2D('conv', filters=5, kernel_size=kernel_size, strides=strides, padding=padding, activation=None)
+    layer.build(x.shape[1:], rng)
+    layer.bias = rng.standard_normal(5).astype(np.float32)
+
+    out = run(layer, x)
+
+    expected = naive_conv(x, layer.kernel, layer.bias, strides, layer.pad)
+    assert out.shape == expected.shape == (3,) + layer.output_shape
+    np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-5)
+
+def test_conv2d_tiles_rows_and_reuses_buffers(monkeypatch):
+    # A tile of two output rows forces several GEMMs per input, including a partial one
+    monkeypatch.setattr(cnn_engine, 'COL_TILE_BYTES', 2 * 9 * 3 * 3 * 2 * 4)
+    rng = np.random.default_rng(1)
+    layer = Conv2D('conv', filters=6, activation='relu')
+    layer.build((7, 9, 2), rng)
+    assert layer.tile_rows == 2
+
+    buffers = layer.allocate(4)
+    for _ in range(2):
+        x = rng.standard_normal((4, 7, 9, 2)).astype(np.float32)
+        out = layer.forward(x, buffers)
+        expected = np.maximum(naive_conv(x, layer.kernel, layer.bias, 1, layer.pad), 0)
+        np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-5)
+    # A smaller batch uses the front of the same buffers
+    out = layer.forward(x[:1], buffers)
+    np.testing.assert_allclose(out, expected[:1], rtol=1e-5, atol=1e-5)
+
+def test_pooling_and_dense_layers():
+    rng = np.random.default_rng(2)
+    x = rng.standard_normal((2, 5, 7, 3)).astype(np.float32)
+
+    pool = MaxPool2D('pool')
+    pool.build(x.shape[1:], rng)
+    expected = x[:, :4, :6].reshape(2, 2, 2, 3, 2, 3).max(axis=(2, 4))
+    np.testing.assert_array_equal(run(pool, x), expected)
+
+    gap = GlobalAveragePooling2D('gap')
+    gap.build(x.shape[1:], rng)
+    np.testing.assert_allclose(run(gap, x), x.mean(axis=(1, 2)), rtol=1e-6)
+
+    dense = Dense('dense', 4, activation='softmax')
+    dense.build((3,), rng)
+    features = x.mean(axis=(1, 2))
+    logits = features.astype(np.float64) @ dense.kernel + dense.bias
+    expected = np.exp(logits - logits.max(axis=1, keepdims=True))
+    expected /= expected.sum(axis=1, keepdims=True)
+    np.testing.assert_allclose(run(dense, features), expected, rtol=1e-5)
+
+def build_model(seed=0):
+    return Sequential('test', (12, 10, 1), [
+        Conv2D('conv1', 4),
+        MaxPool2D('pool1'),
+        Conv2D('conv2', 6, strides=2),
+        Flatten('flatten'),
+        Dense('dense', 5, activation='softmax')
+    ], seed=seed)
+
+def test_predict_is_independent_of_batch_size():
+    model = build_model()
+    X = np.random.default_rng(3).standard_normal((11, 12, 10, 1))
+
+    outputs = model.predict(X, batch_size=11)
+
+    assert outputs.shape == (11, 5)
+    np.testing.assert_allclose(outputs.sum(axis=1), 1.0, rtol=1e-5)
+    for batch_size in (1, 4):
+        np.testing.assert_allclose(model.predict(X, batch_size=batch_size), outputs, rtol=1e-5, atol=1e-7)
+    embedding = model.embed(X, 'conv2')
+    assert embedding.shape == (11, 3 * 3 * 6)
+    np.testing.assert_array_equal(embedding, model.predict(X, layer='flatten'))
+
+def test_predict_rejects_bad_inputs():
+    model = build_model()
+    with pytest.raises(ValueError):
+        model.predict(np.zeros((2, 10, 12, 1)))
+    with pytest.raises(ValueError):
+        model.predict(np.zeros((2, 12, 10, 1)), layer='missing')
+
+def test_weights_round_trip(tmp_path):
+    model = build_model(seed=0)
+    other = build_model(seed=1)
+    X = np.random.default_rng(4).standard_normal((3, 12, 10, 1))
+    assert not np.allclose(model.predict(X), other.predict(X))
+
+    path = str(tmp_path / 'weights.npz')
+    model.save_weights(path)
+    other.load_weights(path)
+    np.testing.assert_array_equal(other.predict(X), model.predict(X))
+
+    weights = model.get_weights()
+    weights['conv1.kernel'] = weights['conv1.kernel'][..., :2]
+    with pytest.raises(ValueError):
+        other.set_weights(weights)
+    del weights['conv1.kernel']
+    with pytest.raises(ValueError):
+        other.set_weights(weights)
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from dataset_store import DatasetStore, INDEX_NAME
+
+def make_sample(rng, n_segments, sr=16000):
+    waveform = rng.standard_normal(sr // 4).astype(np.float32)
+    starts = np.sort(rng.choice(len(waveform) - 800, n_segments, replace=False))
+    return {
+        'waveform': waveform,
+        'sr': sr,
+        'duration': len(waveform) / sr,
+        'features': rng.standard_normal(6),
+        'segment_features': rng.standard_normal((n_segments, 4)).astype(np.float32),
+        'segment_bounds': np.stack([starts, starts + 800], axis=1)
+    }
+
+def assert_same_sample(stored, expected):
+    audio_data, ground_truth = stored
+    expected_audio, expected_text = expected
+    assert ground_truth == expected_text
+    assert audio_data['sr'] == expected_audio['sr']
+    assert audio_data['duration'] == pytest.approx(expected_audio['duration'])
+    for name in ('waveform', 'segment_features', 'segment_bounds', 'features'):
+        np.testing.assert_array_equal(audio_data[name], expected_audio[name])
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    return [(make_sample(rng, n), f"text {n}") for n in (3, 0, 5, 1)]
+
+def test_append_and_read_back(tmp_path, samples):
+    store = DatasetStore(tmp_path)
+    assert not store
+    ids = [store.append(*sample) for sample in samples]
+
+    assert ids == list(range(len(samples)))
+    assert len(store) == len(samples)
+    for sample_id, sample in enumerate(samples):
+        assert_same_sample(store[sample_id], sample)
+        assert store[sample_id][0]['sample_id'] == sample_id
+
+def test_reload_from_disk(tmp_path, samples):
+    DatasetStore(tmp_path).extend(samples)
+
+    reopened = DatasetStore(tmp_path)
+    assert len(reopened) == len(samples)
+    for stored, sample in zip(reopened, samples):
+        assert_same_sample(stored, sample)
+
+def test_samples_are_spread_over_shards(tmp_path, samples):
+    store = DatasetStore(tmp_path, shard_bytes=1)
+    store.extend(samples)
+
+    assert len({record['shard'] for record in store._records}) == len(samples)
+    for stored, sample in zip(DatasetStore(tmp_path, shard_bytes=1), samples):
+        assert_same_sample(stored, sample)
+
+def test_appends_from_another_store_are_picked_up(tmp_path, samples):
+    reader = DatasetStore(tmp_path)
+    writer = DatasetStore(tmp_path)
+    writer.append(*samples[0])
+    assert len(reader) == 1
+    # The reader's mapping of the shard predates these appends
+    reader[0]
+    writer.extend(samples[1:])
+
+    assert len(reader) == len(samples)
+    assert_same_sample(reader[len(samples) - 1], samples[-1])
+
+def test_clear(tmp_path, samples):
+    store = DatasetStore(tmp_path)
+    other = DatasetStore(tmp_path)
+    store.extend(samples)
+    assert len(other) == len(samples)
+
+    store.clear()
+
+    assert len(store) == 0
+    assert len(other) == 0
+    assert store.append(*samples[1]) == 0
+    assert_same_sample(other[0], samples[1])
+
+def test_clear_is_noticed_after_the_new_index_has_grown(tmp_path, samples):
+    store = DatasetStore(tmp_path)
+    other = DatasetStore(tmp_path)
+    store.extend(samples[:2])
+    assert len(other) == 2
+
+    # Cleared and refilled past other's read position before other looks again
+    store.clear()
+    store.extend(samples[2:] * 3)
+
+    assert len(other) == 6
+    for sample_id, sample in enumerate(samples[2:] * 3):
+        assert_same_sample(other[sample_id], sample)
+
+def test_index_without_a_generation_header(tmp_path, samples):
+    store = DatasetStore(tmp_path)
+    store.extend(samples)
+    # Drop the header, as in an index written before generations were recorded
+    path = tmp_path / INDEX_NAME
+    path.write_bytes(b''.join(path.read_bytes().splitlines(keepends=True)[1:]))
+
+    reopened = DatasetStore(tmp_path)
+    assert len(reopened) == len(samples)
+    assert_same_sample(reopened[2], samples[2])
+    reopened.clear()
+    assert len(reopened) == 0 and len(store) == 0
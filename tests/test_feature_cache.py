@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from feature_cache import FeatureCache, INDEX_NAME, cache_key, pipeline_fingerprint
+
+ENTRY_BYTES = 1000 * 8
+
+def entry(value):
+    return {'x': np.full(1000, value, dtype=np.float64)}
+
+def key(n):
+    return f"{n:040x}"
+
+def files_on_disk(directory):
+    return sorted(name[:-4] for _, _, names in os.walk(directory) for name in names if name.endswith('.npz'))
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = FeatureCache(max_memory_bytes=2 * ENTRY_BYTES)
+    cache.put(key(1), entry(1))
+    cache.put(key(2), entry(2))
+    cache.get(key(1))
+    cache.put(key(3), entry(3))
+
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1))['x'][0] == 1
+    assert cache.get(key(3))['x'][0] == 3
+    stats = cache.stats()
+    assert stats['memory_evictions'] == 1
+    assert stats['memory_entries'] == 2
+    assert stats['memory_bytes'] == 2 * ENTRY_BYTES
+
+def test_disk_tier_serves_entries_evicted_from_memory(tmp_path):
+    cache = FeatureCache(tmp_path, max_memory_bytes=ENTRY_BYTES)
+    cache.put(key(1), entry(1))
+    cache.put(key(2), entry(2))
+
+    np.testing.assert_array_equal(cache.get(key(1))['x'], entry(1)['x'])
+    assert cache.stats()['disk_hits'] == 1
+
+def test_disk_tier_evicts_least_recently_accessed(tmp_path):
+    budget = 3 * ENTRY_BYTES + 2000
+    cache = FeatureCache(tmp_path, max_memory_bytes=0, max_disk_bytes=budget)
+    for n in range(3):
+        cache.put(key(n), entry(n))
+    cache.get(key(0))
+    cache.put(key(3), entry(3))
+
+    assert files_on_disk(tmp_path) == [key(0), key(2), key(3)]
+    assert cache.stats()['disk_evictions'] == 1
+    assert cache.stats()['disk_bytes'] <= budget
+
+def test_disk_budget_is_shared_between_processes(tmp_path):
+    budget = 3 * ENTRY_BYTES + 2000
+    first = FeatureCache(tmp_path, max_disk_bytes=budget)
+    second = FeatureCache(tmp_path, max_disk_bytes=budget)
+    for n in range(3):
+        first.put(key(n), entry(n))
+    for n in range(3, 6):
+        second.put(key(n), entry(n))
+
+    # The second cache evicted the first one's files, and neither clobbered the other's index entries
+    assert files_on_disk(tmp_path) == [key(3), key(4), key(5)]
+    with open(tmp_path / INDEX_NAME) as f:
+        assert sorted(json.load(f)) == [key(3), key(4), key(5)]
+    assert sorted(FeatureCache(tmp_path)._index) == [key(3), key(4), key(5)]
+
+def test_index_is_rebuilt_when_missing(tmp_path):
+    cache = FeatureCache(tmp_path)
+    cache.put(key(1), entry(1))
+    os.remove(tmp_path / INDEX_NAME)
+
+    reopened = FeatureCache(tmp_path)
+    assert reopened.stats()['disk_entries'] == 1
+    assert reopened.get(key(1))['x'][0] == 1
+
+def test_clear_removes_entries_of_every_process(tmp_path):
+    first = FeatureCache(tmp_path)
+    second = FeatureCache(tmp_path)
+    first.put(key(1), entry(1))
+    second.put(key(2), entry(2))
+
+    first.clear()
+
+    assert files_on_disk(tmp_path) == []
+    assert FeatureCache(tmp_path).get(key(2)) is None
+
+def test_cache_key_depends_on_pipeline_fingerprint():
+    fingerprint = pipeline_fingerprint()
+    changed = dict(fingerprint, segment_max_duration=fingerprint['segment_max_duration'] * 2)
+    assert cache_key('abc', fingerprint) == cache_key('abc')
+    assert cache_key('abc', changed) != cache_key('abc')
+
+@pytest.mark.parametrize('name', ['highpass_order', 'trim_threshold', 'onset_multiplier', 'onset_delta',
+                                  'onset_min_interval', 'onset_rms_threshold', 'segment_max_duration'])
+def test_pipeline_fingerprint_covers_preprocessing_and_segmentation_parameters(name):
+    assert name in pipeline_fingerprint()
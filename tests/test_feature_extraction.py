@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from ml_models import FEATURE_NAMES, FEATURE_NPERSEG, extract_features, extract_features_batch
+
+SR = 16000
+
+def make_segments(rng, lengths):
+    return [{'waveform': rng.standard_normal(length).astype(np.float32) * rng.uniform(0.1, 1.0), 'sr': SR}
+            for length in lengths]
+
+# Equal lengths share a batch; lengths below FEATURE_NPERSEG are analyzed as a single frame
+LENGTHS = [1600, 1600, 800, 1600, 3 * FEATURE_NPERSEG, 801, 800, 5000]
+
+def test_batch_matches_per_segment_features():
+    segments = make_segments(np.random.default_rng(0), LENGTHS)
+
+    features = extract_features_batch(segments)
+
+    assert features.shape == (len(segments), len(FEATURE_NAMES))
+    assert features.dtype == np.float32
+    expected = np.array([extract_features(segment) for segment in segments])
+    np.testing.assert_allclose(features, expected, rtol=1e-4, atol=1e-6)
+
+def test_empty_batch():
+    assert extract_features_batch([]).shape == (0, len(FEATURE_NAMES))
+
+def test_mixed_sample_rates_are_rejected():
+    segments = make_segments(np.random.default_rng(0), [800, 800])
+    segments[1]['sr'] = 44100
+    with pytest.raises(ValueError):
+        extract_features_batch(segments)
+
+def test_empty_segments_are_rejected():
+    with pytest.raises(ValueError):
+        extract_features_batch([{'waveform': np.zeros(0, dtype=np.float32), 'sr': SR}])
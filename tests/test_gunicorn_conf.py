@@ -0,0 +1,46 @@
+import importlib.util
+import os
+import types
+
+import pytest
+
+def load_conf():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class FakeArbiter:
+    """The parts of gunicorn's Arbiter the hooks use"""
+
+    def __init__(self, conf, workers):
+        self.cfg = types.SimpleNamespace(workers=workers)
+        self.log = types.SimpleNamespace(error=lambda message: None)
+        self.conf = conf
+        self._num_workers = workers
+
+    @property
+    def num_workers(self):
+        return self._num_workers
+
+    @num_workers.setter
+    def num_workers(self, value):
+        old_value, self._num_workers = self._num_workers, value
+        self.conf.nworkers_changed(self, value, old_value)
+
+def test_serves_with_a_single_worker():
+    conf = load_conf()
+    assert conf.workers == 1
+    conf.on_starting(FakeArbiter(conf, 1))
+
+def test_refuses_to_start_with_several_workers():
+    conf = load_conf()
+    with pytest.raises(RuntimeError):
+        conf.on_starting(FakeArbiter(conf, 4))
+
+def test_worker_count_changes_are_reverted():
+    conf = load_conf()
+    server = FakeArbiter(conf, 1)
+    server.num_workers = 3
+    assert server.num_workers == 1
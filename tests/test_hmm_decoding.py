@@ -0,0 +1,175 @@
+import itertools
+
+import numpy as np
+import pytest
+from scipy.special import logsumexp
+
+from hmm_decoding import viterbi, viterbi_batch, forward_backward, forward_backward_batch, OnlineViterbi
+from language_model import CharNGramLM
+from ml_models import KEYS
+
+N_STATES = 12
+
+def random_model(rng, n_states=N_STATES):
+    """Random (log_start, log_transitions) of an HMM"""
+    start = rng.dirichlet(np.ones(n_states))
+    transitions = rng.dirichlet(np.ones(n_states), n_states)
+    return np.log(start), np.log(transitions)
+
+def random_emissions(rng, lengths, n_states=N_STATES, scale=3.0):
+    return [scale * rng.standard_normal((length, n_states)) for length in lengths]
+
+def path_scores(log_start, log_transitions, log_emissions):
+    """Log probability of every state sequence, by enumeration"""
+    n_steps, n_states = log_emissions.shape
+    paths = np.array(list(itertools.product(range(n_states), repeat=n_steps)))
+    scores = log_start[paths[:, 0]] + log_emissions[np.arange(n_steps), paths].sum(axis=1)
+    scores += log_transitions[paths[:, :-1], paths[:, 1:]].sum(axis=1)
+    return paths, scores
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+# Includes an empty sequence and one of a single step
+LENGTHS = [7, 0, 1, 30, 12, 30]
+
+def test_viterbi_finds_the_best_path(rng):
+    log_start, log_transitions = random_model(rng, n_states=4)
+    emissions = random_emissions(rng, [6], n_states=4)[0]
+
+    path, score = viterbi(log_start, log_transitions, emissions)
+
+    paths, scores = path_scores(log_start, log_transitions, emissions)
+    np.testing.assert_array_equal(path, paths[scores.argmax()])
+    assert score == pytest.approx(scores.max())
+
+def test_viterbi_with_a_full_beam_is_exact(rng):
+    log_start, log_transitions = random_model(rng)
+    emissions = random_emissions(rng, [40])[0]
+
+    expected_path, expected_score = viterbi(log_start, log_transitions, emissions)
+    for beam_width in (N_STATES, N_STATES + 5, 0):
+        path, score = viterbi(log_start, log_transitions, emissions, beam_width=beam_width)
+        np.testing.assert_array_equal(path, expected_path)
+        assert score == expected_score
+
+def test_viterbi_beam_scores_its_own_path(rng):
+    log_start, log_transitions = random_model(rng)
+    emissions = random_emissions(rng, [40])[0]
+
+    path, score = viterbi(log_start, log_transitions, emissions, beam_width=3)
+
+    _, exact_score = viterbi(log_start, log_transitions, emissions)
+    own_score = (log_start[path[0]] + emissions[np.arange(40), path].sum()
+                 + log_transitions[path[:-1], path[1:]].sum())
+    assert score == pytest.approx(own_score)
+    assert score <= exact_score + 1e-9
+
+def test_viterbi_on_empty_and_single_step_sequences(rng):
+    log_start, log_transitions = random_model(rng)
+
+    path, score = viterbi(log_start, log_transitions, np.zeros((0, N_STATES)))
+    assert len(path) == 0 and score == 0.0
+
+    emissions = random_emissions(rng, [1])[0]
+    path, score = viterbi(log_start, log_transitions, emissions)
+    assert path.tolist() == [int(np.argmax(log_start + emissions[0]))]
+
+def test_forward_backward_matches_enumeration(rng):
+    log_start, log_transitions = random_model(rng, n_states=3)
+    emissions = random_emissions(rng, [7], n_states=3)[0]
+
+    posteriors, log_likelihood = forward_backward(log_start, log_transitions, emissions)
+
+    paths, scores = path_scores(log_start, log_transitions, emissions)
+    assert log_likelihood == pytest.approx(logsumexp(scores))
+    weights = np.exp(scores - logsumexp(scores))
+    expected = np.stack([np.bincount(paths[:, t], weights=weights, minlength=3) for t in range(7)])
+    np.testing.assert_allclose(posteriors, expected, atol=1e-12)
+
+def test_forward_backward_posteriors_are_distributions(rng):
+    log_start, log_transitions = random_model(rng)
+    # Large emissions would overflow without the per-step shift
+    emissions = random_emissions(rng, [200], scale=400.0)[0]
+
+    posteriors, log_likelihood = forward_backward(log_start, log_transitions, emissions)
+
+    np.testing.assert_allclose(posteriors.sum(axis=1), 1.0)
+    assert (posteriors >= 0).all()
+    assert np.isfinite(log_likelihood)
+
+@pytest.mark.parametrize('beam_width', [None, 4])
+def test_viterbi_batch_matches_viterbi(rng, beam_width):
+    log_start, log_transitions = random_model(rng)
+    emissions = random_emissions(rng, LENGTHS)
+
+    batch = viterbi_batch(log_start, log_transitions, emissions, beam_width=beam_width)
+
+    assert len(batch) == len(emissions)
+    for (path, score), sequence in zip(batch, emissions):
+        expected_path, expected_score = viterbi(log_start, log_transitions, sequence, beam_width=beam_width)
+        np.testing.assert_array_equal(path, expected_path)
+        assert score == pytest.approx(expected_score)
+
+def test_viterbi_batch_matches_viterbi_with_language_model(rng):
+    texts = ["the quick brown fox", "jumps over the lazy dog", "hello world"] * 5
+    language_model = CharNGramLM.train(texts, order=3)
+    emissions = random_emissions(rng, [5, 9, 0, 14], n_states=len(KEYS))
+    log_start = language_model.log_start()
+
+    batch = viterbi_batch(log_start, language_model, emissions, beam_width=8)
+
+    for (path, score), sequence in zip(batch, emissions):
+        expected_path, expected_score = viterbi(log_start, language_model, sequence, beam_width=8)
+        np.testing.assert_array_equal(path, expected_path)
+        assert score == pytest.approx(expected_score)
+
+def test_forward_backward_batch_matches_forward_backward(rng):
+    log_start, log_transitions = random_model(rng)
+    emissions = random_emissions(rng, LENGTHS)
+
+    batch = forward_backward_batch(log_start, log_transitions, emissions)
+
+    assert len(batch) == len(emissions)
+    for (posteriors, log_likelihood), sequence in zip(batch, emissions):
+        expected_posteriors, expected_log_likelihood = forward_backward(log_start, log_transitions, sequence)
+        assert posteriors.shape == (len(sequence), N_STATES)
+        np.testing.assert_allclose(posteriors, expected_posteriors, rtol=1e-9, atol=1e-12)
+        assert log_likelihood == pytest.approx(expected_log_likelihood)
+
+def stream(decoder, emissions, chunk):
+    """States committed by feeding emissions in chunks of the given size, then flushing"""
+    committed = [decoder.push(emissions[start:start + chunk]) for start in range(0, len(emissions), chunk)]
+    committed.append(decoder.flush())
+    return np.concatenate(committed)
+
+@pytest.mark.parametrize('chunk', [1, 5, 64])
+@pytest.mark.parametrize('beam_width', [None, 4])
+def test_online_viterbi_with_full_lag_matches_viterbi(rng, chunk, beam_width):
+    log_start, log_transitions = random_model(rng)
+    emissions = random_emissions(rng, [50])[0]
+
+    decoder = OnlineViterbi(log_start, log_transitions, beam_width=beam_width, lag=len(emissions))
+    path = stream(decoder, emissions, chunk)
+
+    expected_path, _ = viterbi(log_start, log_transitions, emissions, beam_width=beam_width)
+    np.testing.assert_array_equal(path, expected_path)
+    assert decoder.committed == len(emissions)
+
+def test_online_viterbi_commits_with_bounded_lag(rng):
+    # Confident emissions: the best path is settled long before the lag runs out
+    log_start, log_transitions = random_model(rng)
+    states = rng.integers(0, N_STATES, 200)
+    emissions = np.full((200, N_STATES), -20.0)
+    emissions[np.arange(200), states] = 0.0
+
+    decoder = OnlineViterbi(log_start, log_transitions, lag=8)
+    committed = decoder.push(emissions)
+    assert len(committed) == 200 - 8
+    assert len(decoder.tentative()) == 8
+    path = np.concatenate([committed, decoder.flush()])
+
+    expected_path, _ = viterbi(log_start, log_transitions, emissions)
+    np.testing.assert_array_equal(path, expected_path)
+    np.testing.assert_array_equal(path, states)
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+from job_queue import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+@pytest.fixture
+def jobs():
+    return JobQueue(workers=1)
+
+def finish(jobs, job):
+    jobs._queue.join()
+    return job
+
+def test_job_reports_stages_and_result(jobs):
+    seen = []
+
+    def work(job, items, scale=1):
+        job.set_stage('load', total=len(items))
+        for _ in items:
+            job.advance()
+        seen.append(job.progress)
+        job.set_stage('train')
+        return sum(items) * scale
+
+    job = finish(jobs, jobs.submit('train', work, [1, 2, 3], scale=2, stages=('load', 'train', 'publish')))
+
+    assert job.status == SUCCEEDED
+    assert job.result == 12
+    assert job.progress == 1.0
+    # Halfway through the first of three stages
+    assert seen == [pytest.approx(1 / 3)]
+    status = job.to_dict()
+    assert [stage['name'] for stage in status['stages']] == ['load', 'train', 'publish']
+    assert status['stages'][0] == {'name': 'load', 'done': 3, 'total': 3}
+    assert status['stages'][1]['done'] == 1
+    assert status['started_at'] <= status['finished_at']
+    assert job.args is None and job.kwargs is None
+    assert jobs.get(job.id) is job
+
+def test_failed_job_keeps_the_error(jobs):
+    def work(job):
+        job.set_stage('load')
+        raise ValueError("no keystrokes found")
+
+    job = finish(jobs, jobs.submit('train', work, stages=('load',)))
+
+    assert job.status == FAILED
+    assert job.error == "no keystrokes found"
+    assert job.result is None
+    assert job.args is None and job.kwargs is None
+
+def test_cancelled_while_queued_never_runs(jobs):
+    release = threading.Event()
+    started = threading.Event()
+    ran = []
+
+    def block(job):
+        started.set()
+        release.wait(5)
+
+    first = jobs.submit('block', block)
+    started.wait(5)
+    second = jobs.submit('work', lambda job: ran.append(job.id))
+    assert second.status == QUEUED
+    assert jobs.cancel(second.id) is second
+    release.set()
+    finish(jobs, second)
+
+    assert first.status == SUCCEEDED
+    assert second.status == CANCELLED
+    assert second.started_at is None
+    assert ran == []
+
+def test_running_job_stops_at_its_next_check(jobs):
+    started = threading.Event()
+    resume = threading.Event()
+
+    def work(job):
+        job.set_stage('load', total=10)
+        started.set()
+        resume.wait(5)
+        for _ in range(10):
+            job.advance()
+        return 'done'
+
+    job = jobs.submit('train', work, stages=('load', 'train'))
+    started.wait(5)
+    assert job.status == RUNNING
+    jobs.cancel(job.id)
+    resume.set()
+    finish(jobs, job)
+
+    assert job.status == CANCELLED
+    assert job.result is None
+    assert job.stages['load']['done'] == 1
+    # Finished jobs cannot be cancelled again
+    jobs.cancel(job.id)
+    assert job.status == CANCELLED
+
+def test_unknown_job(jobs):
+    assert jobs.get('missing') is None
+    assert jobs.cancel('missing') is None
+
+def test_only_the_newest_finished_jobs_are_kept():
+    jobs = JobQueue(workers=1, max_finished=2)
+    submitted = [finish(jobs, jobs.submit('work', lambda job, i=i: i)) for i in range(4)]
+    jobs.submit('work', lambda job: None)
+    jobs._queue.join()
+
+    assert [jobs.get(job.id) for job in submitted[:2]] == [None, None]
+    assert all(jobs.get(job.id) is job for job in submitted[2:])
+
+def test_cleanup_runs_however_the_job_ends(jobs):
+    started = threading.Event()
+    release = threading.Event()
+    cleaned = []
+
+    def block(job):
+        started.set()
+        release.wait(5)
+
+    def fail(job):
+        raise ValueError("failed")
+
+    first = jobs.submit('block', block, cleanup=lambda: cleaned.append('block'))
+    started.wait(5)
+    cancelled = jobs.submit('work', lambda job, data: data, b'audio', cleanup=lambda: cleaned.append('cancelled'))
+    failed = jobs.submit('fail', fail, cleanup=lambda: cleaned.append('failed'))
+    jobs.cancel(cancelled.id)
+    release.set()
+    finish(jobs, failed)
+
+    assert [first.status, cancelled.status, failed.status] == [SUCCEEDED, CANCELLED, FAILED]
+    assert cleaned == ['block', 'cancelled', 'failed']
+    assert cancelled.args is None and cancelled.kwargs is None and cancelled.cleanup is None
+
+def test_cleanup_errors_do_not_change_the_status(jobs):
+    def broken():
+        raise OSError("already closed")
+
+    job = finish(jobs, jobs.submit('work', lambda job: 'done', cleanup=broken))
+
+    assert job.status == SUCCEEDED
+    assert job.result == 'done'
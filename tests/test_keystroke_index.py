@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import keystroke_index
+from keystroke_index import KeystrokeIndex
+
+DIM = 12
+
+def clustered(rng, n, n_clusters=50):
+    """Vectors around random cluster centres, with a label per cluster"""
+    centres = 1.5 * rng.standard_normal((n_clusters, DIM))
+    labels = rng.integers(0, n_clusters, n)
+    return (centres[labels] + rng.standard_normal((n, DIM))).astype(np.float32), labels % 43
+
+def brute_force(index, features, queries, k):
+    snapshot = index._current()
+    Z = snapshot.standardize(features)
+    Q = snapshot.standardize(queries)
+    distances = ((Q[:, np.newaxis] - Z[np.newaxis]) ** 2).sum(axis=2)
+    return np.argsort(distances, axis=1, kind='stable')[:, :k], np.sort(distances, axis=1)[:, :k]
+
+@pytest.fixture
+def small_lists(monkeypatch):
+    # Lay vectors out in lists from a few thousand on, so the tests stay fast
+    monkeypatch.setattr(keystroke_index, 'MIN_IVF_VECTORS', 2000)
+    monkeypatch.setattr(keystroke_index, 'MAX_TAIL_VECTORS', 1000)
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    features, labels = clustered(rng, 6000)
+    queries = features[rng.choice(len(features), 200, replace=False)] + 0.3 * rng.standard_normal((200, DIM))
+    return features, labels, queries.astype(np.float32)
+
+def test_exact_search_matches_brute_force(tmp_path, small_lists, data):
+    features, labels, queries = data
+    index = KeystrokeIndex(str(tmp_path))
+    index.add(features[:1500], labels[:1500])
+    assert index.stats()['lists'] == 0
+
+    distances, ids, found_labels = index.search(queries, k=5)
+
+    expected_ids, expected_distances = brute_force(index, features[:1500], queries, 5)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-3)
+    np.testing.assert_array_equal(found_labels, labels[:1500][ids])
+
+def test_ivf_recall_against_exact_search(tmp_path, small_lists, data):
+    features, labels, queries = data
+    index = KeystrokeIndex(str(tmp_path))
+    for start in range(0, len(features), 1000):
+        index.add(features[start:start + 1000], labels[start:start + 1000])
+    stats = index.stats()
+    assert stats['lists'] > 0 and stats['in_lists'] >= 2000
+    assert stats['keystrokes'] == len(features)
+
+    k = 10
+    exact_distances, exact_ids, _ = index.search(queries, k=k, exact=True)
+    expected_ids, _ = brute_force(index, features, queries, k)
+    np.testing.assert_array_equal(np.sort(exact_ids, axis=1), np.sort(expected_ids, axis=1))
+
+    def recall(nprobe):
+        _, approximate_ids, _ = index.search(queries, k=k, nprobe=nprobe)
+        return np.mean([len(np.intersect1d(a, e)) / k for a, e in zip(approximate_ids, exact_ids)])
+
+    assert recall(8) >= 0.95
+    assert recall(1) < recall(8)
+
+    # Probing every list is exact (neighbours at equal distances may swap places)
+    all_distances, all_ids, _ = index.search(queries, k=k, nprobe=stats['lists'])
+    np.testing.assert_array_equal(np.sort(all_ids, axis=1), np.sort(exact_ids, axis=1))
+    np.testing.assert_allclose(all_distances, exact_distances, rtol=1e-4, atol=1e-3)
+
+def test_index_is_shared_through_the_directory(tmp_path, small_lists, data):
+    features, labels, queries = data
+    writer = KeystrokeIndex(str(tmp_path))
+    reader = KeystrokeIndex(str(tmp_path))
+    writer.add(features[:2500], labels[:2500])
+    assert len(reader) == 2500
+
+    writer.add(features[2500:2600], labels[2500:2600])
+    _, ids, _ = reader.search(features[2550:2551], k=1, exact=True)
+    assert ids[0, 0] == 2550
+
+    writer.clear()
+    distances, ids, found_labels = reader.search(queries[:3], k=2)
+    assert len(reader) == 0
+    assert np.isinf(distances).all() and (ids == -1).all() and (found_labels == -1).all()
+
+def test_fewer_vectors_than_k(tmp_path, data):
+    features, labels, queries = data
+    index = KeystrokeIndex(str(tmp_path))
+    index.add(features[:3], labels[:3])
+
+    distances, ids, _ = index.search(queries[:2], k=5)
+
+    assert np.isfinite(distances[:, :3]).all() and np.isinf(distances[:, 3:]).all()
+    assert (ids[:, 3:] == -1).all()
+    probs = index.classify(queries[:2], k=5)
+    np.testing.assert_allclose(probs.sum(axis=1), 1.0)
+    with pytest.raises(ValueError):
+        index.add(np.zeros((1, DIM + 1)), [0])
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from hmm_decoding import viterbi
+from language_model import CharNGramLM
+
+TEXTS = ["the quick brown fox jumps over the lazy dog",
+         "hello world, hello keyboard!",
+         "pack my box with five dozen liquor jugs",
+         "the the the end"] * 3
+
+@pytest.fixture(scope='module')
+def model():
+    return CharNGramLM.train(TEXTS, order=4)
+
+def contexts_of(model, texts):
+    """Context ids after each prefix of the texts"""
+    contexts = []
+    for text in texts:
+        context = model.initial_context()
+        contexts.append(context)
+        for c in text:
+            context = int(model.next_context(context, model.keys.index(c)))
+            contexts.append(context)
+    return np.array(contexts)
+
+@pytest.mark.parametrize('order', [1, 2, 3, 4])
+def test_probabilities_sum_to_one(model, order):
+    rng = np.random.default_rng(0)
+    # Contexts seen in training and arbitrary (mostly unseen) ones
+    contexts = np.concatenate([contexts_of(model, TEXTS[:3]),
+                               rng.integers(0, model.base ** (model.order - 1), 200)])
+
+    probs = np.exp(model.log_transitions(contexts, order=order))
+
+    assert probs.shape == (len(contexts), len(model.keys))
+    assert (probs > 0).all()
+    np.testing.assert_allclose(probs.sum(axis=1), 1.0)
+    np.testing.assert_allclose(np.exp(model.log_start()).sum(), 1.0)
+
+def test_seen_continuations_are_preferred(model):
+    context = contexts_of(model, ["the quick brown fo"])[-1]
+    probs = model.log_transitions([context])[0]
+    assert probs.argmax() == model.keys.index('x')
+    assert model.log_prob("the quick brown fox") > model.log_prob("xq zjv kwpyt bfm")
+
+def test_dense_tables_match_sparse_lookups(model):
+    assert len(model.dense) > 0
+    sparse = CharNGramLM(model.keys, model.order, model.tables, model.discounts, dense=[])
+    contexts = np.random.default_rng(1).integers(0, model.base ** (model.order - 1), 300)
+    np.testing.assert_allclose(sparse.log_transitions(contexts), model.log_transitions(contexts), atol=1e-6)
+
+def test_save_and_load(model, tmp_path):
+    model.save(str(tmp_path))
+    loaded = CharNGramLM.load(str(tmp_path))
+    contexts = contexts_of(model, TEXTS[:2])
+    np.testing.assert_array_equal(loaded.log_transitions(contexts), model.log_transitions(contexts))
+    assert loaded.log_prob(TEXTS[1]) == model.log_prob(TEXTS[1])
+
+def test_bigram_model_decodes_like_its_transition_matrix():
+    bigram = CharNGramLM.train(TEXTS, order=2)
+    emissions = 3.0 * np.random.default_rng(2).standard_normal((25, len(bigram.keys)))
+
+    path, score = viterbi(bigram.log_start(), bigram, emissions)
+
+    expected_path, expected_score = viterbi(bigram.log_start(), bigram.transition_matrix(), emissions)
+    np.testing.assert_array_equal(path, expected_path)
+    assert score == pytest.approx(expected_score)
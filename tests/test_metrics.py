@@ -0,0 +1,106 @@
+import math
+import re
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+# One sample line of the text exposition format: name, optional labels, value
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? '
+                    r'(NaN|[+-]Inf|-?[0-9.e+-]+)$')
+
+def parse(text):
+    """{sample name and labels: value} of an exposition, checking every line's syntax"""
+    assert text.endswith('\n')
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            assert re.match(r'^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$', line), line
+            continue
+        assert SAMPLE.match(line), line
+        key, value = line.rsplit(' ', 1)
+        samples[key] = float(value.replace('Inf', 'inf'))
+    return samples
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+def test_counter_exposition(registry):
+    requests = Counter('app_requests', 'Requests served', ('pipeline', 'status'), registry=registry)
+    requests.labels('predict', 200).inc()
+    requests.labels(pipeline='predict', status=200).inc(2)
+    requests.labels('train', 500).inc()
+
+    assert registry.exposition() == (
+        '# HELP app_requests_total Requests served\n'
+        '# TYPE app_requests_total counter\n'
+        'app_requests_total{pipeline="predict",status="200"} 3\n'
+        'app_requests_total{pipeline="train",status="500"} 1\n')
+    with pytest.raises(ValueError):
+        requests.labels('predict').inc()
+    with pytest.raises(ValueError):
+        requests.labels('predict', 200).inc(-1)
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = Histogram('app_latency_seconds', 'Latency', buckets=(0.5, 0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.labels().observe(value)
+
+    text = registry.exposition()
+    assert text.startswith('# HELP app_latency_seconds Latency\n# TYPE app_latency_seconds histogram\n')
+    samples = parse(text)
+    assert samples == {
+        'app_latency_seconds_bucket{le="0.1"}': 2,
+        'app_latency_seconds_bucket{le="0.5"}': 3,
+        'app_latency_seconds_bucket{le="1"}': 3,
+        'app_latency_seconds_bucket{le="+Inf"}': 4,
+        'app_latency_seconds_sum': pytest.approx(2.45),
+        'app_latency_seconds_count': 4
+    }
+
+def test_gauges_and_label_escaping(registry):
+    level = Gauge('app_level', 'Level', ('path',), registry=registry)
+    level.labels('a "quoted"\\path\nnext').set(2.5)
+    level.labels('plain').inc(3)
+    level.labels('plain').dec()
+    broken = Gauge('app_broken', 'Unreadable', registry=registry)
+    broken.set_function(lambda: 1 / 0)
+
+    text = registry.exposition()
+
+    samples = parse(text)
+    assert samples['app_level{path="a \\"quoted\\"\\\\path\\nnext"}'] == 2.5
+    assert samples['app_level{path="plain"}'] == 2
+    assert math.isnan(samples['app_broken'])
+    assert '# TYPE app_level gauge' in text
+
+def test_names_are_registered_once(registry):
+    Gauge('app_level', 'Level', registry=registry)
+    with pytest.raises(ValueError):
+        Counter('app_level', 'Level', registry=registry)
+
+def test_stages_and_requests_are_attributed_to_their_pipeline():
+    def value(key):
+        return parse(metrics.exposition()).get(key, 0)
+
+    stage_count = 'keystroke_stage_duration_seconds_count{pipeline="test",stage="decode"}'
+    stage_samples = 'keystroke_stage_samples_total{pipeline="test",stage="decode"}'
+    requests = 'keystroke_requests_total{pipeline="test",status="500"}'
+    before = [value(stage_count), value(stage_samples), value(requests)]
+
+    tracker = metrics.begin_request('test')
+    assert value('keystroke_requests_in_progress{pipeline="test"}') == 1
+    with pytest.raises(RuntimeError):
+        with metrics.stage('decode') as record:
+            record.samples = 160
+            raise RuntimeError("failed")
+    tracker.end(error=RuntimeError("failed"))
+
+    assert [value(stage_count), value(stage_samples), value(requests)] == [before[0] + 1, before[1] + 160,
+                                                                            before[2] + 1]
+    assert value('keystroke_requests_in_progress{pipeline="test"}') == 0
+    with metrics.stage('decode'):
+        pass
+    assert value('keystroke_stage_duration_seconds_count{pipeline="other",stage="decode"}') >= 1
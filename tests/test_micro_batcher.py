@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+def test_results_are_returned_in_order():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=4)
+    assert batcher.submit_many(list(range(10)), timeout=5) == [item * 2 for item in range(10)]
+    assert batcher.stats()['items'] == 10
+
+def test_batch_errors_reach_every_caller():
+    def fail(items):
+        raise ValueError("bad batch")
+
+    batcher = MicroBatcher(fail)
+    with pytest.raises(ValueError):
+        batcher.submit(1, timeout=5)
+    assert batcher.stats()['errors'] == 1
+
+def test_cancelled_items_are_skipped():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def process(items):
+        started.set()
+        release.wait(5)
+        batches.append(list(items))
+        return items
+
+    batcher = MicroBatcher(process, max_wait_ms=0)
+    first = batcher.submit_async(0)
+    assert started.wait(5)
+    # Queued behind the running batch; one of them is cancelled before it is collected
+    futures = [batcher.submit_async(item) for item in (1, 2, 3)]
+    assert futures[1].cancel()
+    release.set()
+
+    assert first.result(5) == 0
+    assert [futures[0].result(5), futures[2].result(5)] == [1, 3]
+    assert [item for batch in batches for item in batch] == [0, 1, 3]
+    # The worker survived and keeps serving
+    assert batcher.submit(4, timeout=5) == 4
+
+def test_waiting_items_share_batches():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def process(items):
+        started.set()
+        release.wait(5)
+        batches.append(list(items))
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=0)
+    first = batcher.submit_async(0)
+    assert started.wait(5)
+    futures = [batcher.submit_async(item) for item in range(1, 10)]
+    release.set()
+
+    assert [future.result(5) for future in [first] + futures] == list(range(10))
+    assert batches == [[0], [1, 2, 3, 4], [5, 6, 7, 8], [9]]
+    stats = batcher.stats()
+    assert stats['batches'] == 4
+    assert stats['mean_batch_size'] == 2.5
+    assert stats['p50_ms'] is not None and stats['p99_ms'] >= stats['p50_ms']
+
+def test_result_count_must_match_the_batch():
+    batcher = MicroBatcher(lambda items: items[:-1])
+    with pytest.raises(RuntimeError):
+        batcher.submit(1, timeout=5)
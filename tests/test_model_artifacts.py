@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from ml_models import KEYS, FEATURE_NAMES, KeystrokeHMM, build_cnn_model
+from model_artifacts import ModelArtifactStore
+
+def make_hmm(rng, offset=0.0, n_samples=4, n_keystrokes=40):
+    """KeystrokeHMM fit on features drawn around random per-key means"""
+    means = rng.standard_normal((len(KEYS), len(FEATURE_NAMES))) + offset
+    samples = []
+    for _ in range(n_samples):
+        states = rng.integers(0, len(KEYS), n_keystrokes)
+        features = means[states] + 0.5 * rng.standard_normal((n_keystrokes, len(FEATURE_NAMES)))
+        samples.append(({'segment_features': features}, ''.join(KEYS[i] for i in states)))
+    return KeystrokeHMM().fit(samples)
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.fixture
+def cnn_model():
+    return build_cnn_model()
+
+def test_save_and_load(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    assert store.current_version() is None
+    assert store.load() is None
+
+    hmm = make_hmm(rng)
+    version = store.save(cnn_model, hmm, training_samples=4, record_ids={'cnn': 1, 'hmm': 2, 'combined': 3})
+
+    assert version == 1
+    assert store.current_version() == 1
+    loaded_cnn, loaded_hmm, manifest = store.load()
+    assert manifest['training_samples'] == 4
+    assert manifest['trained_model_ids'] == {'cnn': 1, 'hmm': 2, 'combined': 3}
+    np.testing.assert_array_equal(loaded_hmm.counts, hmm.counts)
+    np.testing.assert_allclose(loaded_hmm.parameters['means'], hmm.parameters['means'])
+    for name, weights in cnn_model.get_weights().items():
+        np.testing.assert_array_equal(loaded_cnn.get_weights()[name], weights)
+
+def test_versions_increase_and_old_ones_are_pruned(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path, keep=2)
+    hmm = make_hmm(rng)
+    versions = [store.save(cnn_model, hmm, training_samples=n) for n in range(1, 5)]
+
+    assert versions == [1, 2, 3, 4]
+    assert store.versions() == [3, 4]
+    assert store.current_version() == 4
+    assert store.manifest(3)['training_samples'] == 3
+
+def test_loaded_statistics_are_copy_on_write(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    store.save(cnn_model, make_hmm(rng), training_samples=4)
+    _, hmm, _ = store.load()
+    counts = hmm.counts.copy()
+
+    hmm.partial_fit([({'segment_features': np.zeros((2, len(FEATURE_NAMES)))}, KEYS[:2])])
+
+    np.testing.assert_array_equal(store.load()[1].counts, counts)
+
+def test_link_records(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    version = store.save(cnn_model, make_hmm(rng), training_samples=4)
+    store.link_records(version, {'cnn': 7, 'hmm': 8, 'combined': 9})
+    assert store.manifest(version)['trained_model_ids'] == {'cnn': 7, 'hmm': 8, 'combined': 9}
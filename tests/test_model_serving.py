@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from ml_models import build_cnn_model
+from model_artifacts import ModelArtifactStore, CURRENT_NAME
+from model_serving import ModelServer
+from test_model_artifacts import make_hmm
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+@pytest.fixture
+def cnn_model():
+    return build_cnn_model()
+
+def test_clear_never_reuses_version_numbers(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    store.save(cnn_model, make_hmm(rng), training_samples=4)
+    store.save(cnn_model, make_hmm(rng), training_samples=8)
+
+    store.clear()
+
+    assert store.current_version() is None
+    assert store.versions() == []
+    assert not os.path.exists(tmp_path / CURRENT_NAME)
+    assert store.load() is None
+    assert store.save(cnn_model, make_hmm(rng), training_samples=4) == 3
+    assert ModelArtifactStore(tmp_path).save(cnn_model, make_hmm(rng), training_samples=8) == 4
+
+def test_server_switches_to_the_generation_saved_after_a_reset(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    served = ModelServer(store, [])
+    store.save(cnn_model, make_hmm(rng), training_samples=4)
+    assert served.models()[2] == 1
+
+    # Another worker resets the store and publishes; this one was idle in between
+    store.clear()
+    hmm = make_hmm(rng, offset=5.0)
+    version = store.save(cnn_model, hmm, training_samples=4)
+
+    _, served_hmm, served_version = served.models()
+    assert served_version == version
+    np.testing.assert_allclose(served_hmm.parameters['means'], hmm.parameters['means'])
+
+def test_server_stops_serving_after_clear(tmp_path, rng, cnn_model):
+    store = ModelArtifactStore(tmp_path)
+    served = ModelServer(store, [])
+    store.save(cnn_model, make_hmm(rng), training_samples=4)
+    assert served.models()[2] == 1
+
+    store.clear()
+
+    assert served.models() == (None, None, None)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from audio_processor import extract_keystroke_segments
+from onset_detection import OnsetDetector, PRE_ROLL, detect_onsets, frame_signal, segment_bounds
+
+SR = 16000
+CLICK_TIMES = np.array([0.25, 0.6, 0.9, 1.4, 1.55, 2.2, 2.7])
+
+@pytest.fixture
+def click_train():
+    """Three seconds of faint noise with a decaying 3 kHz click at every CLICK_TIMES entry"""
+    rng = np.random.default_rng(0)
+    y = 0.001 * rng.standard_normal(3 * SR).astype(np.float32)
+    t = np.arange(int(0.03 * SR)) / SR
+    click = (0.8 * np.exp(-150 * t) * np.sin(2 * np.pi * 3000 * t)).astype(np.float32)
+    for time in CLICK_TIMES:
+        start = int(time * SR)
+        y[start:start + len(click)] += click
+    return y
+
+def test_onsets_of_a_click_train(click_train):
+    onsets = detect_onsets(click_train, SR)
+    assert onsets.dtype == np.int64
+    np.testing.assert_allclose(onsets / SR, CLICK_TIMES, atol=0.005)
+
+@pytest.mark.parametrize('block_size', [160, 333, 4096])
+def test_block_wise_detection_matches_whole_signal(click_train, block_size):
+    detector = OnsetDetector(SR)
+    onsets = [detector.process(click_train[start:start + block_size])
+              for start in range(0, len(click_train), block_size)]
+    onsets.append(detector.flush())
+    np.testing.assert_array_equal(np.concatenate(onsets), detect_onsets(click_train, SR))
+
+def test_silence_has_no_onsets():
+    assert len(detect_onsets(np.zeros(SR, dtype=np.float32), SR)) == 0
+
+def test_rms_gate_drops_quiet_onsets(click_train):
+    assert len(detect_onsets(click_train, SR, rms_threshold=1.0)) == 0
+
+def test_keystroke_segments_start_before_each_click(click_train):
+    segments = extract_keystroke_segments({'waveform': click_train, 'sr': SR})
+    starts = np.array([segment['start_time'] for segment in segments])
+    np.testing.assert_allclose(starts, CLICK_TIMES - PRE_ROLL, atol=0.005)
+    for segment in segments:
+        assert len(segment['waveform']) == round((segment['end_time'] - segment['start_time']) * SR)
+
+def test_segment_bounds_are_cut_short_and_filtered():
+    starts, ends = segment_bounds([1000, 1500, 9000], 9500, SR, pre_roll=0, max_duration=0.1, min_duration=0.04)
+    # The first segment ends where the second starts and the last at the end of the signal; both are too short
+    np.testing.assert_array_equal(starts, [1500])
+    np.testing.assert_array_equal(ends, [1500 + int(0.1 * SR)])
+
+def test_frame_signal_is_a_strided_view():
+    y = np.arange(10, dtype=np.float32)
+    frames = frame_signal(y, 4, 3)
+    np.testing.assert_array_equal(frames, [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]])
+    assert np.shares_memory(frames, y)
@@ -0,0 +1,95 @@
+import io
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from feature_cache import FeatureCache
+import parallel_ingest
+from parallel_ingest import IN_FLIGHT_PER_WORKER, ingest_files, shutdown_executor
+from synthetic_corpus import render_text
+
+def wav_bytes(text, seed, rate=16000):
+    y, _ = render_text(text, rate=rate, seed=seed)
+    buffer = io.BytesIO()
+    wavfile.write(buffer, rate, (y / np.abs(y).max() * 20000).astype(np.int16))
+    return buffer.getvalue()
+
+@pytest.fixture(scope='module')
+def recordings():
+    return [wav_bytes(text, seed, rate) for seed, (text, rate) in
+            enumerate([("hello", 16000), ("keyboard", 44100), ("ab", 16000), ("typing test", 48000)])]
+
+@pytest.fixture(autouse=True, scope='module')
+def executor():
+    yield
+    shutdown_executor()
+
+def sources(recordings, tmp_path):
+    """The recordings as every kind of source ingest_files accepts: bytes, a path and file objects"""
+    path = tmp_path / 'second.wav'
+    path.write_bytes(recordings[1])
+    return [('first.wav', recordings[0]), ('second.wav', str(path)),
+            ('third.wav', io.BytesIO(recordings[2])), ('fourth.wav', memoryview(recordings[3]))]
+
+def assert_same_results(results, expected):
+    assert [name for name, _, _ in results] == [name for name, _, _ in expected]
+    for (_, audio_data, error), (_, expected_audio, _) in zip(results, expected):
+        assert error is None
+        assert audio_data.keys() == expected_audio.keys()
+        for key, value in expected_audio.items():
+            np.testing.assert_array_equal(audio_data[key], value)
+
+def test_worker_pool_matches_serial_ingestion(recordings, tmp_path):
+    serial = ingest_files(sources(recordings, tmp_path), workers=1)
+    finished = []
+    parallel = ingest_files(sources(recordings, tmp_path), workers=2, progress=finished.append)
+
+    assert_same_results(parallel, serial)
+    assert sorted(finished) == sorted(name for name, _, _ in serial)
+    assert all(len(audio_data['segment_features']) > 0 for _, audio_data, _ in serial)
+
+def test_cached_files_are_not_analyzed_again(recordings, tmp_path):
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    first = ingest_files(sources(recordings, tmp_path), cache, workers=2)
+    misses = cache.stats()['misses']
+
+    second = ingest_files(sources(recordings, tmp_path), cache, workers=2)
+
+    assert_same_results(second, first)
+    assert cache.stats()['misses'] == misses
+    assert cache.stats()['memory_hits'] + cache.stats()['disk_hits'] == len(recordings)
+
+def test_unreadable_sources_are_reported_individually(recordings, tmp_path):
+    files = [('missing.wav', str(tmp_path / 'missing.wav')), ('first.wav', recordings[0])]
+    results = ingest_files(files, workers=2)
+
+    assert results[0][0] == 'missing.wav' and results[0][1] is None and results[0][2]
+    assert results[1][2] is None
+
+def test_uploads_in_shared_memory_are_bounded(recordings, monkeypatch):
+    live = []
+    peak = []
+    copy, release = parallel_ingest._copy_to_shared_memory, parallel_ingest._release
+
+    def counted_copy(source):
+        shm, size = copy(source)
+        live.append(shm.name)
+        peak.append(len(live))
+        return shm, size
+
+    def counted_release(shm):
+        if shm is not None:
+            live.remove(shm.name)
+        release(shm)
+
+    monkeypatch.setattr(parallel_ingest, '_copy_to_shared_memory', counted_copy)
+    monkeypatch.setattr(parallel_ingest, '_release', counted_release)
+    files = [(f"{i}.wav", recordings[i % len(recordings)]) for i in range(12)]
+
+    results = ingest_files(files, workers=2)
+
+    assert [name for name, _, _ in results] == [name for name, _ in files]
+    assert all(error is None for _, _, error in results)
+    assert len(peak) == len(files) and live == []
+    assert max(peak) <= IN_FLIGHT_PER_WORKER * 2
@@ -0,0 +1,61 @@
+import base64
+
+import numpy as np
+import pytest
+
+from audio_processor import compute_spectrogram, format_spectrogram, max_pool, pack_spectrogram
+
+def unpack(payload):
+    """Inverse of pack_spectrogram's encoding, as the browser decodes it"""
+    data = np.frombuffer(base64.b64decode(payload['data']), dtype=np.uint8)
+    return data.reshape(payload['shape']).astype(np.float32) / 255
+
+@pytest.fixture
+def spectrogram():
+    rng = np.random.default_rng(0)
+    freq = np.linspace(0, 8000, 37)
+    time = 0.032 * np.arange(101) + 0.064
+    return {
+        'data': rng.random((len(freq), len(time))).astype(np.float32),
+        'time': time,
+        'freq': freq,
+        'min_value': -120.0,
+        'max_value': -20.0
+    }
+
+def test_round_trip_without_pooling(spectrogram):
+    payload = pack_spectrogram(spectrogram)
+
+    assert payload['encoding'] == 'uint8'
+    assert payload['shape'] == list(spectrogram['data'].shape)
+    # Quantization to 256 levels loses at most half a step
+    np.testing.assert_allclose(unpack(payload), spectrogram['data'], atol=0.5 / 255 + 1e-6)
+    assert payload['time_range'] == pytest.approx([spectrogram['time'][0], spectrogram['time'][-1]])
+    assert payload['freq_range'] == pytest.approx([spectrogram['freq'][0], spectrogram['freq'][-1]])
+    assert (payload['min_value'], payload['max_value']) == (-120.0, -20.0)
+
+def test_round_trip_with_pooling_keeps_peaks(spectrogram):
+    spectrogram['data'][5, 42] = 1.0
+    payload = pack_spectrogram(spectrogram, max_columns=20, max_rows=10)
+
+    rows, columns = payload['shape']
+    assert rows <= 10 and columns <= 20
+    decoded = unpack(payload)
+    expected, _ = max_pool(max_pool(spectrogram['data'], 1, 20)[0], 0, 10)
+    np.testing.assert_allclose(decoded, expected, atol=0.5 / 255 + 1e-6)
+    # A one-cell transient survives the pooling
+    assert decoded.max() == 1.0
+
+def test_format_spectrogram_json_matches_the_arrays(spectrogram):
+    payload = format_spectrogram(spectrogram, 'json')
+    np.testing.assert_array_equal(np.array(payload['data'], dtype=np.float32), spectrogram['data'])
+    with pytest.raises(ValueError):
+        format_spectrogram(spectrogram, 'png')
+
+def test_packed_audio_spectrogram_is_normalized():
+    rng = np.random.default_rng(1)
+    audio_data = {'waveform': rng.standard_normal(16000).astype(np.float32), 'sr': 16000}
+    spectrogram = compute_spectrogram(audio_data)
+    decoded = unpack(pack_spectrogram(spectrogram))
+    assert decoded.min() == 0.0 and decoded.max() == 1.0
+    assert spectrogram['freq'][-1] <= 8000
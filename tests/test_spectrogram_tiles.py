@@ -0,0 +1,92 @@
+import base64
+
+import numpy as np
+import pytest
+
+from audio_processor import max_pool
+from spectrogram_tiles import BASE_ROWS, MIN_ROWS, build_pyramid, open_pyramid
+
+TILE_WIDTH = 16
+
+def decode(tile):
+    return np.frombuffer(base64.b64decode(tile['data']), dtype=np.uint8).reshape(tile['shape'])
+
+@pytest.fixture
+def spectrogram():
+    rng = np.random.default_rng(0)
+    n_columns = 150
+    return {
+        'data': rng.random((300, n_columns)).astype(np.float32),
+        'time': 0.05 + 0.01 * np.arange(n_columns),
+        'freq': np.linspace(0, 8000, 300),
+        'min_value': -100.0,
+        'max_value': -10.0
+    }
+
+@pytest.fixture
+def pyramid(spectrogram, tmp_path):
+    directory = str(tmp_path / 'pyramid')
+    build_pyramid(spectrogram, directory, tile_width=TILE_WIDTH)
+    return open_pyramid(directory)
+
+def test_levels_halve_until_one_tile(pyramid, spectrogram):
+    levels = pyramid.manifest['levels']
+    rows = max_pool(spectrogram['data'], 0, BASE_ROWS)[0].shape[0]
+    assert rows <= BASE_ROWS
+    assert levels[0]['shape'] == [rows, spectrogram['data'].shape[1]]
+    for coarse, fine in zip(levels[1:], levels):
+        assert coarse['shape'][1] == -(-fine['shape'][1] // 2)
+        assert coarse['time_factor'] == 2 * fine['time_factor']
+        assert coarse['shape'][0] >= MIN_ROWS
+    assert levels[-1]['shape'][1] <= TILE_WIDTH
+    assert levels[-2]['shape'][1] > TILE_WIDTH
+
+def test_level_zero_is_the_quantized_spectrogram(pyramid, spectrogram):
+    expected, _ = max_pool(spectrogram['data'], 0, BASE_ROWS)
+    np.testing.assert_array_equal(pyramid.level_data(0), np.rint(expected * 255).astype(np.uint8))
+
+def test_tiles_reassemble_every_level(pyramid):
+    for info in pyramid.manifest['levels']:
+        level = info['level']
+        tiles = [pyramid.tile(level, index) for index in range(info['num_tiles'])]
+        assert all(tile['shape'][1] <= TILE_WIDTH for tile in tiles)
+        np.testing.assert_array_equal(np.hstack([decode(tile) for tile in tiles]), pyramid.level_data(level))
+
+def test_tile_time_ranges_match_column_centres(pyramid, spectrogram):
+    time = spectrogram['time']
+    tile = pyramid.tile(0, 2)
+    assert tile['time_range'] == pytest.approx([time[2 * TILE_WIDTH], time[3 * TILE_WIDTH - 1]])
+    # At level 1 every column covers two source columns
+    tile = pyramid.tile(1, 0)
+    assert tile['time_range'][0] == pytest.approx(time[:2].mean())
+    assert tile['time_range'][1] - tile['time_range'][0] == pytest.approx((tile['shape'][1] - 1) * 0.02)
+
+def test_visible_tiles_cover_the_requested_window(pyramid):
+    level = pyramid.level_for_width(0.3, 0.9, 64)
+    assert level == 0
+    first, last = pyramid.column_range(level, 0.3, 0.9)
+    tiles = pyramid.tiles(level, 0.3, 0.9)
+    covered = [tile['index'] * TILE_WIDTH for tile in tiles]
+    assert covered[0] <= first and covered[-1] + TILE_WIDTH >= last
+    # A window too wide for the width goes to a coarser level
+    assert pyramid.level_for_width(0.0, pyramid.duration, 64) > 0
+
+def test_out_of_range_tiles_are_rejected(pyramid):
+    with pytest.raises(IndexError):
+        pyramid.tile(0, pyramid.manifest['levels'][0]['num_tiles'])
+
+def test_rebuilding_serves_the_new_pyramid(pyramid, spectrogram, tmp_path):
+    other_directory = str(tmp_path / 'other')
+    build_pyramid(spectrogram, other_directory, tile_width=TILE_WIDTH)
+    other_tile = open_pyramid(other_directory).tile(0, 0)
+    old_tile = pyramid.tile(0, 0)
+
+    brighter = dict(spectrogram, data=np.sqrt(spectrogram['data']))
+    build_pyramid(brighter, pyramid.directory, tile_width=TILE_WIDTH)
+
+    rebuilt = open_pyramid(pyramid.directory)
+    assert rebuilt is not pyramid
+    assert (decode(rebuilt.tile(0, 0)) >= decode(old_tile)).all()
+    assert not np.array_equal(decode(rebuilt.tile(0, 0)), decode(old_tile))
+    # Other pyramids keep their cached tiles
+    assert open_pyramid(other_directory).tile(0, 0) is other_tile
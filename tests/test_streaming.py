@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from streaming import StreamingSession, StreamingSessions
+from test_model_artifacts import make_hmm
+
+CLICK_TIMES = np.array([0.3, 0.65, 0.9, 1.4, 1.7, 2.2, 2.5, 3.1])
+
+def click_train(sr):
+    """Faint noise with a decaying 3 kHz click at every CLICK_TIMES entry, as int16 PCM bytes"""
+    rng = np.random.default_rng(0)
+    y = 0.001 * rng.standard_normal(int(3.5 * sr))
+    t = np.arange(int(0.03 * sr)) / sr
+    click = 0.8 * np.exp(-150 * t) * np.sin(2 * np.pi * 3000 * t)
+    for onset in CLICK_TIMES:
+        start = int(onset * sr)
+        y[start:start + len(click)] += click
+    return (np.clip(y, -1, 1) * 32767).astype('<i2').tobytes()
+
+@pytest.fixture(scope='module')
+def hmm():
+    return make_hmm(np.random.default_rng(0))
+
+def stream(session, data, chunk_bytes):
+    """Feed data in chunks, then close; returns every result"""
+    results = [session.feed(data[start:start + chunk_bytes], sequence=i)
+               for i, start in enumerate(range(0, len(data), chunk_bytes))]
+    results.append(session.close())
+    return results
+
+@pytest.mark.parametrize('sample_rate', [16000, 44100])
+def test_keystrokes_are_detected_as_they_arrive(hmm, sample_rate):
+    data = click_train(sample_rate)
+    session = StreamingSession(hmm, sample_rate, lag=3)
+
+    results = stream(session, data, 2 * sample_rate // 10)
+
+    onsets = np.concatenate([result['onsets'] for result in results])
+    np.testing.assert_allclose(onsets, CLICK_TIMES, atol=0.01)
+    keystrokes = [k for result in results for k in result['keystrokes']]
+    assert len(keystrokes) == len(CLICK_TIMES)
+    # Text is committed incrementally, holding back at most the decision lag
+    text = ''.join(result['committed_text'] for result in results)
+    assert len(text) == len(CLICK_TIMES)
+    assert any(result['committed_text'] for result in results[:-1])
+    assert all(len(result['partial_text']) <= 3 for result in results)
+    assert results[-1]['partial_text'] == ''
+    assert results[-1]['position'] == pytest.approx(len(data) / 2 / sample_rate, abs=0.01)
+
+def test_results_do_not_depend_on_chunk_size(hmm):
+    data = click_train(16000)
+    reference = stream(StreamingSession(hmm, 16000), data, len(data))
+
+    for chunk_bytes in (320, 4002):
+        results = stream(StreamingSession(hmm, 16000), data, chunk_bytes)
+        for name in ('onsets', 'committed_text'):
+            joined = [value for result in results for value in result[name]]
+            expected = [value for result in reference for value in result[name]]
+            assert joined == expected
+
+def test_invalid_chunks_are_rejected(hmm):
+    session = StreamingSession(hmm, 16000)
+    with pytest.raises(ValueError):
+        session.feed(b'\x00' * 4, encoding='mp3')
+    with pytest.raises(ValueError):
+        session.feed(b'\x00' * 3)
+    session.feed(b'\x00' * 4, sequence=0)
+    with pytest.raises(ValueError):
+        session.feed(b'\x00' * 4, sequence=2)
+    assert session.feed(np.zeros(8, dtype='<f4').tobytes(), encoding='float32', sequence=1)['onsets'] == []
+
+def test_sessions_are_limited_and_expire(hmm):
+    sessions = StreamingSessions(timeout=60.0, max_sessions=2)
+    first = sessions.open(hmm, 16000)
+    second = sessions.open(hmm, 16000)
+    with pytest.raises(RuntimeError):
+        sessions.open(hmm, 16000)
+
+    assert sessions.get(first.id) is first
+    assert sessions.close(first.id)['committed_text'] == ''
+    assert sessions.get(first.id) is None
+    assert sessions.close(first.id) is None
+
+    second.last_active = time.time() - 61.0
+    assert sessions.get(second.id) is None
+    assert len(sessions) == 0
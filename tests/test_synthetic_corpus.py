@@ -0,0 +1,54 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from onset_detection import detect_onsets
+from synthetic_corpus import (KEYSTROKE_DURATION, LABELS_NAME, LEAD_IN, TypingRhythm, generate_corpus,
+                              make_rng, random_texts, render_text)
+
+TEXTS = ["hello world", "the quick brown fox", "ok!", "", "42 re-run", "typing password"]
+
+def read_corpus(directory):
+    with open(os.path.join(directory, LABELS_NAME)) as f:
+        labels = [json.loads(line) for line in f]
+    audio = [wavfile.read(os.path.join(directory, record['filename']))[1] for record in labels]
+    return labels, audio
+
+def test_same_seed_same_corpus_for_any_number_of_workers(tmp_path):
+    serial = generate_corpus(TEXTS, str(tmp_path / 'serial'), rate=16000, seed=7, workers=1, chunk_size=4)
+    pooled = generate_corpus(TEXTS, str(tmp_path / 'pooled'), rate=16000, seed=7, workers=2, chunk_size=1)
+
+    assert pooled == serial
+    serial_labels, serial_audio = read_corpus(tmp_path / 'serial')
+    pooled_labels, pooled_audio = read_corpus(tmp_path / 'pooled')
+    assert serial_labels == pooled_labels == serial
+    for a, b in zip(serial_audio, pooled_audio):
+        np.testing.assert_array_equal(a, b)
+    assert [record['filename'] for record in serial] == [f"{i:06d}.wav" for i in range(len(TEXTS))]
+    assert [record['text'] for record in serial] == [text.lower() for text in TEXTS]
+
+def test_different_seeds_give_different_recordings():
+    same = [render_text("hello world", rate=16000, seed=3)[0] for _ in range(2)]
+    other, _ = render_text("hello world", rate=16000, seed=4)
+    np.testing.assert_array_equal(same[0], same[1])
+    assert len(other) != len(same[0]) or not np.array_equal(other, same[0])
+    assert random_texts(5, seed=1) == random_texts(5, seed=1) != random_texts(5, seed=2)
+    assert make_rng(0, 1).random() == make_rng(0, 1).random() != make_rng(0, 2).random()
+
+def test_keystroke_timing_matches_the_audio():
+    rate = 16000
+    y, timing = render_text("Keyboard, ok?", rate=rate, seed=0, noise_level=0.001)
+
+    assert ''.join(k['key'] for k in timing) == "keyboard, ok?"
+    starts = np.array([k['start_time'] for k in timing])
+    assert starts[0] == pytest.approx(LEAD_IN)
+    assert (np.diff(starts) >= TypingRhythm().min_interval - 1e-9).all()
+    assert all(k['end_time'] - k['start_time'] == pytest.approx(KEYSTROKE_DURATION) for k in timing)
+    np.testing.assert_allclose(detect_onsets(y, rate) / rate, starts, atol=0.01)
+
+def test_rhythm_rejects_overlapping_keystrokes():
+    with pytest.raises(ValueError):
+        TypingRhythm(min_interval=KEYSTROKE_DURATION)